@@ -0,0 +1,267 @@
+"""
+Incremental columnar export of predictions for offline analysis.
+
+Usage:
+    python -m app.analytics [--chunk-size N]
+
+New predictions (``id`` above the stored high-water mark) are read in id
+order straight from the database as plain columns and appended to a
+Parquet dataset under ANALYTICS_DIR, partitioned by month:
+
+    ANALYTICS_DIR/month=2025-06/part-000000000001-000000005000.parquet
+
+The ten clinical features are flattened into typed ``clinical_*`` float
+columns so analysts and retraining jobs never parse the JSON blob. File
+names are derived from the id range they hold, so re-running a chunk after
+a crash overwrites its files instead of duplicating rows, and the
+high-water mark only advances once a chunk's files are in place.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session
+from .config import ANALYTICS_DIR, ANALYTICS_CHUNK_SIZE
+from .database import SessionLocal, Base, engine, migrate_schema
+from .features import FEATURE_NAMES
+from .models import Prediction
+from .write_behind import export_limit
+from app.logger import get_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed by the exporter and the analytics endpoint
+    pa = None
+
+logger = get_logger(__name__)
+
+STATE_FILE = "_state.json"
+
+# Dimensions the summary query can group by
+GROUP_BY_COLUMNS = ("month", "city", "pipeline_mode", "language", "clinical_model_version", "image_model_version")
+
+_SOURCE_COLUMNS = (
+    Prediction.id, Prediction.user_id, Prediction.created_at, Prediction.latitude, Prediction.longitude,
+    Prediction.city, Prediction.temperature, Prediction.language, Prediction.pipeline_mode,
+    Prediction.clinical_features, Prediction.clinical_model_result, Prediction.image_model_result,
+    Prediction.clinical_score, Prediction.image_score, Prediction.combined_score,
+    Prediction.clinical_model_version, Prediction.image_model_version,
+)
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the analytics export; install it with pip install pyarrow")
+
+
+def export_schema() -> "pa.Schema":
+    _require_pyarrow()
+    fields = [
+        ("id", pa.int64()), ("user_id", pa.int64()), ("created_at", pa.timestamp("us")),
+        ("latitude", pa.float64()), ("longitude", pa.float64()), ("city", pa.string()),
+        ("temperature", pa.float64()), ("language", pa.string()), ("pipeline_mode", pa.string()),
+    ]
+    fields += [(f"clinical_{name}", pa.float64()) for name in FEATURE_NAMES]
+    fields += [
+        ("clinical_model_result", pa.bool_()), ("image_model_result", pa.bool_()),
+        ("clinical_score", pa.float64()), ("image_score", pa.float64()), ("combined_score", pa.float64()),
+        ("clinical_model_version", pa.string()), ("image_model_version", pa.string()),
+    ]
+    return pa.schema(fields)
+
+
+def _as_float(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def load_state(directory: str = ANALYTICS_DIR) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"last_id": 0, "rows": 0}
+
+
+def save_state(state: Dict[str, Any], directory: str = ANALYTICS_DIR):
+    path = os.path.join(directory, STATE_FILE)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def _rows_to_columns(rows: List[Any]) -> Dict[str, List[Any]]:
+    """Transpose one chunk of result rows into per-column lists, flattening the features."""
+    columns = defaultdict(list)
+    for row in rows:
+        features = row.clinical_features
+        if isinstance(features, str):
+            features = json.loads(features)
+        features = features if isinstance(features, dict) else {}
+        created_at = row.created_at
+        if created_at is not None and created_at.tzinfo is not None:
+            created_at = created_at.replace(tzinfo=None)
+        columns["id"].append(row.id)
+        columns["user_id"].append(row.user_id)
+        columns["created_at"].append(created_at)
+        for name in ("latitude", "longitude", "temperature", "clinical_score", "image_score", "combined_score"):
+            columns[name].append(getattr(row, name))
+        for name in ("city", "language", "pipeline_mode", "clinical_model_version", "image_model_version",
+                     "clinical_model_result", "image_model_result"):
+            columns[name].append(getattr(row, name))
+        for name in FEATURE_NAMES:
+            columns[f"clinical_{name}"].append(_as_float(features.get(name)))
+    return columns
+
+
+def export_predictions(
+    db: Session,
+    directory: str = ANALYTICS_DIR,
+    chunk_size: int = ANALYTICS_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """
+    Append predictions above the high-water mark to the Parquet dataset.
+
+    Args:
+        db: Database session used for reading only
+        directory: Dataset root
+        chunk_size: Rows read and written per step
+
+    Returns:
+        Dict[str, Any]: The updated export state (high-water mark and totals)
+    """
+    _require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    schema = export_schema()
+    state = load_state(directory)
+    exported = 0
+    # Rows from an open write-behind id block may still be queued below ids already stored,
+    # so the high-water mark never passes the lowest open block
+    limit = export_limit(db)
+    if limit is not None:
+        logger.info("Exporting predictions below id %s; later ones wait for write-behind", limit)
+
+    while True:
+        query = db.query(*_SOURCE_COLUMNS).filter(Prediction.id > state["last_id"])
+        if limit is not None:
+            query = query.filter(Prediction.id < limit)
+        # Each chunk is bounded by chunk_size, so it is fetched in one go
+        rows = query.order_by(Prediction.id).limit(chunk_size).all()
+        if not rows:
+            break
+
+        table = pa.Table.from_pydict(_rows_to_columns(rows), schema=schema)
+        months = pc.strftime(table["created_at"], format="%Y-%m")
+        first_id, last_id = rows[0].id, rows[-1].id
+        for month in pc.unique(months).to_pylist():
+            partition = table.filter(pc.equal(months, month)) if month is not None else table.filter(pc.is_null(months))
+            partition_dir = os.path.join(directory, f"month={month or 'unknown'}")
+            os.makedirs(partition_dir, exist_ok=True)
+            name = f"part-{first_id:012d}-{last_id:012d}.parquet"
+            # The dot prefix keeps readers from picking up a half-written file
+            temp_path = os.path.join(partition_dir, f".{name}.tmp")
+            pq.write_table(partition, temp_path, compression="zstd")
+            os.replace(temp_path, os.path.join(partition_dir, name))
+
+        exported += len(rows)
+        state = {
+            "last_id": last_id,
+            "rows": state.get("rows", 0) + len(rows),
+            "updated_at": datetime.datetime.utcnow().isoformat(),
+        }
+        save_state(state, directory)
+        logger.info("Exported predictions through id %s (%s rows this run)", last_id, exported)
+
+    return {**state, "exported": exported}
+
+
+def summarize(
+    group_by: str = "month",
+    since: Optional[datetime.date] = None,
+    until: Optional[datetime.date] = None,
+    city: Optional[str] = None,
+    directory: str = ANALYTICS_DIR,
+) -> List[Dict[str, Any]]:
+    """
+    Aggregate the exported predictions without touching the live database.
+
+    Args:
+        group_by: One of GROUP_BY_COLUMNS
+        since: Only predictions created on or after this date
+        until: Only predictions created before this date
+        city: Only predictions from this city
+        directory: Dataset root
+
+    Returns:
+        List[Dict[str, Any]]: Per-group prediction counts, affected counts and mean risk
+    """
+    _require_pyarrow()
+    if group_by not in GROUP_BY_COLUMNS:
+        raise ValueError(f"group_by must be one of {GROUP_BY_COLUMNS}")
+    if not os.path.isdir(directory):
+        return []
+
+    dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+    condition = None
+    for clause in (
+        ds.field("created_at") >= pa.scalar(datetime.datetime.combine(since, datetime.time()), pa.timestamp("us")) if since else None,
+        ds.field("created_at") < pa.scalar(datetime.datetime.combine(until, datetime.time()), pa.timestamp("us")) if until else None,
+        ds.field("city") == city if city else None,
+    ):
+        if clause is not None:
+            condition = clause if condition is None else condition & clause
+
+    columns = ["id", "clinical_model_result", "image_model_result", "combined_score"]
+    if group_by != "month":
+        columns.append(group_by)
+    table = dataset.to_table(columns=columns + (["month"] if group_by == "month" else []), filter=condition)
+    if table.num_rows == 0:
+        return []
+
+    affected = pc.or_(
+        pc.fill_null(table["clinical_model_result"], False), pc.fill_null(table["image_model_result"], False)
+    )
+    table = table.append_column("affected", pc.cast(affected, pa.int64()))
+    grouped = table.group_by(group_by).aggregate([
+        ("id", "count"), ("affected", "sum"), ("combined_score", "mean"),
+    ])
+    results = [
+        {
+            group_by: row[group_by],
+            "predictions": row["id_count"],
+            "affected": row["affected_sum"],
+            "mean_combined_score": row["combined_score_mean"],
+        }
+        for row in grouped.to_pylist()
+    ]
+    return sorted(results, key=lambda row: (row[group_by] is None, str(row[group_by])))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Append new predictions to the Parquet analytics dataset.")
+    parser.add_argument("--chunk-size", type=int, default=ANALYTICS_CHUNK_SIZE, help="rows per Parquet file")
+    parser.add_argument("--output", default=ANALYTICS_DIR, help="dataset root directory")
+    args = parser.parse_args(argv)
+    Base.metadata.create_all(bind=engine)
+    migrate_schema()
+
+    db = SessionLocal()
+    try:
+        state = export_predictions(db, args.output, args.chunk_size)
+    finally:
+        db.close()
+    print(json.dumps(state, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
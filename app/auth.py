@@ -6,15 +6,18 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional, Union
 from pydantic import BaseModel, EmailStr
-from .config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from .config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, ADMIN_USERNAMES
 from .database import get_db
 from .models import User
-from app.logger import logger
+from app.logger import get_logger
+from .metrics import time_stage
 
 # Configure password hashing and OAuth2
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
+logger = get_logger(__name__)
+
 class Token(BaseModel):
     """Token response model for authentication."""
     access_token: str
@@ -51,7 +54,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         bool: True if password matches, False otherwise
     """
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        with time_stage("password_verify"):
+            return pwd_context.verify(plain_password, hashed_password)
     except Exception as e:
         logger.error("Password verification failed", exc_info=True)
         return False
@@ -70,7 +74,8 @@ def get_password_hash(password: str) -> str:
         HTTPException: If hashing fails
     """
     try:
-        return pwd_context.hash(password)
+        with time_stage("password_hash"):
+            return pwd_context.hash(password)
     except Exception as e:
         logger.error("Password hashing failed", exc_info=True)
         raise HTTPException(
@@ -116,7 +121,7 @@ def create_user(db: Session, user: UserCreate) -> User:
         HTTPException: If user creation fails
     """
     try:
-        logger.info(f"Creating new user: {user.username}")
+        logger.info("Creating new user: %s", user.username)
         
         # Check if username already exists
         if db.query(User).filter(User.username == user.username).first():
@@ -141,7 +146,7 @@ def create_user(db: Session, user: UserCreate) -> User:
         db.commit()
         db.refresh(db_user)
         
-        logger.info(f"User created successfully: {user.username}")
+        logger.info("User created successfully: %s", user.username)
         return db_user
         
     except HTTPException:
@@ -170,14 +175,14 @@ def authenticate_user(db: Session, username: str, password: str) -> Union[User,
     try:
         user = get_user(db, username)
         if not user:
-            logger.warning(f"Authentication failed: User not found - {username}")
+            logger.warning("Authentication failed: User not found - %s", username)
             return False
             
         if not verify_password(password, user.hashed_password):
-            logger.warning(f"Authentication failed: Invalid password - {username}")
+            logger.warning("Authentication failed: Invalid password - %s", username)
             return False
             
-        logger.info(f"User authenticated successfully: {username}")
+        logger.info("User authenticated successfully: %s", username)
         return user
         
     except Exception as e:
@@ -204,7 +209,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         to_encode.update({"exp": expire})
         token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
         
-        logger.info(f"Access token created for user: {data.get('sub')}")
+        logger.info("Access token created for user: %s", data.get('sub'))
         return token
         
     except Exception as e:
@@ -238,7 +243,8 @@ def get_current_user(
     )
     
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with time_stage("token_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if not username:
             logger.warning("Token payload missing username")
@@ -250,17 +256,43 @@ def get_current_user(
         logger.error("Token validation failed", exc_info=True)
         raise credentials_exception
     
-    user = get_user(db, username=token_data.username)
+    with time_stage("user_lookup"):
+        user = get_user(db, username=token_data.username)
     if not user:
-        logger.warning(f"User not found: {token_data.username}")
+        logger.warning("User not found: %s", token_data.username)
         raise credentials_exception
     
     if not user.is_active:
-        logger.warning(f"Inactive user attempted access: {user.username}")
+        logger.warning("Inactive user attempted access: %s", user.username)
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="User account is inactive"
         )
         
-    logger.info(f"Current user validated: {user.username}")
-    return user 
\ No newline at end of file
+    logger.debug("Current user validated: %s", user.username)
+    return user
+
+def is_admin(user: User) -> bool:
+    """Whether the user is listed in ADMIN_USERNAMES"""
+    return user.username in ADMIN_USERNAMES
+
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Restrict a route to users listed in ADMIN_USERNAMES.
+    
+    Args:
+        current_user: The authenticated user
+    
+    Returns:
+        User: The authenticated admin user
+    
+    Raises:
+        HTTPException: If the user is not an administrator
+    """
+    if not is_admin(current_user):
+        logger.warning("Non-admin user attempted admin access: %s", current_user.username)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Administrator access required"
+        )
+    return current_user
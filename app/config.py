@@ -6,15 +6,150 @@ load_dotenv()
 BASE_DIR = os.path.abspath(os.path.join(os.getcwd(), '.'))
 print(BASE_DIR)
 
-MODELS_DIR = os.path.join(BASE_DIR, 'final_models')
+MODELS_DIR = os.getenv('MODELS_DIR', os.path.join(BASE_DIR, 'final_models'))
 print(MODELS_DIR)
 
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./lsd_prediction.db')
+
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
 GEMINI_MODEL_NAME = "gemini-2.0-flash"
 
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY") 
 
+# Upstream endpoints; override to point the app at local fakes (see benchmarks/fakes.py)
+WEATHER_API_BASE_URL = os.getenv("WEATHER_API_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")  # e.g. http://127.0.0.1:8082, served over REST
+
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+# Logging: global level, per-module overrides ("prediction=DEBUG,auth=WARNING") and output format (json|text)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(BASE_DIR, "logs"))
+
+# Comma separated usernames allowed to use the admin endpoints
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# Request profiling: sample a fraction of requests and/or keep profiles of requests slower than the
+# threshold. Slow-request capture only samples PROFILE_SLOW_SAMPLE_RATE of requests, since a
+# request's duration is only known once it has finished
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_SLOW_SAMPLE_RATE = float(os.getenv("PROFILE_SLOW_SAMPLE_RATE", "0.05"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+
+# External call resilience: per-dependency timeouts and retries, shared backoff and circuit breaker settings
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "1"))
+# Whole budget for one LLM report, retries included; past it the templated report is stored.
+# Reports run outside the prediction admission slots, so their concurrency is capped separately
+LLM_REPORT_DEADLINE_SECONDS = float(os.getenv("LLM_REPORT_DEADLINE_SECONDS", "10"))
+LLM_MAX_CONCURRENT_REPORTS = int(os.getenv("LLM_MAX_CONCURRENT_REPORTS", "8"))
+WEATHER_TIMEOUT_SECONDS = float(os.getenv("WEATHER_TIMEOUT_SECONDS", "5"))
+WEATHER_MAX_RETRIES = int(os.getenv("WEATHER_MAX_RETRIES", "2"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Number of prediction summaries shown per dashboard page
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "25"))
+
+# Server-side climate features: grid cell size in degrees and number of cached cell-days
+FEATURE_GRID_DEGREES = float(os.getenv("FEATURE_GRID_DEGREES", "0.1"))
+FEATURE_CACHE_SIZE = int(os.getenv("FEATURE_CACHE_SIZE", "4096"))
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1000"))
+
+# Rate limits as "<requests>/<second|minute|hour>"; the request count is also the burst size
+RATE_LIMIT_PREDICT_USER = os.getenv("RATE_LIMIT_PREDICT_USER", "10/minute")
+RATE_LIMIT_PREDICT_IP = os.getenv("RATE_LIMIT_PREDICT_IP", "30/minute")
+RATE_LIMIT_PREDICT_GLOBAL = os.getenv("RATE_LIMIT_PREDICT_GLOBAL", "600/minute")
+RATE_LIMIT_LOGIN = os.getenv("RATE_LIMIT_LOGIN", "10/minute")
+RATE_LIMIT_SIGNUP = os.getenv("RATE_LIMIT_SIGNUP", "5/hour")
+# Shared backend for multi-node deployments (e.g. redis://localhost:6379/0); in-memory when unset
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# Use the first X-Forwarded-For address as the client IP (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+# Admission control for /api/predict: concurrent predictions per worker, queued waiters and max queue wait
+PREDICT_MAX_CONCURRENCY = int(os.getenv("PREDICT_MAX_CONCURRENCY", "4"))
+PREDICT_MAX_QUEUE = int(os.getenv("PREDICT_MAX_QUEUE", "8"))
+PREDICT_QUEUE_TIMEOUT = float(os.getenv("PREDICT_QUEUE_TIMEOUT", "5"))
+
+# Duplicate prediction submissions: identical requests within the window, or repeated
+# Idempotency-Key headers within the key TTL, return the stored prediction
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "600"))
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+
+# Offline re-scoring of stored predictions (python -m app.rescore)
+RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "5000"))
+RESCORE_CHECKPOINT = os.getenv("RESCORE_CHECKPOINT", os.path.join(BASE_DIR, "rescore_checkpoint.json"))
+
+# Model registry: final_models/ holds either the artifacts themselves or one subdirectory
+# per version. MODEL_VERSION pins a version; otherwise final_models/CURRENT selects it and
+# workers poll that file every MODEL_WATCH_SECONDS (0 disables) to follow promotions
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+MODEL_WATCH_SECONDS = float(os.getenv("MODEL_WATCH_SECONDS", "30"))
+
+# Ensemble risk score: "weighted" averages the calibrated clinical and image probabilities,
+# "logistic" stacks them as sigmoid(w_c * logit(p_c) + w_i * logit(p_i) + bias)
+ENSEMBLE_METHOD = os.getenv("ENSEMBLE_METHOD", "weighted")
+ENSEMBLE_WEIGHTS = os.getenv("ENSEMBLE_WEIGHTS", "0.5,0.5")  # clinical, image
+ENSEMBLE_BIAS = float(os.getenv("ENSEMBLE_BIAS", "0"))
+# Platt scaling "a,b" per model, p' = sigmoid(a * logit(p) + b); "1,0" leaves scores unchanged
+CLINICAL_PLATT = os.getenv("CLINICAL_PLATT", "1,0")
+IMAGE_PLATT = os.getenv("IMAGE_PLATT", "1,0")
+
+# Early exit: "screening" requests skip the CNN once the clinical probability is at least this
+# confident either way (1 disables); "full" requests whose combined risk is below
+# LLM_SKIP_BELOW_RISK get the templated summary instead of a Gemini report (0 disables)
+SCREEN_SKIP_IMAGE_CONFIDENCE = float(os.getenv("SCREEN_SKIP_IMAGE_CONFIDENCE", "0.95"))
+LLM_SKIP_BELOW_RISK = float(os.getenv("LLM_SKIP_BELOW_RISK", "0"))
+
+# Image embedding index for near-duplicate uploads and similar-case lookup
+EMBEDDING_INDEX_DIR = os.getenv("EMBEDDING_INDEX_DIR", os.path.join(BASE_DIR, "embedding_index"))
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_SIMILARITY", "0.98"))
+SIMILAR_CASES_MAX = int(os.getenv("SIMILAR_CASES_MAX", "20"))
+
+# Columnar analytics export (python -m app.analytics)
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", os.path.join(BASE_DIR, "analytics"))
+ANALYTICS_CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", "50000"))
+
+# Inference threading per worker process. WEB_CONCURRENCY is the number of uvicorn workers
+# on the node; INFERENCE_THREADS (TensorFlow intra-op) and BLAS_THREADS default to the
+# worker's share of the CPUs when 0. CPU_AFFINITY pins workers: "" (off), "auto" (a disjoint
+# block of cores per worker) or an explicit list such as "0-3,8"
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "1"))
+BLAS_THREADS = int(os.getenv("BLAS_THREADS", "0"))
+RF_N_JOBS = int(os.getenv("RF_N_JOBS", "1"))  # single-row forest predictions gain nothing from joblib workers
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "")
+
+# Write-behind persistence: a finished prediction is appended to a local journal, returned,
+# and written to the database in batches by a background writer; journals left by a crashed
+# worker are replayed when the next worker starts. Pending predictions are only visible to
+# the worker holding them until written. Off by default; every worker must use the same
+# setting, since write-behind workers take prediction ids from blocks reserved in id_blocks
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "false").lower() == "true"
+WRITE_BEHIND_DIR = os.getenv("WRITE_BEHIND_DIR", os.path.join(BASE_DIR, "write_behind"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.05"))  # longest wait to fill a batch
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))  # beyond this, writes happen inline
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "true").lower() == "true"  # false survives process crashes only
+WRITE_BEHIND_SEGMENT_ENTRIES = int(os.getenv("WRITE_BEHIND_SEGMENT_ENTRIES", "1000"))
+# Ids reserved per block, and how long a block stays open; the analytics export only reads
+# past a block once it is closed. Open blocks older than ID_BLOCK_STALE_SECONDS are treated
+# as abandoned by a worker that never came back
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", "100"))
+ID_BLOCK_MAX_AGE_SECONDS = float(os.getenv("ID_BLOCK_MAX_AGE_SECONDS", "60"))
+ID_BLOCK_STALE_SECONDS = float(os.getenv("ID_BLOCK_STALE_SECONDS", "3600"))
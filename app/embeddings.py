@@ -0,0 +1,436 @@
+"""
+Persistent nearest-neighbour index over CNN image embeddings.
+
+Each image model version gets its own directory under EMBEDDING_INDEX_DIR,
+since embeddings from different weights are not comparable. A directory
+holds three memory-mapped arrays that grow by doubling:
+
+- ``vectors.f16``: float16 L2-normalized embeddings, one row per prediction
+- ``ids.i64`` / ``users.i64``: the prediction and user id of each row
+
+plus ``meta.json`` with the row count. Rows are written before the count
+is advanced, so a crash never exposes a half-written row. Appends take an
+exclusive file lock so several worker processes can share an index; the
+write-behind writer appends each committed batch in one go.
+
+Uploaded images are never stored, so only predictions made after the
+index was introduced are embedded.
+"""
+import fcntl
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session, load_only
+from .config import EMBEDDING_INDEX_DIR, NEAR_DUPLICATE_SIMILARITY
+from .features import feature_vector
+from .metrics import record_cache
+from .models import Prediction
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Rows scored per block during search, bounding the float32 working set
+SEARCH_BLOCK_ROWS = 65536
+
+INITIAL_CAPACITY = 1024
+
+
+class EmbeddingIndex:
+    """Append-only float16 embedding index backed by memory-mapped files."""
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._meta_mtime = None
+        self.count = 0
+        self.capacity = 0
+        self._vectors = self._ids = self._users = None
+        self._rows: Dict[int, int] = {}  # prediction id -> row
+        self._mapped = 0
+        self._refresh(force=True)
+
+    def _read_meta(self) -> Tuple[int, int]:
+        try:
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return 0, 0
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Index at {self.directory} holds {meta['dim']}-d vectors, not {self.dim}-d")
+        return meta["count"], meta["capacity"]
+
+    def _write_meta(self):
+        temp_path = f"{self._meta_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity}, f)
+        os.replace(temp_path, self._meta_path)
+
+    def _open_arrays(self, capacity: int):
+        def open_array(name, dtype, shape):
+            path = os.path.join(self.directory, name)
+            mode = "r+" if os.path.exists(path) else "w+"
+            return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+        self._vectors = open_array("vectors.f16", np.float16, (capacity, self.dim))
+        self._ids = open_array("ids.i64", np.int64, (capacity,))
+        self._users = open_array("users.i64", np.int64, (capacity,))
+        self.capacity = capacity
+
+    def _refresh(self, force: bool = False):
+        """Pick up rows appended by other processes since the last look."""
+        try:
+            mtime = os.stat(self._meta_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if not force and mtime == self._meta_mtime:
+            return
+        count, capacity = self._read_meta()
+        if capacity and capacity != self.capacity:
+            self._open_arrays(capacity)
+        self.count = count
+        self._meta_mtime = mtime
+        self._map_rows()
+
+    def _map_rows(self):
+        """Add rows appended since the last look to the id -> row map."""
+        if self.count > self._mapped:
+            self._rows.update(zip(self._ids[self._mapped:self.count].tolist(), range(self._mapped, self.count)))
+            self._mapped = self.count
+
+    def _grow(self, capacity: int):
+        for name, dtype, width in (("vectors.f16", np.float16, self.dim), ("ids.i64", np.int64, 1), ("users.i64", np.int64, 1)):
+            path = os.path.join(self.directory, name)
+            # Extending the file zero-fills the new rows; existing rows keep their offsets
+            with open(path, "ab") as f:
+                f.truncate(capacity * width * np.dtype(dtype).itemsize)
+        self._open_arrays(capacity)
+
+    def add(self, prediction_id: int, user_id: int, vector: np.ndarray):
+        """Append one embedding for a stored prediction."""
+        self.add_many([(prediction_id, user_id, vector)])
+
+    def add_many(self, items: List[Tuple[int, int, np.ndarray]]) -> int:
+        """
+        Append embeddings of stored predictions under one lock and one flush.
+
+        Predictions that are already indexed (e.g. replayed from a journal) are skipped.
+
+        Args:
+            items: (prediction id, user id, L2-normalized embedding) per prediction
+
+        Returns:
+            int: Number of rows appended
+        """
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh(force=True)
+                fresh = {}
+                for prediction_id, user_id, vector in items:
+                    if prediction_id not in self._rows:
+                        fresh[prediction_id] = (user_id, vector)
+                if not fresh:
+                    return 0
+                needed = self.count + len(fresh)
+                if needed > self.capacity:
+                    capacity = max(INITIAL_CAPACITY, self.capacity)
+                    while capacity < needed:
+                        capacity *= 2
+                    self._grow(capacity)
+                rows = slice(self.count, needed)
+                self._vectors[rows] = np.stack([vector for _, vector in fresh.values()]).astype(np.float16)
+                self._ids[rows] = list(fresh)
+                self._users[rows] = [user_id for user_id, _ in fresh.values()]
+                for array in (self._vectors, self._ids, self._users):
+                    array.flush()
+                self.count = needed
+                self._write_meta()
+                self._meta_mtime = os.stat(self._meta_path).st_mtime_ns
+                self._map_rows()
+                return len(fresh)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def vector_for(self, prediction_id: int) -> Optional[np.ndarray]:
+        """Stored embedding of a prediction, if it was indexed."""
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(prediction_id)
+            if row is None:
+                return None
+            return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int = 5,
+        user_id: Optional[int] = None,
+        exclude_id: Optional[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Most similar indexed predictions by cosine similarity.
+
+        Args:
+            vector: L2-normalized query embedding
+            k: Number of neighbours to return
+            user_id: Only consider this user's predictions
+            exclude_id: Prediction id to leave out (usually the query itself)
+
+        Returns:
+            List[Tuple[int, float]]: (prediction id, similarity), most similar first
+        """
+        with self._lock:
+            self._refresh()
+            count = self.count
+            vectors, ids, users = self._vectors, self._ids, self._users
+        if not count or k <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, count)
+            scores = np.asarray(vectors[start:stop], dtype=np.float32) @ query
+            block_ids = np.asarray(ids[start:stop])
+            mask = np.ones(stop - start, dtype=bool)
+            if user_id is not None:
+                mask &= np.asarray(users[start:stop]) == user_id
+            if exclude_id is not None:
+                mask &= block_ids != exclude_id
+            scores, block_ids = scores[mask], block_ids[mask]
+            # Keep only the running top k so memory stays bounded by the block size
+            best_ids = np.concatenate([best_ids, block_ids])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                top = np.argpartition(-best_scores, k - 1)[:k]
+                best_ids, best_scores = best_ids[top], best_scores[top]
+
+        order = np.argsort(-best_scores)
+        return [(int(best_ids[i]), float(best_scores[i])) for i in order]
+
+
+_indexes: Dict[str, EmbeddingIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(model_version: str, dim: int) -> EmbeddingIndex:
+    """The embedding index for an image model version, opened once per process."""
+    with _indexes_lock:
+        index = _indexes.get(model_version)
+        if index is None:
+            index = EmbeddingIndex(os.path.join(EMBEDDING_INDEX_DIR, model_version), dim)
+            _indexes[model_version] = index
+        return index
+
+
+def find_index(model_version: str) -> Optional[EmbeddingIndex]:
+    """The index for a model version if one has been created, without creating it."""
+    with _indexes_lock:
+        index = _indexes.get(model_version)
+    if index is not None:
+        return index
+    meta_path = os.path.join(EMBEDDING_INDEX_DIR, model_version, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        dim = json.load(f)["dim"]
+    return get_index(model_version, dim)
+
+
+# Neighbours examined when looking for a near-duplicate of a new upload
+NEAR_DUPLICATE_CANDIDATES = 5
+
+
+def index_embeddings(items: List[Tuple[str, int, int, np.ndarray]]):
+    """
+    Add embeddings of stored predictions to their image models' indexes; failures only log.
+
+    Args:
+        items: (image model version, prediction id, user id, embedding) per prediction
+    """
+    by_version: Dict[str, List[Tuple[int, int, np.ndarray]]] = {}
+    for model_version, prediction_id, user_id, embedding in items:
+        by_version.setdefault(model_version, []).append((prediction_id, user_id, embedding))
+    for model_version, rows in by_version.items():
+        try:
+            get_index(model_version, rows[0][2].shape[0]).add_many(rows)
+        except Exception:
+            logger.warning(
+                "Could not index embeddings for predictions %s", [row[0] for row in rows], exc_info=True
+            )
+
+
+def index_prediction(prediction: Prediction, embedding: np.ndarray):
+    """Add a stored prediction's embedding to its image model's index; failures only log."""
+    index_embeddings([(prediction.image_model_version, prediction.id, prediction.user_id, embedding)])
+
+
+def _search_pending(
+    pending: Dict[int, Prediction],
+    pending_embeddings: Dict[int, np.ndarray],
+    vector: np.ndarray,
+    model_version: str,
+    user_id: Optional[int],
+    exclude_id: int,
+) -> List[Tuple[int, float]]:
+    """Similarity of the query to submitted predictions not yet written and indexed."""
+    return [
+        (prediction_id, float(np.dot(embedding, vector)))
+        for prediction_id, embedding in pending_embeddings.items()
+        if prediction_id != exclude_id and prediction_id in pending
+        and pending[prediction_id].image_model_version == model_version
+        and (user_id is None or pending[prediction_id].user_id == user_id)
+    ]
+
+
+def _same_features(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    try:
+        return np.allclose(
+            np.asarray(feature_vector(a), dtype=np.float64),
+            np.asarray(feature_vector(b), dtype=np.float64),
+            rtol=1e-3, equal_nan=True
+        )
+    except (TypeError, ValueError):
+        return False
+
+
+def find_near_duplicate(
+    db: Session,
+    user_id: int,
+    embedding: np.ndarray,
+    model_version: str,
+    clinical_data: Dict[str, Any],
+    language: str,
+    city: Optional[str],
+    clinical_affected: Optional[bool],
+    image_affected: Optional[bool],
+) -> Optional[Prediction]:
+    """
+    An earlier prediction by the same user whose report can be reused.
+
+    A candidate must be a near-identical photo (cosine similarity of at
+    least NEAR_DUPLICATE_SIMILARITY) with the same verdicts, clinical
+    inputs, location and language, since all of these appear in the report.
+
+    Returns:
+        Optional[Prediction]: The matching prediction with its report columns loaded
+    """
+    index = find_index(model_version)
+    match = None
+    if index is not None:
+        for prediction_id, similarity in index.search(embedding, NEAR_DUPLICATE_CANDIDATES, user_id=user_id):
+            if similarity < NEAR_DUPLICATE_SIMILARITY:
+                break
+            candidate = (
+                db.query(Prediction)
+                .options(load_only(
+                    Prediction.id, Prediction.clinical_features, Prediction.language, Prediction.city,
+                    Prediction.clinical_model_result, Prediction.image_model_result,
+                    Prediction.report, Prediction.report_html
+                ))
+                .filter(Prediction.id == prediction_id, Prediction.user_id == user_id)
+                .first()
+            )
+            if (
+                candidate is not None and candidate.report
+                and candidate.language == language and candidate.city == city
+                and candidate.clinical_model_result == clinical_affected
+                and candidate.image_model_result == image_affected
+                and _same_features(candidate.clinical_features or {}, clinical_data)
+            ):
+                logger.info("Upload is a near-duplicate of prediction %s (similarity %.4f)", prediction_id, similarity)
+                match = candidate
+                break
+    record_cache("near_duplicate", match is not None)
+    return match
+
+
+def find_similar_cases(
+    db: Session,
+    prediction_id: int,
+    user_id: int,
+    k: int,
+    all_users: bool = False,
+    pending: Optional[Dict[int, Prediction]] = None,
+    pending_embeddings: Optional[Dict[int, np.ndarray]] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Past predictions whose photos look most like the given prediction's.
+
+    Args:
+        db: Database session
+        prediction_id: Prediction to find neighbours for; must belong to the user unless all_users
+        user_id: Requesting user
+        k: Number of cases to return
+        all_users: Search every user's predictions (administrators)
+        pending: Submitted predictions not yet in the database, by id; taken
+            before this call so a prediction written meanwhile is still found
+        pending_embeddings: Embeddings of those predictions, which are indexed
+            only once written
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: Cases with their similarity, most similar first;
+        None if the prediction does not exist or was not indexed
+    """
+    query = db.query(Prediction).options(load_only(Prediction.id, Prediction.image_model_version))
+    query = query.filter(Prediction.id == prediction_id)
+    if not all_users:
+        query = query.filter(Prediction.user_id == user_id)
+    pending = pending or {}
+    pending_embeddings = pending_embeddings or {}
+    prediction = query.first()
+    if prediction is None:
+        prediction = pending.get(prediction_id)
+        if prediction is not None and not all_users and prediction.user_id != user_id:
+            prediction = None
+    if prediction is None or not prediction.image_model_version:
+        return None
+    index = find_index(prediction.image_model_version)
+    vector = index.vector_for(prediction_id) if index is not None else None
+    if vector is None:
+        vector = pending_embeddings.get(prediction_id)
+    if vector is None:
+        return None
+
+    scope = None if all_users else user_id
+    neighbours = index.search(vector, k, user_id=scope, exclude_id=prediction_id) if index is not None else []
+    indexed = {neighbour_id for neighbour_id, _ in neighbours}
+    neighbours += [
+        neighbour for neighbour in _search_pending(
+            pending, pending_embeddings, vector, prediction.image_model_version, scope, prediction_id
+        )
+        if neighbour[0] not in indexed
+    ]
+    neighbours = sorted(neighbours, key=lambda neighbour: -neighbour[1])[:k]
+    if not neighbours:
+        return []
+    rows = {
+        row.id: row for row in db.query(Prediction)
+        .options(load_only(
+            Prediction.id, Prediction.created_at, Prediction.city, Prediction.image_model_result,
+            Prediction.clinical_model_result, Prediction.combined_score
+        ))
+        .filter(Prediction.id.in_([neighbour_id for neighbour_id, _ in neighbours]))
+    }
+    for neighbour_id, _ in neighbours:
+        if neighbour_id not in rows and neighbour_id in pending:
+            rows[neighbour_id] = pending[neighbour_id]
+    return [
+        {
+            "id": neighbour_id,
+            "similarity": round(similarity, 4),
+            "created_at": rows[neighbour_id].created_at,
+            "city": rows[neighbour_id].city,
+            "image_result": rows[neighbour_id].image_model_result,
+            "clinical_result": rows[neighbour_id].clinical_model_result,
+            "combined_score": rows[neighbour_id].combined_score,
+        }
+        for neighbour_id, similarity in neighbours if neighbour_id in rows
+    ]
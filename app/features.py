@@ -0,0 +1,318 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from .config import FEATURE_GRID_DEGREES, FEATURE_CACHE_SIZE
+from .metrics import record_cache, time_stage
+from .weather import get_current_weather, get_forecast
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Model input order for the Random Forest
+FEATURE_NAMES = (
+    'longitude', 'latitude', 'cloud_cover', 'evapotranspiration', 'precipitation',
+    'min_temp', 'mean_temp', 'max_temp', 'vapour_pressure', 'wet_day_freq',
+)
+
+# Features derived from weather data; longitude/latitude come from the request itself
+CLIMATE_FEATURES = FEATURE_NAMES[2:]
+
+# Forecast readings considered: 5 days of 3-hour intervals
+FORECAST_READINGS = 40
+
+# Approximate extraterrestrial radiation (mm/day equivalent) used by the simplified
+# Hargreaves estimate; kept identical to the value the browser used so features match
+EXTRATERRESTRIAL_RADIATION = 15.0
+
+# Upper bound on concurrent OpenWeatherMap fetches for a batch of cells
+MAX_FETCH_WORKERS = 8
+
+
+class CellClimate(NamedTuple):
+    """Derived features and current temperature for one grid cell on one day."""
+    features: Dict[str, float]
+    temperature: Optional[float]
+
+
+def grid_cell(lat: float, lon: float) -> Tuple[int, int]:
+    """Index of the grid cell containing the coordinates."""
+    return int(np.floor(lat / FEATURE_GRID_DEGREES)), int(np.floor(lon / FEATURE_GRID_DEGREES))
+
+
+def cell_center(cell: Tuple[int, int]) -> Tuple[float, float]:
+    """Coordinates of a grid cell's centre, used for the weather lookup."""
+    return (cell[0] + 0.5) * FEATURE_GRID_DEGREES, (cell[1] + 0.5) * FEATURE_GRID_DEGREES
+
+
+def magnus_vapour_pressure(temperature: np.ndarray, humidity: np.ndarray) -> np.ndarray:
+    """Actual vapour pressure (hPa) from air temperature (°C) and relative humidity (%)."""
+    saturation = 6.112 * np.exp((17.67 * temperature) / (temperature + 243.5))
+    return humidity / 100.0 * saturation
+
+
+def hargreaves_monthly_et(min_temp: np.ndarray, max_temp: np.ndarray) -> np.ndarray:
+    """Simplified Hargreaves reference evapotranspiration scaled to a 30-day month (mm)."""
+    mean_temp = (min_temp + max_temp) / 2
+    temp_range = np.clip(max_temp - min_temp, 0, None)
+    daily = 0.0023 * EXTRATERRESTRIAL_RADIATION * np.sqrt(temp_range) * (mean_temp + 17.8)
+    return daily * 30
+
+
+def derive_features(
+    current_temp: np.ndarray,
+    humidity: np.ndarray,
+    clouds: np.ndarray,
+    rain_now: np.ndarray,
+    forecast_min: np.ndarray,
+    forecast_max: np.ndarray,
+    forecast_rain: np.ndarray,
+    forecast_day: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Derive the climate features for N locations at once.
+
+    Per-location inputs are arrays of shape (N,). Forecast inputs are (N, R)
+    matrices of R readings padded with NaN (temperatures, rain) or -1
+    (day index, counted from the first forecast day).
+
+    Returns:
+        Dict mapping each name in CLIMATE_FEATURES to an array of shape (N,)
+    """
+    min_temp = np.nanmin(forecast_min, axis=1)
+    max_temp = np.nanmax(forecast_max, axis=1)
+
+    # Wet day frequency: share of forecast days with any rain, scaled to a month
+    n, _ = forecast_day.shape
+    valid = forecast_day >= 0
+    rows = np.broadcast_to(np.arange(n)[:, None], forecast_day.shape)[valid]
+    days = forecast_day[valid]
+    n_days = int(days.max()) + 1 if days.size else 1
+    seen = np.zeros((n, n_days), dtype=bool)
+    wet = np.zeros((n, n_days), dtype=bool)
+    seen[rows, days] = True
+    np.logical_or.at(wet, (rows, days), np.nan_to_num(forecast_rain[valid]) > 0)
+    days_in_forecast = seen.sum(axis=1)
+    wet_day_freq = np.where(days_in_forecast > 0, wet.sum(axis=1) / np.maximum(days_in_forecast, 1) * 30, np.nan)
+
+    return {
+        'cloud_cover': clouds,
+        'evapotranspiration': hargreaves_monthly_et(min_temp, max_temp),
+        'precipitation': np.nan_to_num(rain_now),
+        'min_temp': min_temp,
+        'mean_temp': current_temp,
+        'max_temp': max_temp,
+        'vapour_pressure': magnus_vapour_pressure(current_temp, humidity),
+        'wet_day_freq': wet_day_freq,
+    }
+
+
+def _arrays_from_payloads(payloads: List[Tuple[dict, dict]]) -> Dict[str, np.ndarray]:
+    """Pack OpenWeatherMap current/forecast documents into the arrays derive_features expects."""
+    n = len(payloads)
+    current_temp = np.full(n, np.nan)
+    humidity = np.full(n, np.nan)
+    clouds = np.full(n, np.nan)
+    rain_now = np.zeros(n)
+    forecast_min = np.full((n, FORECAST_READINGS), np.nan)
+    forecast_max = np.full((n, FORECAST_READINGS), np.nan)
+    forecast_rain = np.zeros((n, FORECAST_READINGS))
+    forecast_day = np.full((n, FORECAST_READINGS), -1, dtype=np.int64)
+
+    for i, (current, forecast) in enumerate(payloads):
+        main = current.get('main', {})
+        current_temp[i] = main.get('temp', np.nan)
+        humidity[i] = main.get('humidity', np.nan)
+        clouds[i] = current.get('clouds', {}).get('all', np.nan)
+        rain_now[i] = current.get('rain', {}).get('3h', 0.0)
+
+        readings = [r for r in forecast.get('list', [])[:FORECAST_READINGS] if 'main' in r]
+        if not readings:
+            continue
+        dates = [r['dt_txt'].split(' ')[0] for r in readings]
+        first = datetime.strptime(dates[0], '%Y-%m-%d')
+        k = len(readings)
+        forecast_min[i, :k] = [r['main']['temp_min'] for r in readings]
+        forecast_max[i, :k] = [r['main']['temp_max'] for r in readings]
+        forecast_rain[i, :k] = [r.get('rain', {}).get('3h', 0.0) for r in readings]
+        forecast_day[i, :k] = [(datetime.strptime(d, '%Y-%m-%d') - first).days for d in dates]
+
+    return {
+        'current_temp': current_temp, 'humidity': humidity, 'clouds': clouds, 'rain_now': rain_now,
+        'forecast_min': forecast_min, 'forecast_max': forecast_max,
+        'forecast_rain': forecast_rain, 'forecast_day': forecast_day,
+    }
+
+
+class ClimateFeatureCache:
+    """
+    LRU cache of derived climate per (grid cell, UTC day).
+
+    Concurrent misses for the same cell wait for a single fetch instead of
+    each calling OpenWeatherMap.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, CellClimate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._cell_locks: Dict[Tuple, threading.Lock] = {}
+
+    def get(self, key: Tuple) -> Optional[CellClimate]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple, value: CellClimate):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lock_for(self, key: Tuple) -> threading.Lock:
+        with self._lock:
+            # Drop idle locks so the map stays bounded
+            if len(self._cell_locks) > self.max_entries:
+                self._cell_locks = {k: v for k, v in self._cell_locks.items() if v.locked()}
+            return self._cell_locks.setdefault(key, threading.Lock())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = ClimateFeatureCache(FEATURE_CACHE_SIZE)
+
+
+def _fetch_cells(cells: List[Tuple[int, int]]) -> Dict[Tuple[int, int], CellClimate]:
+    """Fetch weather for each cell centre and derive all their features in one vectorized pass."""
+    def fetch(cell):
+        lat, lon = cell_center(cell)
+        current = get_current_weather(lat, lon)
+        forecast = get_forecast(lat, lon)
+        return cell, current, forecast
+
+    with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(cells))) as pool:
+        fetched = [item for item in pool.map(fetch, cells) if item[1] and item[2]]
+    if not fetched:
+        return {}
+
+    arrays = _arrays_from_payloads([(current, forecast) for _, current, forecast in fetched])
+    derived = derive_features(**arrays)
+    results = {}
+    for i, (cell, _, _) in enumerate(fetched):
+        features = {
+            name: round(float(derived[name][i]), 2)
+            for name in CLIMATE_FEATURES if np.isfinite(derived[name][i])
+        }
+        temperature = arrays['current_temp'][i]
+        results[cell] = CellClimate(features, float(temperature) if np.isfinite(temperature) else None)
+    return results
+
+
+def get_cell_climates(coords: Sequence[Tuple[float, float]]) -> List[Optional[CellClimate]]:
+    """
+    Get derived climate for many coordinates, fetching each uncached grid cell once.
+
+    Args:
+        coords: (latitude, longitude) pairs
+
+    Returns:
+        One CellClimate per input coordinate, or None where weather was unavailable
+    """
+    today = datetime.now(timezone.utc).date().isoformat()
+    keys = [(grid_cell(lat, lon), today) for lat, lon in coords]
+
+    found: Dict[Tuple, CellClimate] = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        entry = _cache.get(key)
+        record_cache('climate_features', entry is not None)
+        if entry is not None:
+            found[key] = entry
+        else:
+            missing.append(key)
+
+    if missing:
+        # Acquire cell locks in a fixed order so overlapping batches cannot deadlock
+        missing.sort()
+        locks = [_cache.lock_for(key) for key in missing]
+        for lock in locks:
+            lock.acquire()
+        try:
+            # Another request may have filled some cells while we waited
+            still_missing = []
+            for key in missing:
+                entry = _cache.get(key)
+                if entry is not None:
+                    found[key] = entry
+                else:
+                    still_missing.append(key)
+            if still_missing:
+                with time_stage('climate_features'):
+                    fetched = _fetch_cells([cell for cell, _ in still_missing])
+                for cell, climate in fetched.items():
+                    _cache.put((cell, today), climate)
+                    found[(cell, today)] = climate
+        finally:
+            for lock in locks:
+                lock.release()
+
+    return [found.get(key) for key in keys]
+
+
+def get_cell_climate(lat: float, lon: float) -> Optional[CellClimate]:
+    """Get derived climate for a single coordinate."""
+    return get_cell_climates([(lat, lon)])[0]
+
+
+def get_climate_features(lat: float, lon: float) -> Optional[Dict[str, float]]:
+    """All ten model features for a coordinate, or None if weather is unavailable."""
+    climate = get_cell_climate(lat, lon)
+    if climate is None:
+        return None
+    return {'longitude': lon, 'latitude': lat, **climate.features}
+
+
+def fill_missing_features(
+    clinical_data: Dict[str, Any],
+    latitude: Optional[float],
+    longitude: Optional[float],
+    climate: Optional[CellClimate] = None,
+) -> Dict[str, Any]:
+    """
+    Return a copy of ``clinical_data`` with absent climate features derived server-side.
+
+    Values supplied by the client are kept; only missing or null fields are
+    filled. Without coordinates or weather data the input is returned as is.
+    """
+    filled = dict(clinical_data)
+    if filled.get('longitude') is None and longitude is not None:
+        filled['longitude'] = longitude
+    if filled.get('latitude') is None and latitude is not None:
+        filled['latitude'] = latitude
+
+    if all(filled.get(name) is not None for name in CLIMATE_FEATURES):
+        return filled
+    lat, lon = filled.get('latitude'), filled.get('longitude')
+    if lat is None or lon is None:
+        return filled
+
+    climate = climate or get_cell_climate(float(lat), float(lon))
+    if climate is None:
+        logger.warning("Climate features unavailable for cell %s", grid_cell(float(lat), float(lon)))
+        return filled
+    for name in CLIMATE_FEATURES:
+        if filled.get(name) is None and name in climate.features:
+            filled[name] = climate.features[name]
+    return filled
+
+
+def feature_vector(clinical_data: Dict[str, Any]) -> List[Any]:
+    """Features in model input order."""
+    return [clinical_data.get(name) for name in FEATURE_NAMES]
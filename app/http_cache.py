@@ -0,0 +1,148 @@
+import hashlib
+import os
+from functools import lru_cache
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+
+STATIC_DIR = "static"
+
+
+def compute_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match header already names this ETag."""
+    header = request.headers.get("if-none-match")
+    return bool(header) and _matches(header, etag)
+
+
+def conditional_response(
+    request: Request,
+    body: bytes,
+    media_type: str,
+    cache_control: str = "private, no-cache",
+    etag: Optional[str] = None,
+) -> Response:
+    """
+    Build a response carrying an ETag, answering 304 when the client already has it.
+
+    Args:
+        request: Incoming request, checked for If-None-Match
+        body: Encoded response body
+        media_type: Content type of the body
+        cache_control: Cache-Control header value
+        etag: Precomputed ETag; derived from the body if omitted
+    """
+    etag = etag or compute_etag(body)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class ETagMiddleware:
+    """
+    ASGI middleware adding ETags to successful API GET responses.
+
+    The body is hashed once it has been produced; when the client's
+    If-None-Match already names it, a bodyless 304 is sent instead, which
+    saves the transfer even though the handler still ran. Responses that
+    set their own ETag, and streaming responses, are left alone.
+    """
+
+    def __init__(self, app, path_prefix: str = "/api/", cache_control: str = "private, no-cache"):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.cache_control = cache_control
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] not in ("GET", "HEAD")
+                or not scope["path"].startswith(self.path_prefix)):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        state = {"start": None, "chunks": [], "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if message["status"] != 200 or "etag" in headers:
+                    state["passthrough"] = True
+                    await send(message)
+                else:
+                    state["start"] = message
+                return
+            if state["passthrough"] or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            state["chunks"].append(message.get("body", b""))
+            if message.get("more_body", False):
+                if len(state["chunks"]) == 1:
+                    # Streaming response: give up on the ETag and forward as is
+                    state["passthrough"] = True
+                    await send(state["start"])
+                    await send(message)
+                return
+
+            body = b"".join(state["chunks"])
+            start = state["start"]
+            headers = MutableHeaders(raw=start["headers"])
+            etag = compute_etag(body)
+            headers["ETag"] = etag
+            headers.setdefault("Cache-Control", self.cache_control)
+            if if_none_match and _matches(if_none_match, etag):
+                not_modified = [(k, v) for k, v in start["headers"]
+                                if k.lower() not in (b"content-length", b"content-type")]
+                await send({"type": "http.response.start", "status": 304, "headers": not_modified})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+@lru_cache(maxsize=256)
+def _file_digest(path: str, mtime_ns: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def static_url(path: str) -> str:
+    """
+    Content-hashed URL for a file under ``static/``.
+
+    The hash changes whenever the file does, so the URL can be cached by
+    browsers forever (see CachedStaticFiles).
+    """
+    full_path = os.path.join(STATIC_DIR, path)
+    try:
+        version = _file_digest(full_path, os.stat(full_path).st_mtime_ns)
+    except OSError:
+        return f"/static/{path}"
+    return f"/static/{path}?v={version}"
+
+
+class CachedStaticFiles(StaticFiles):
+    """Static files with long-lived caching for content-hashed (``?v=``) URLs."""
+
+    async def get_response(self, path: str, scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            if "v=" in scope.get("query_string", b"").decode("latin-1"):
+                response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+            else:
+                response.headers["Cache-Control"] = "public, max-age=300"
+        return response
@@ -0,0 +1,155 @@
+import asyncio
+import datetime
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from .config import IDEMPOTENCY_WINDOW_SECONDS, IDEMPOTENCY_KEY_TTL_SECONDS
+from .metrics import record_cache
+from .models import Prediction, PredictionRequest
+from .write_behind import prediction_writer
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+def request_fingerprint(
+    user_id: int,
+    image_data: bytes,
+    clinical_data: Dict[str, Any],
+    language: str,
+    latitude: Optional[float],
+    longitude: Optional[float],
+    mode: str = "full",
+) -> str:
+    """
+    Content hash identifying a prediction submission.
+
+    Covers the user, the exact image bytes and every input that affects the
+    result, so retries of the same upload map to the same value.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(user_id).encode())
+    digest.update(hashlib.sha256(image_data).digest())
+    digest.update(json.dumps(
+        {"clinical": clinical_data, "language": language, "lat": latitude, "lon": longitude, "mode": mode},
+        sort_keys=True, default=str
+    ).encode())
+    return digest.hexdigest()
+
+def key_conflict(user_id: int) -> HTTPException:
+    """The 409 returned when an Idempotency-Key is reused with a different payload."""
+    logger.warning("Idempotency key reused with a different payload by user %s", user_id)
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Idempotency-Key was already used for a different request"
+    )
+
+def find_replay(
+    db: Session,
+    user_id: int,
+    idempotency_key: Optional[str],
+    fingerprint: str,
+) -> Optional[Prediction]:
+    """
+    Return the stored prediction for a repeated submission, if any.
+
+    Args:
+        db: Database session
+        user_id: Submitting user
+        idempotency_key: Client supplied Idempotency-Key header, if any
+        fingerprint: Content hash from request_fingerprint
+
+    Returns:
+        Optional[Prediction]: The prediction produced by the earlier submission
+
+    Raises:
+        HTTPException: If the idempotency key was already used for a different request
+    """
+    # Predictions still waiting for the background writer are not in the database yet
+    pending = prediction_writer.find_pending(user_id, idempotency_key, fingerprint)
+    if pending is not None:
+        stored_fingerprint, prediction = pending
+        if stored_fingerprint != fingerprint:
+            raise key_conflict(user_id)
+        record_cache("prediction_dedup", True)
+        return prediction
+
+    now = datetime.datetime.utcnow()
+    if idempotency_key:
+        record = (
+            db.query(PredictionRequest)
+            .filter(
+                PredictionRequest.user_id == user_id,
+                PredictionRequest.idempotency_key == idempotency_key,
+                PredictionRequest.created_at >= now - datetime.timedelta(seconds=IDEMPOTENCY_KEY_TTL_SECONDS),
+            )
+            .first()
+        )
+        if record is not None and record.content_hash != fingerprint:
+            raise key_conflict(user_id)
+    else:
+        record = (
+            db.query(PredictionRequest)
+            .filter(
+                PredictionRequest.user_id == user_id,
+                PredictionRequest.content_hash == fingerprint,
+                PredictionRequest.created_at >= now - datetime.timedelta(seconds=IDEMPOTENCY_WINDOW_SECONDS),
+            )
+            .order_by(PredictionRequest.created_at.desc())
+            .first()
+        )
+
+    record_cache("prediction_dedup", record is not None)
+    return record.prediction if record is not None else None
+
+class InFlightDeduplicator:
+    """
+    Collapses concurrent identical submissions within a worker process.
+
+    The first caller for a key runs the computation; callers arriving while
+    it is still running await the same result instead of recomputing. A
+    caller whose fingerprint differs from the running one (an
+    Idempotency-Key reused for another payload) gets the 409 that
+    ``find_replay`` returns once the first request is stored.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, Tuple[asyncio.Future, Optional[str]]] = {}
+
+    async def run(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[T]],
+        fingerprint: Optional[str] = None,
+        user_id: Optional[int] = None,
+    ) -> T:
+        running = self._in_flight.get(key)
+        if running is not None:
+            future, running_fingerprint = running
+            if fingerprint != running_fingerprint:
+                raise key_conflict(user_id)
+            logger.info("Waiting on in-flight duplicate submission")
+            record_cache("prediction_in_flight", True)
+            # Shield so a disconnecting duplicate cannot cancel the shared computation
+            return await asyncio.shield(future)
+
+        record_cache("prediction_in_flight", False)
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (future, fingerprint)
+        try:
+            result = await compute()
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve the exception so an unawaited future does not log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+
+prediction_deduplicator = InFlightDeduplicator()
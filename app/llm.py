@@ -1,13 +1,21 @@
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from typing import Dict, Any, Optional
 import os
-from .config import GEMINI_API_KEY, GEMINI_MODEL_NAME
+import time
+from .config import GEMINI_API_KEY, GEMINI_API_ENDPOINT, GEMINI_MODEL_NAME, GEMINI_TIMEOUT_SECONDS, GEMINI_MAX_RETRIES
 from PIL import Image
 from io import BytesIO
-from app.logger import logger
+from app.logger import get_logger
+from .resilience import call_with_resilience, NonRetryableError
 
-# Configure Gemini API with key from config
-genai.configure(api_key=GEMINI_API_KEY)
+logger = get_logger(__name__)
+
+# Configure Gemini API with key from config; a custom endpoint (such as a local fake) is reached over REST
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
 
 class LLM:
     """Handles interaction with Google's Gemini LLM for report generation."""
@@ -111,7 +119,7 @@ Format each section clearly with headers and subheaders for easy reading. Use bu
 
     def inference(self, image: Any, result: str, language: str = "English", 
                  temperature: Optional[float] = None, 
-                 city: Optional[str] = None) -> str:
+                 city: Optional[str] = None, deadline: Optional[float] = None) -> str:
         """
         Generate a report using the LLM model.
         
@@ -121,11 +129,12 @@ Format each section clearly with headers and subheaders for easy reading. Use bu
             language: Target language for the report
             temperature: Local temperature in Celsius
             city: Location of the case
+            deadline: ``time.monotonic()`` value bounding all attempts together
         """
         try:
             # Generate prompt using template
             refined_prompt = self.prompt_template(result, language, temperature, city)
-            logger.info("Generated LLM prompt template")
+            logger.debug("Generated LLM prompt template")
             
             # Process image input
             try:
@@ -146,9 +155,23 @@ Format each section clearly with headers and subheaders for easy reading. Use bu
                 logger.error("Error processing image for LLM", exc_info=True)
                 prompt = [{'role': 'user', 'parts': [refined_prompt]}]
             
-            # Generate response
+            def attempt():
+                timeout = GEMINI_TIMEOUT_SECONDS
+                if deadline is not None:
+                    timeout = max(min(timeout, deadline - time.monotonic()), 0.1)
+                try:
+                    return self.model.generate_content(prompt, request_options={"timeout": timeout})
+                except google_exceptions.ClientError as e:
+                    # Bad credentials or a malformed request; only timeouts and rate limits are worth retrying
+                    if isinstance(e, (google_exceptions.TooManyRequests, google_exceptions.RequestTimeout)):
+                        raise
+                    raise NonRetryableError(f"Gemini generate_content returned {e.code}: {e.message}") from e
+            
+            # Generate response; the timeout bounds each attempt and the breaker fails fast while Gemini is down
             logger.info("Sending request to Gemini LLM")
-            response = self.model.generate_content(prompt)
+            response = call_with_resilience(
+                "gemini", "generate_content", attempt, retries=GEMINI_MAX_RETRIES, deadline=deadline
+            )
             
             if response.text:
                 llm_response = response.text
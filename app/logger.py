@@ -1,33 +1,103 @@
+import atexit
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
-from app.config import BASE_DIR
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from datetime import datetime, timezone
+from typing import Optional
+from app.config import LOG_DIR, LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE
+from app.metrics import LOG_RECORDS_DROPPED
+
+APP_LOGGER_NAME = 'lumpy_skin_disease_app'
+_THIRD_PARTY_LOGGERS = {'uvicorn', 'sqlalchemy', 'fastapi', 'httpx', 'urllib3'}
 
 # Create logs directory
-LOG_DIR = os.path.join(BASE_DIR, 'logs')
 os.makedirs(LOG_DIR, exist_ok=True)
 
 # Create separate log files for different log levels
 log_file = os.path.join(LOG_DIR, f'app_{datetime.now().strftime("%Y%m%d")}.log')
 error_log_file = os.path.join(LOG_DIR, f'error_{datetime.now().strftime("%Y%m%d")}.log')
 
+# Attributes present on every LogRecord; anything else was passed through ``extra``
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Render log records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'location': f'{record.filename}:{record.lineno}',
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exception'] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    The stock ``QueueHandler.prepare`` formats the whole record on the
+    calling thread. Here only the message is interpolated, so ``%``-args
+    are captured as they are at the logging call (before an ORM object
+    changes or its session closes), while timestamps, JSON rendering and
+    tracebacks are still formatted off the request path. When the queue is
+    full, records below WARNING are dropped and counted; warnings and
+    errors are written synchronously instead.
+    """
+
+    def __init__(self, queue_, listener: Optional[QueueListener] = None):
+        super().__init__(queue_)
+        self.listener = listener
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Copied so other handlers on the calling thread still see the original
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING and self.listener is not None:
+                self.listener.handle(record)
+            else:
+                LOG_RECORDS_DROPPED.labels(level=record.levelname).inc()
+
+
 # Define log formatters
-standard_formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s'
-)
-error_formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s\n'
-    'Exception:\n%(exc_info)s\n'
-)
+if LOG_FORMAT == 'json':
+    standard_formatter = JsonFormatter()
+    error_formatter = JsonFormatter()
+else:
+    standard_formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s'
+    )
+    error_formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(filename)s:%(lineno)d - %(levelname)s - %(message)s'
+    )
 
-# Create and configure handlers
+# Create and configure handlers; these run on the listener thread only
 file_handler = RotatingFileHandler(
     log_file,
     maxBytes=10485760,  # 10MB
     backupCount=10
 )
-file_handler.setLevel(logging.INFO)
+file_handler.setLevel(logging.DEBUG)
 file_handler.setFormatter(standard_formatter)
 
 error_file_handler = RotatingFileHandler(
@@ -39,16 +109,54 @@ error_file_handler.setLevel(logging.ERROR)
 error_file_handler.setFormatter(error_formatter)
 
 console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
+console_handler.setLevel(logging.DEBUG)
 console_handler.setFormatter(standard_formatter)
 
+# Background writer: request threads only enqueue records
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_listener = QueueListener(
+    log_queue, file_handler, error_file_handler, console_handler,
+    respect_handler_level=True
+)
+queue_handler = DeferredQueueHandler(log_queue, queue_listener)
+
 # Configure root logger
-logging.basicConfig(level=logging.INFO, handlers=[])
+logging.basicConfig(level=LOG_LEVEL, handlers=[])
 root_logger = logging.getLogger()
-root_logger.addHandler(file_handler)
-root_logger.addHandler(error_file_handler)
-root_logger.addHandler(console_handler)
+root_logger.addHandler(queue_handler)
+
+queue_listener.start()
+atexit.register(queue_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Return a module logger under the application namespace.
+
+    ``app.prediction`` maps to ``lumpy_skin_disease_app.prediction`` so its
+    verbosity can be tuned through ``LOG_LEVELS`` as ``prediction=DEBUG``.
+    """
+    if name.startswith('app.'):
+        name = name[len('app.'):]
+    return logging.getLogger(f'{APP_LOGGER_NAME}.{name}')
+
+
+def _apply_module_levels(spec: str):
+    """
+    Apply ``module=LEVEL`` overrides from a comma separated spec.
+
+    Dotted third-party names such as ``uvicorn.access`` or ``sqlalchemy.engine``
+    are addressed directly; bare names refer to application modules.
+    """
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        module, _, level = item.partition('=')
+        if not level:
+            continue
+        target = logging.getLogger(module) if module.split('.')[0] in _THIRD_PARTY_LOGGERS else get_logger(module)
+        target.setLevel(level.strip().upper())
+
 
 # Create application logger
-logger = logging.getLogger('lumpy_skin_disease_app')
-logger.setLevel(logging.INFO) 
\ No newline at end of file
+logger = logging.getLogger(APP_LOGGER_NAME)
+logger.setLevel(LOG_LEVEL)
+_apply_module_levels(LOG_LEVELS)
@@ -1,45 +1,70 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request, Header
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 import json
 from typing import Optional
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from jose import jwt
 from PIL import Image
 from io import BytesIO
 
-from .database import engine, get_db, Base, SessionLocal
-from .models import User
+from .database import engine, get_db, Base, SessionLocal, migrate_schema
+from .models import User, Prediction
 from .auth import (
-    authenticate_user, create_access_token, get_current_user,
+    authenticate_user, create_access_token, get_current_user, get_current_admin, is_admin,
     create_user, UserCreate, Token, ACCESS_TOKEN_EXPIRE_MINUTES, get_user
 )
 from .prediction import (
-    make_prediction, get_user_predictions,
+    run_inference, complete_prediction, DuplicateSubmissionError, MissingFeaturesError, PIPELINE_MODES, get_user_prediction_summaries,
+    count_user_predictions, get_prediction_report_html,
     get_city_disease_count, initialize_models, clear_models
 )
-from datetime import timedelta
-from .config import SECRET_KEY, ALGORITHM, WEATHER_API_KEY
-from app.logger import logger
+from datetime import date, timedelta
+from .config import SECRET_KEY, ALGORITHM, DASHBOARD_PAGE_SIZE, COMPRESSION_MIN_SIZE, SIMILAR_CASES_MAX, WRITE_BEHIND
+from .metrics import MetricsMiddleware, render_metrics
+from .profiling import ProfilingMiddleware, profile_store
+from .http_cache import (
+    conditional_response, ETagMiddleware, CachedStaticFiles, static_url, STATIC_DIR
+)
+from .compression import CompressionMiddleware
+from .features import get_climate_features
+from .rate_limit import charge_prediction, limit_login, limit_signup, predict_admission
+from .registry import model_registry
+from .runtime import configure_runtime, runtime_report
+from .write_behind import prediction_writer
+from .embeddings import find_similar_cases
+from .analytics import summarize
+from .idempotency import request_fingerprint, find_replay, prediction_deduplicator
+from app.logger import get_logger
+
+logger = get_logger(__name__)
 
-# Create database tables
+# Create database tables and add any columns introduced since they were created
 Base.metadata.create_all(bind=engine)
+migrate_schema()
 
 # Define lifespan context manager for startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: Initialize models when the application starts
+    # Thread pools and CPU pinning have to be fixed before TensorFlow starts
+    configure_runtime()
     logger.info("Initializing models on application startup")
     initialize_models()
+    model_registry.start_watching()
     logger.info("Models initialized successfully")
+    if WRITE_BEHIND:
+        prediction_writer.start()
     
     yield  # This is where the app runs
     
     # Shutdown: Clean up resources when the application is shutting down
     logger.info("Application shutdown, performing cleanup...")
+    # Drain queued predictions before the models go away
+    prediction_writer.stop()
     clear_models()
     logger.info("Models cleared successfully")
 
@@ -49,14 +74,79 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Middleware added last runs outermost: metrics, profiling, compression, then ETags
+# ETags for API GET responses so unchanged data is answered with 304
+app.add_middleware(ETagMiddleware)
+
+# Brotli/gzip compression for text responses above the size threshold
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# Sample request profiles (disabled unless PROFILE_SAMPLE_RATE or PROFILE_SLOW_MS is set)
+app.add_middleware(ProfilingMiddleware)
+
+# Record per-route latency and in-flight requests
+app.add_middleware(MetricsMiddleware)
+
+# Mount static files; content-hashed URLs are cached by browsers indefinitely
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR), name="static")
 
 # Templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_url
+
+# Observability
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+@app.get("/api/admin/profiles")
+async def list_profiles(admin: User = Depends(get_current_admin)):
+    return profile_store.list()
+
+@app.get("/api/admin/profiles/{name}")
+async def download_profile(name: str, admin: User = Depends(get_current_admin)):
+    path = profile_store.path_for(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
+@app.get("/api/admin/analytics/summary")
+async def analytics_summary(
+    group_by: str = "month",
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    city: Optional[str] = None,
+    admin: User = Depends(get_current_admin)
+):
+    # Served from the exported Parquet dataset (python -m app.analytics), not the live database
+    try:
+        return await run_in_threadpool(summarize, group_by, since, until, city)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@app.get("/api/admin/models")
+async def list_models(admin: User = Depends(get_current_admin)):
+    return model_registry.describe()
+
+@app.get("/api/admin/runtime")
+async def runtime_settings(admin: User = Depends(get_current_admin)):
+    return runtime_report()
+
+@app.post("/api/admin/models/{version}/activate", status_code=status.HTTP_202_ACCEPTED)
+async def activate_model(version: str, promote: bool = True, admin: User = Depends(get_current_admin)):
+    # Load, validate and warm off the request path; the swap happens once the new bundle is ready
+    if version not in model_registry.available():
+        raise HTTPException(status_code=404, detail="Model version not found")
+    if not model_registry.load_in_background(version, promote=promote):
+        raise HTTPException(status_code=409, detail="Another model version is already loading")
+    logger.info("Admin %s requested model version %s", admin.username, version)
+    return {"version": version, "promote": promote, "status": "loading"}
 
 # Authentication routes
-@app.post("/api/token", response_model=Token)
+@app.post("/api/token", response_model=Token, dependencies=[Depends(limit_login)])
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
@@ -71,7 +161,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/api/signup")
+@app.post("/api/signup", dependencies=[Depends(limit_signup)])
 async def signup(user: UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(User).filter(User.username == user.username).first()
     if db_user:
@@ -82,58 +172,193 @@ async def signup(user: UserCreate, db: Session = Depends(get_db)):
     return create_user(db=db, user=user)
 
 # Prediction routes
+def prediction_payload(prediction) -> dict:
+    return {
+        "id": prediction.id,
+        "image_result": prediction.image_model_result,
+        "clinical_result": prediction.clinical_model_result,
+        "city": prediction.city,
+        "temperature": prediction.temperature,
+        "language": prediction.language,
+        "report": prediction.report,
+        "report_html": prediction.report_html,
+        "mode": prediction.pipeline_mode or "full",
+        "duplicate_of": prediction.duplicate_of_id,
+        "scores": {
+            "clinical": prediction.clinical_score,
+            "image": prediction.image_score,
+            "combined": prediction.combined_score
+        }
+    }
+
+def prediction_summary(prediction) -> dict:
+    return {
+        "id": prediction.id,
+        "created_at": prediction.created_at,
+        "city": prediction.city,
+        "language": prediction.language,
+        "image_result": prediction.image_model_result,
+        "clinical_result": prediction.clinical_model_result,
+        "combined_score": prediction.combined_score
+    }
+
 @app.post("/api/predict")
 async def create_prediction(
-    image: UploadFile = File(...),
-    clinical_data: str = Form(...),
+    request: Request,
+    image: Optional[UploadFile] = File(None),
+    clinical_data: str = Form("{}"),
     language: str = Form("English"),
     latitude: Optional[float] = Form(None),
     longitude: Optional[float] = Form(None),
+    mode: str = Form("full"),
+    idempotency_key: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    # "full" (default) runs both models and an LLM report; "screening", "clinical" and
+    # "image" return verdicts with a templated summary and skip the stages they do not need
+    if mode not in PIPELINE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(PIPELINE_MODES)}")
+    if image is None and mode in ("full", "image"):
+        raise HTTPException(status_code=400, detail=f"An image is required in {mode} mode")
+    
     # Process uploaded image in memory without saving to disk
-    image_data = image.file.read()
+    image_data = image.file.read() if image is not None and mode != "clinical" else b""
     
-    logger.info(f"Image file name: {image.filename}")
-
-    # Create a PIL Image from the bytes data
-    image_obj = Image.open(BytesIO(image_data))
+    if image is not None:
+        logger.debug("Image file name: %s", image.filename)
     
     # Parse clinical data
     clinical_features = json.loads(clinical_data)
     
-    # Log the parsed clinical data
-    logger.info(f"Parsed clinical data: {clinical_features}")
-
-    # Make prediction with image object
-    prediction = make_prediction(
-        db=db,
-        user_id=current_user.id,
-        image=image_obj,  # Pass image object directly
-        clinical_data=clinical_features,
-        latitude=latitude,
-        longitude=longitude,
-        language=language
+    # Clinical data is only dumped at debug level
+    logger.debug("Parsed clinical data: %s", clinical_features)
+
+    # Retried submissions (same Idempotency-Key, or identical content within the
+    # dedup window) return the stored prediction instead of running the pipeline again
+    fingerprint = request_fingerprint(
+        current_user.id, image_data, clinical_features, language, latitude, longitude, mode
     )
+    replay = await run_in_threadpool(find_replay, db, current_user.id, idempotency_key, fingerprint)
+    if replay is not None:
+        logger.info("Returning stored prediction %s for repeated submission by user %s", replay.id, current_user.id)
+        return JSONResponse(prediction_payload(replay), headers={"Idempotent-Replayed": "true"})
+
+    async def compute() -> int:
+        # Only submissions that run the pipeline count against the rate limits
+        await run_in_threadpool(charge_prediction, request, current_user)
+        # Create a PIL Image from the bytes data
+        image_obj = Image.open(BytesIO(image_data)) if image_data else None
+        # Admission control bounds concurrent model inference and the work runs in the
+        # threadpool so the event loop keeps serving other requests
+        async with predict_admission.slot():
+            inference = await run_in_threadpool(
+                run_inference,
+                image=image_obj,  # Pass image object directly
+                clinical_data=clinical_features,
+                latitude=latitude,
+                longitude=longitude,
+                mode=mode
+            )
+        # The report waits on Gemini under its own deadline, so it does not hold an admission slot
+        prediction = await run_in_threadpool(
+            complete_prediction,
+            db=db,
+            user_id=current_user.id,
+            inference=inference,
+            image=image_obj,
+            latitude=latitude,
+            longitude=longitude,
+            language=language,
+            content_hash=fingerprint,
+            idempotency_key=idempotency_key
+        )
+        return prediction.id
+
+    # Concurrent duplicates in this worker wait on the first computation
+    try:
+        prediction_id = await prediction_deduplicator.run(
+            f"{current_user.id}:{idempotency_key or fingerprint}", compute,
+            fingerprint=fingerprint, user_id=current_user.id
+        )
+    except MissingFeaturesError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"{e}. Share your location or enter the weather fields manually."
+        )
+    except DuplicateSubmissionError:
+        # Another worker stored this idempotency key first; serve its result
+        replay = await run_in_threadpool(find_replay, db, current_user.id, idempotency_key, fingerprint)
+        if replay is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Duplicate submission")
+        return JSONResponse(prediction_payload(replay), headers={"Idempotent-Replayed": "true"})
+
+    # Until the background writer has stored it, the prediction is only held in memory
+    prediction = prediction_writer.pending_prediction(prediction_id)
+    if prediction is None:
+        prediction = await run_in_threadpool(db.get, Prediction, prediction_id)
     
     # Log the prediction result
-    logger.info(f"Prediction result: {prediction}")
+    logger.info("Prediction %s stored for user %s", prediction.id, current_user.id)
     
-    return {
-        "id": prediction.id,
-        "image_result": prediction.image_model_result,
-        "clinical_result": prediction.clinical_model_result,
-        "city": prediction.city,
-        "temperature": prediction.temperature,
-        "language": prediction.language,
-        "report": prediction.report
-    }
+    return prediction_payload(prediction)
 
 @app.get("/api/user/predictions")
-async def user_predictions(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    predictions = get_user_predictions(db, current_user.id)
-    return predictions
+async def user_predictions(
+    sort: str = "recent",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if sort not in ("recent", "risk"):
+        raise HTTPException(status_code=400, detail="sort must be 'recent' or 'risk'")
+    # Summaries only; each report is served by /api/predictions/{id}/report
+    predictions = get_user_prediction_summaries(db, current_user.id, sort=sort, include_pending=True)
+    return [prediction_summary(prediction) for prediction in predictions]
+
+@app.get("/api/predictions/{prediction_id}/report")
+async def prediction_report(
+    prediction_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    report_html = get_prediction_report_html(db, prediction_id, current_user.id)
+    if report_html is None:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    # Reports never change once written, so clients may reuse them for a day without revalidating
+    return conditional_response(
+        request, report_html.encode("utf-8"), "text/html; charset=utf-8",
+        cache_control="private, max-age=86400"
+    )
+
+@app.get("/api/predictions/{prediction_id}/similar")
+async def similar_predictions(
+    prediction_id: int,
+    k: int = 5,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Vets see their own history; administrators search every user's cases
+    k = max(1, min(k, SIMILAR_CASES_MAX))
+    cases = await run_in_threadpool(
+        find_similar_cases, db, prediction_id, current_user.id, k, is_admin(current_user),
+        prediction_writer.pending_predictions(), prediction_writer.pending_embeddings()
+    )
+    if cases is None:
+        raise HTTPException(status_code=404, detail="No image embedding stored for this prediction")
+    return {"prediction_id": prediction_id, "similar": cases}
+
+@app.get("/api/climate-features")
+async def climate_features(
+    latitude: float,
+    longitude: float,
+    current_user: User = Depends(get_current_user)
+):
+    # Weather is fetched server-side per grid cell so the API key never reaches the browser
+    features = await run_in_threadpool(get_climate_features, latitude, longitude)
+    if features is None:
+        raise HTTPException(status_code=503, detail="Weather data is currently unavailable")
+    return features
 
 @app.get("/api/city/disease-stats")
 async def city_disease_stats(city: str, db: Session = Depends(get_db)):
@@ -176,18 +401,17 @@ async def get_home_page(request: Request):
         if not user:
             return RedirectResponse(url="/", status_code=303)
             
-        # If authentication successful, render the page with the API key
+        # If authentication successful, render the page
         return templates.TemplateResponse("index.html", {
             "request": request, 
-            "user": user,
-            "weather_api_key": WEATHER_API_KEY
+            "user": user
         })
     except:
         # If authentication fails, redirect to login page
         return RedirectResponse(url="/", status_code=303)
 
 @app.get("/dashboard")
-async def get_dashboard_page(request: Request):
+async def get_dashboard_page(request: Request, page: int = 1):
     # Get token from request cookies or headers
     token = request.cookies.get("access_token") or request.headers.get("Authorization")
     
@@ -209,8 +433,13 @@ async def get_dashboard_page(request: Request):
         db = SessionLocal()
         user = get_user(db, username)
         
-        # Get predictions for the user
-        predictions = get_user_predictions(db, user.id)
+        # Get a page of prediction summaries; reports are fetched on demand
+        page = max(page, 1)
+        predictions = get_user_prediction_summaries(
+            db, user.id, limit=DASHBOARD_PAGE_SIZE, offset=(page - 1) * DASHBOARD_PAGE_SIZE,
+            include_pending=True
+        )
+        total = count_user_predictions(db, user.id, include_pending=True)
         
         # Get city data for the first prediction that has city info
         city = None
@@ -223,7 +452,7 @@ async def get_dashboard_page(request: Request):
         
         db.close()
         
-        # If authentication successful, render the page with API key
+        # If authentication successful, render the page
         return templates.TemplateResponse(
             "dashboard.html", 
             {
@@ -232,7 +461,8 @@ async def get_dashboard_page(request: Request):
                 "predictions": predictions, 
                 "city": city, 
                 "city_stats": city_stats,
-                "weather_api_key": WEATHER_API_KEY
+                "page": page,
+                "has_next": page * DASHBOARD_PAGE_SIZE < total
             }
         )
     except:
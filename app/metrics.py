@@ -0,0 +1,199 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+)
+
+# Buckets tuned for the pipeline: sub-millisecond preprocessing up to multi-second LLM calls
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 20.0, 40.0
+)
+
+REQUEST_LATENCY = Histogram(
+    "lsd_http_request_duration_seconds",
+    "HTTP request latency by route template and method",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "lsd_http_requests_in_flight",
+    "HTTP requests currently being served",
+    ["method", "route"],
+)
+
+STAGE_LATENCY = Histogram(
+    "lsd_stage_duration_seconds",
+    "Latency of individual pipeline stages",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+MODEL_LOAD_SECONDS = Gauge(
+    "lsd_model_load_duration_seconds",
+    "Time taken by the most recent load of each model artifact",
+    ["model"],
+)
+
+CACHE_REQUESTS = Counter(
+    "lsd_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    ["cache", "result"],
+)
+
+EXTERNAL_CALL_ERRORS = Counter(
+    "lsd_external_call_errors_total",
+    "Failed calls to external dependencies",
+    ["dependency", "operation"],
+)
+
+CIRCUIT_STATE = Gauge(
+    "lsd_circuit_state",
+    "Circuit breaker state per dependency (0=closed, 1=half-open, 2=open)",
+    ["dependency"],
+)
+
+REPORT_FALLBACKS = Counter(
+    "lsd_report_fallbacks_total",
+    "Predictions whose report was templated because the LLM was unavailable",
+)
+
+RATE_LIMITED = Counter(
+    "lsd_rate_limited_total",
+    "Requests rejected by a rate limit policy",
+    ["policy"],
+)
+
+ADMISSION_REJECTED = Counter(
+    "lsd_admission_rejected_total",
+    "Requests rejected by admission control",
+    ["route", "reason"],
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "lsd_admission_queue_depth",
+    "Requests waiting for an admission slot",
+    ["route"],
+)
+
+STAGES_SKIPPED = Counter(
+    "lsd_pipeline_stages_skipped_total",
+    "Pipeline stages skipped by stage selection or early exit",
+    ["stage", "reason"],
+)
+
+MODEL_SWAPS = Counter(
+    "lsd_model_swaps_total",
+    "Model bundle loads by outcome (activated/failed)",
+    ["outcome"],
+)
+
+WRITE_BEHIND_PENDING = Gauge(
+    "lsd_write_behind_pending",
+    "Predictions journaled but not yet written to the database",
+)
+
+WRITE_BEHIND_WRITES = Counter(
+    "lsd_write_behind_writes_total",
+    "Predictions handled by write-behind persistence by outcome (committed/replayed/inline/key_conflict/rejected)",
+    ["outcome"],
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "lsd_log_records_dropped_total",
+    "Log records discarded because the background log queue was full",
+    ["level"],
+)
+
+
+@contextmanager
+def time_stage(stage: str):
+    """
+    Observe the wall-clock duration of a pipeline stage.
+
+    Args:
+        stage: Stage label, e.g. "preprocess", "random_forest" or "llm"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def time_model_load(model: str):
+    """Record how long loading a model artifact took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        MODEL_LOAD_SECONDS.labels(model=model).set(time.perf_counter() - start)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup so hit ratios can be derived from the counters."""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_external_error(dependency: str, operation: str):
+    """Count a failed call to an external dependency."""
+    EXTERNAL_CALL_ERRORS.labels(dependency=dependency, operation=operation).inc()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency and in-flight gauges.
+
+    Routes are labelled by their path template (e.g. ``/api/user/predictions``)
+    rather than the raw URL so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = _route_template(scope)
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method=method, route=route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(
+                method=method, route=route, status=str(status_holder["status"])
+            ).observe(time.perf_counter() - start)
+
+
+def _route_template(scope) -> str:
+    """Resolve the matching route's path template for labelling."""
+    from starlette.routing import Match
+
+    app = scope.get("app")
+    router = getattr(app, "router", None)
+    if router is None:
+        return "unmatched"
+    for route in router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+def render_metrics():
+    """Return the exposition payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 import datetime
 
+def local_now() -> datetime.datetime:
+    """Timestamp in the app's local time (IST), as stored on predictions."""
+    return datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=5, minutes=30)))
+
 class User(Base):
     __tablename__ = "users"
     
@@ -19,7 +23,7 @@ class Prediction(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=5, minutes=30))))
+    created_at = Column(DateTime, default=local_now)
     
     # Location data
     latitude = Column(Float, nullable=True)
@@ -30,13 +34,23 @@ class Prediction(Base):
     image_path = Column(String, nullable=True)  # Kept for backward compatibility, but will be NULL for new entries
     clinical_features = Column(JSON)  # Store as JSON
     
-    # Model predictions
-    image_model_result = Column(Boolean)
-    clinical_model_result = Column(Boolean)
+    # Model predictions; None when the stage did not run
+    image_model_result = Column(Boolean, nullable=True)
+    clinical_model_result = Column(Boolean, nullable=True)
+    clinical_model_version = Column(String, nullable=True)  # Artifact hash of the scaler and random forest
+    image_model_version = Column(String, nullable=True)  # Artifact hash of the CNN
+    
+    # Probability of lumpy skin disease per model and the fused risk score
+    clinical_score = Column(Float, nullable=True)
+    image_score = Column(Float, nullable=True)
+    combined_score = Column(Float, nullable=True)
+    pipeline_mode = Column(String, nullable=True)  # Stages requested: full, screening, clinical or image
+    duplicate_of_id = Column(Integer, ForeignKey("predictions.id"), nullable=True)  # Near-duplicate whose report was reused
     
     # Generated report
     language = Column(String, default="English")
     report = Column(Text)
+    report_html = Column(Text, nullable=True)  # Sanitized HTML rendered once at write time
     
     user = relationship("User", back_populates="predictions")
 
@@ -45,4 +59,28 @@ class DiseaseStats(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     city = Column(String, unique=True, index=True)
-    disease_count = Column(Integer, default=0) 
\ No newline at end of file
+    disease_count = Column(Integer, default=0)
+
+class PredictionRequest(Base):
+    """Maps a submission (idempotency key and/or content hash) to the prediction it produced."""
+    __tablename__ = "prediction_requests"
+    __table_args__ = (UniqueConstraint("user_id", "idempotency_key", name="uq_prediction_requests_user_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    idempotency_key = Column(String, nullable=True)
+    content_hash = Column(String, index=True)
+    prediction_id = Column(Integer, ForeignKey("predictions.id"))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    
+    prediction = relationship("Prediction")
+
+class IdBlock(Base):
+    """A range of prediction ids reserved by one worker's write-behind writer."""
+    __tablename__ = "id_blocks"
+    
+    start_id = Column(Integer, primary_key=True, autoincrement=False)
+    end_id = Column(Integer)
+    owner = Column(String, index=True)  # Journal owner token of the reserving worker
+    allocated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    closed_at = Column(DateTime, nullable=True, index=True)  # Set once every id handed out is in the database
@@ -1,17 +1,37 @@
 import os
+import datetime
+import hashlib
+import threading
+import time
 import joblib
 import numpy as np
 import tensorflow as tf
-from sqlalchemy.orm import Session
-from typing import Dict, Any, List
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, load_only
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
 import json
 from PIL import Image
 from io import BytesIO
-from app.logger import logger
-from .models import Prediction, DiseaseStats
-from .weather import get_temperature_by_coords, get_city_by_coords
+from app.logger import get_logger
+from .models import Prediction, DiseaseStats, PredictionRequest
+from .weather import get_city_by_coords
+from .features import FEATURE_NAMES, get_cell_climate, fill_missing_features, feature_vector
 from .llm import LLM
-from .config import MODELS_DIR
+from .config import (
+    MODELS_DIR, SCREEN_SKIP_IMAGE_CONFIDENCE, LLM_SKIP_BELOW_RISK, RF_N_JOBS,
+    LLM_REPORT_DEADLINE_SECONDS, LLM_MAX_CONCURRENT_REPORTS
+)
+from .registry import model_registry
+from .embeddings import find_near_duplicate, index_prediction
+from .write_behind import prediction_writer
+from .scoring import ensemble_scorer, clinical_verdict, image_verdict
+from .metrics import time_stage, time_model_load, REPORT_FALLBACKS, STAGES_SKIPPED
+from .reports import build_templated_report, render_report_html
+
+logger = get_logger(__name__)
+
+# Stage selections accepted by run_inference and make_prediction
+PIPELINE_MODES = ("full", "screening", "clinical", "image")
 
 # Custom exceptions
 class ModelLoadingError(Exception):
@@ -23,13 +43,32 @@ class PreprocessingError(Exception):
 class PredictionError(Exception):
     pass
 
+class DuplicateSubmissionError(PredictionError):
+    """Another worker already stored a prediction for the same idempotency key."""
+    pass
+
+class MissingFeaturesError(PredictionError):
+    """Clinical features were left out and could not be derived from the location."""
+    pass
+
+def artifact_version(*paths: str) -> str:
+    """Short content hash identifying a set of model artifacts."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
 # Data preprocessing class
 class DataPreprocessor:
     """Handles data preprocessing for the ML model input."""
-    def __init__(self):
+    def __init__(self, models_dir: str = MODELS_DIR):
         try:
             logger.info("Initializing DataPreprocessor")
-            self.scaler = joblib.load(f"{MODELS_DIR}/scaler_object.joblib")
+            self.scaler_path = f"{models_dir}/scaler_object.joblib"
+            with time_model_load("scaler"):
+                self.scaler = joblib.load(self.scaler_path)
             logger.info("Scaler loaded successfully")
         except Exception as e:
             logger.error("Failed to load scaler", exc_info=True)
@@ -38,27 +77,41 @@ class DataPreprocessor:
     def preprocess(self, input_data):
         """Preprocess input data using the loaded scaler."""
         try:
-            logger.info(f"Preprocessing input data: {input_data}")
+            logger.debug("Preprocessing input data: %s", input_data)
             scaled_data = self.scaler.transform(np.array(input_data).reshape(1, -1))
             return scaled_data
         except Exception as e:
             logger.error("Error in data preprocessing", exc_info=True)
             raise PreprocessingError("Preprocessing failed. Ensure input data format is correct.")
 
+    def preprocess_batch(self, rows: np.ndarray) -> np.ndarray:
+        """Scale a 2-D array of feature rows in one call."""
+        try:
+            return self.scaler.transform(rows)
+        except Exception as e:
+            logger.error("Error in batch preprocessing", exc_info=True)
+            raise PreprocessingError("Batch preprocessing failed. Ensure input data format is correct.")
+
 # ML model predictor
 class ML_Model_Predictor:
     """Handles predictions using the Random Forest model."""
-    def __init__(self):
+    def __init__(self, models_dir: str = MODELS_DIR):
         try:
-            self.model_path = f"{MODELS_DIR}/randomforest_best_model.pkl"
-            logger.info(f"Loading ML model from: {self.model_path}")
+            self.model_path = f"{models_dir}/randomforest_best_model.pkl"
+            logger.info("Loading ML model from: %s", self.model_path)
             
             if not os.path.exists(self.model_path):
-                logger.error(f"ML model file not found at {self.model_path}")
+                logger.error("ML model file not found at %s", self.model_path)
                 raise ModelLoadingError("ML model file not found")
                 
-            self.model = joblib.load(self.model_path)
-            logger.info("ML model loaded successfully")
+            with time_model_load("random_forest"):
+                self.model = joblib.load(self.model_path)
+            # Forests trained with n_jobs=-1 would otherwise fan out over every core per request
+            if hasattr(self.model, "n_jobs"):
+                self.model.n_jobs = RF_N_JOBS
+            # The scaler is part of the clinical model, so it is hashed into the version too
+            self.version = artifact_version(f"{models_dir}/scaler_object.joblib", self.model_path)
+            logger.info("ML model loaded successfully (version %s)", self.version)
         except Exception as e:
             logger.error("Failed to load ML model", exc_info=True)
             raise ModelLoadingError("Could not load ML model")
@@ -68,67 +121,118 @@ class ML_Model_Predictor:
         try:
             prediction = self.model.predict(preprocessed_data)
             result = prediction[0]
-            logger.info(f"ML Model prediction: {'Lumpy' if result == 1 else 'Not Lumpy'}")
+            logger.debug("ML Model prediction: %s", 'Lumpy' if result == 1 else 'Not Lumpy')
             return result
         except Exception as e:
             logger.error("Error during ML prediction", exc_info=True)
             raise PredictionError("ML prediction failed")
 
+    def predict_proba(self, preprocessed_rows: np.ndarray) -> np.ndarray:
+        """Probability of the "Lumpy" class (1) for each row of scaled features."""
+        try:
+            positive = list(self.model.classes_).index(1)
+            return self.model.predict_proba(preprocessed_rows)[:, positive]
+        except Exception as e:
+            logger.error("Error during ML probability prediction", exc_info=True)
+            raise PredictionError("ML probability prediction failed")
+
 # CNN model predictor
 class CNN_Model_Predictor:
     """Handles predictions using the CNN model."""
-    def __init__(self):
+    def __init__(self, models_dir: str = MODELS_DIR):
         try:
-            self.model_path = f"{MODELS_DIR}/mobilenet_lumpy_skin_model.h5"
-            logger.info(f"Loading CNN model from: {self.model_path}")
+            self.model_path = f"{models_dir}/mobilenet_lumpy_skin_model.h5"
+            logger.info("Loading CNN model from: %s", self.model_path)
             
             if not os.path.exists(self.model_path):
-                logger.error(f"CNN model file not found at {self.model_path}")
+                logger.error("CNN model file not found at %s", self.model_path)
                 raise ModelLoadingError("CNN model file not found")
                 
-            self.model = tf.keras.models.load_model(self.model_path)
-            logger.info("CNN model loaded successfully")
+            with time_model_load("cnn"):
+                self.model = tf.keras.models.load_model(self.model_path)
+                # Same graph, also exposing the penultimate layer (the classifier's input),
+                # so one forward pass yields both the embedding and the class scores
+                self.embedding_model = tf.keras.Model(
+                    inputs=self.model.inputs, outputs=[self.model.layers[-1].input, self.model.output]
+                )
+            self.version = artifact_version(self.model_path)
+            logger.info("CNN model loaded successfully (version %s)", self.version)
         except Exception as e:
             logger.error("Failed to load CNN model", exc_info=True)
             raise ModelLoadingError("Could not load CNN model")
 
+    def _prepare(self, image):
+        """Resize and normalize an image into a single-item model input batch."""
+        image = image.resize((224, 224))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image_array = np.array(image, dtype=np.float32)
+        image_array = np.expand_dims(image_array, axis=0)
+        return tf.keras.applications.mobilenet_v2.preprocess_input(image_array)
+
     def predict(self, image):
         """Make predictions using the loaded CNN model."""
         try:
             # Preprocess image for model input
-            image = image.resize((224, 224))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            image_array = np.array(image, dtype=np.float32)
-            image_array = np.expand_dims(image_array, axis=0)
-            image_array = tf.keras.applications.mobilenet_v2.preprocess_input(image_array)
+            image_array = self._prepare(image)
             
             # Make prediction
             prediction = self.model.predict(image_array)
-            logger.info(f"CNN Model prediction: {prediction}")
+            logger.debug("CNN Model raw output: %s", prediction)
             predicted_class = 1 if np.argmax(prediction[0]) else 0
-            logger.info(f"CNN Model prediction: {'Lumpy Skin' if predicted_class == 0 else 'Normal Skin'}")
+            logger.debug("CNN Model prediction: %s", 'Lumpy Skin' if predicted_class == 0 else 'Normal Skin')
             return predicted_class
         
         except Exception as e:
             logger.error("Error during CNN prediction", exc_info=True)
             raise PredictionError("CNN prediction failed")
 
-# Global variables to store model instances
-_preprocessor = None
-_ml_predictor = None
-_cnn_predictor = None
+    @staticmethod
+    def _lumpy_probability(output) -> float:
+        output = np.asarray(output, dtype=np.float64)
+        logger.debug("CNN Model raw output: %s", output)
+        # Models exported without a softmax head return logits
+        if output.min() < 0 or not np.isclose(output.sum(), 1.0, atol=1e-3):
+            output = np.exp(output - output.max())
+            output /= output.sum()
+        return float(output[0])
+
+    def predict_proba(self, image) -> float:
+        """Probability of the "Lumpy Skin" class (0) from the model's softmax output."""
+        try:
+            return self._lumpy_probability(self.model.predict(self._prepare(image))[0])
+        except Exception as e:
+            logger.error("Error during CNN probability prediction", exc_info=True)
+            raise PredictionError("CNN probability prediction failed")
+
+    def predict_with_embedding(self, image) -> Tuple[float, np.ndarray]:
+        """
+        Lumpy probability and L2-normalized penultimate-layer embedding from one forward pass.
+
+        Returns:
+            Tuple[float, np.ndarray]: (probability of "Lumpy Skin", float32 embedding)
+        """
+        try:
+            features, output = self.embedding_model(self._prepare(image), training=False)
+            embedding = np.asarray(features, dtype=np.float32).reshape(-1)
+            norm = np.linalg.norm(embedding)
+            if norm > 0:
+                embedding /= norm
+            return self._lumpy_probability(np.asarray(output)[0]), embedding
+        except Exception as e:
+            logger.error("Error during CNN embedding prediction", exc_info=True)
+            raise PredictionError("CNN embedding prediction failed")
+
+# The LLM client is not part of the versioned model artifacts
 _llm = None
 
 def initialize_models():
-    """Initialize and load all models once during application startup"""
-    global _preprocessor, _ml_predictor, _cnn_predictor, _llm
+    """Load the active model version and the LLM client once during application startup"""
+    global _llm
     
     try:
         logger.info("Initializing models on application startup")
-        _preprocessor = DataPreprocessor()
-        _ml_predictor = ML_Model_Predictor()
-        _cnn_predictor = CNN_Model_Predictor()
+        model_registry.load()
         _llm = LLM()
         logger.info("All models loaded successfully")
     except Exception as e:
@@ -137,120 +241,354 @@ def initialize_models():
     
 def clear_models():
     """Clear the models from memory"""
-    global _preprocessor, _ml_predictor, _cnn_predictor
-    _preprocessor = None
-    _ml_predictor = None
-    _cnn_predictor = None
+    global _llm
+    model_registry.clear()
     _llm = None
 
+def get_llm():
+    """Get the LLM client, creating it on first use"""
+    global _llm
+    if _llm is None:
+        _llm = LLM()
+    return _llm
+
 def get_models():
-    """Get the initialized models"""
-    global _preprocessor, _ml_predictor, _cnn_predictor, _llm
+    """Get the models of the active bundle and the LLM client"""
+    bundle = model_registry.current()
+    return bundle.preprocessor, bundle.ml_predictor, bundle.cnn_predictor, get_llm()
+
+# Reports beyond this many in flight get the templated report instead of queueing for Gemini
+_report_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENT_REPORTS)
+
+def _verdict_label(affected: Optional[bool]) -> str:
+    if affected is None:
+        return "Not evaluated"
+    return "Affected" if affected else "Not Affected"
+
+def _llm_report(
+    image: Image.Image,
+    clinical_data: Dict[str, Any],
+    clinical_affected: Optional[bool],
+    image_affected: Optional[bool],
+    latitude: Optional[float],
+    longitude: Optional[float],
+    language: str,
+    temperature: Optional[float],
+    city: Optional[str]
+) -> str:
+    """Generate the LLM report, falling back to a templated report so the verdicts are kept"""
+    def model_label(affected: Optional[bool]) -> str:
+        if affected is None:
+            return "Not evaluated"
+        return "Lumpy" if affected else "Not Lumpy"
     
-    if _preprocessor is None or _ml_predictor is None or _cnn_predictor is None or _llm is None:
-        # If models aren't initialized yet, initialize them
-        initialize_models()
-    return _preprocessor, _ml_predictor, _cnn_predictor, _llm
+    # Format result string (similar to your original approach)
+    result = f"""
+        Lumpy Skin Disease Diagnostic Report:
+        
+        **ML Model Prediction:** {model_label(clinical_affected)}
+        **CNN Model Prediction:** {model_label(image_affected)}
+        
+        **Input Data:**
+        - Longitude: {clinical_data.get('longitude', longitude)}
+        - Latitude: {clinical_data.get('latitude', latitude)}
+        - Monthly Cloud Cover: {clinical_data.get('cloud_cover')}
+        - Potential EvapoTranspiration: {clinical_data.get('evapotranspiration')}
+        - Precipitation: {clinical_data.get('precipitation')}
+        - Minimum Temperature: {clinical_data.get('min_temp')}
+        - Mean Temperature: {clinical_data.get('mean_temp')}
+        - Maximum Temperature: {clinical_data.get('max_temp')}
+        - Vapour Pressure: {clinical_data.get('vapour_pressure')}
+        - Wet Day Frequency: {clinical_data.get('wet_day_freq')}
+        """
+    
+    def fallback() -> str:
+        REPORT_FALLBACKS.inc()
+        return build_templated_report(
+            image_affected=image_affected,
+            clinical_affected=clinical_affected,
+            clinical_data=clinical_data,
+            city=city,
+            temperature=temperature,
+        )
+    
+    if not _report_slots.acquire(blocking=False):
+        logger.warning("Too many LLM reports in flight, storing templated report instead")
+        return fallback()
+    try:
+        with time_stage("llm"):
+            return get_llm().inference(
+                image=image, result=result, language=language, temperature=temperature, city=city,
+                deadline=time.monotonic() + LLM_REPORT_DEADLINE_SECONDS
+            )
+    except Exception:
+        logger.warning("LLM report unavailable, storing templated report instead", exc_info=True)
+        return fallback()
+    finally:
+        _report_slots.release()
 
-def make_prediction(
-    db: Session,
-    user_id: int,
-    image: Image.Image,  # Image object for in-memory processing
+class InferenceResult(NamedTuple):
+    """Model outputs for one request, everything the report and the stored row need."""
+    clinical_data: Dict[str, Any]
+    city: Optional[str]
+    temperature: Optional[float]
+    clinical_score: Optional[float]
+    image_score: Optional[float]
+    combined_score: Optional[float]
+    clinical_affected: Optional[bool]
+    image_affected: Optional[bool]
+    embedding: Optional[np.ndarray]
+    clinical_model_version: Optional[str]
+    image_model_version: Optional[str]
+    mode: str
+
+def run_inference(
+    image: Optional[Image.Image],
     clinical_data: Dict[str, Any],
     latitude: float = None,
     longitude: float = None,
-    language: str = "English"
-) -> Prediction:
+    mode: str = "full"
+) -> InferenceResult:
+    """
+    Run the model stages of the pipeline for one request.
+
+    ``mode`` selects the stages: "full" and "screening" run both models
+    (screening skips the CNN when the clinical model is already confident),
+    "clinical" or "image" run a single model. Verdicts of stages that did
+    not run are None. Nothing here waits on Gemini, so callers can release
+    their admission slot before ``complete_prediction`` writes the report.
+    """
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode {mode!r}; expected one of {PIPELINE_MODES}")
     try:
-        # Get the already initialized models
-        preprocessor, ml_predictor, cnn_predictor, llm = get_models()
+        # Hold one bundle for the whole request so a concurrent hot swap cannot mix
+        # versions; the previous bundle stays alive until in-flight requests drop it
+        bundle = model_registry.current()
+        preprocessor, ml_predictor, cnn_predictor = bundle.preprocessor, bundle.ml_predictor, bundle.cnn_predictor
         
         # Get location data if coordinates provided
         city = None
         temperature = None
+        climate = None
         
         if latitude and longitude:
-            city = get_city_by_coords(latitude, longitude)
-            temperature = get_temperature_by_coords(latitude, longitude)
+            with time_stage("geocode"):
+                city = get_city_by_coords(latitude, longitude)
+            # Weather is shared per grid cell and day, so this is usually a cache hit
+            with time_stage("weather"):
+                climate = get_cell_climate(latitude, longitude)
+            temperature = climate.temperature if climate else None
         
-        # Prepare structured data input for ML model (extract from clinical_data dict)
-        structured_data = [
-            clinical_data.get('longitude', longitude),
-            clinical_data.get('latitude', latitude),
-            clinical_data.get('cloud_cover'),
-            clinical_data.get('evapotranspiration'),
-            clinical_data.get('precipitation'),
-            clinical_data.get('min_temp'),
-            clinical_data.get('mean_temp'),
-            clinical_data.get('max_temp'),
-            clinical_data.get('vapour_pressure'),
-            clinical_data.get('wet_day_freq')
-        ]
+        run_clinical = mode != "image"
+        run_image = mode != "clinical" and image is not None
+        clinical_score = None
+        image_score = None
+        embedding = None
+        
+        # Probabilities from the ML and CNN models; the hard labels are derived from them
+        # exactly as predict/argmax would, so no model runs twice
+        if run_clinical:
+            # Derive any climate features the client did not send
+            clinical_data = fill_missing_features(clinical_data, latitude, longitude, climate)
+            missing = [name for name in FEATURE_NAMES if clinical_data.get(name) is None]
+            if missing:
+                raise MissingFeaturesError(f"Missing clinical features: {', '.join(missing)}")
+            
+            # Prepare structured data input for ML model (extract from clinical_data dict)
+            structured_data = feature_vector(clinical_data)
+            
+            # Preprocess data
+            with time_stage("preprocess"):
+                preprocessed_data = preprocessor.preprocess(structured_data)
+            
+            with time_stage("random_forest"):
+                clinical_score = float(ml_predictor.predict_proba(preprocessed_data)[0])
+            
+            # A confident clinical verdict is enough for screening, so the CNN is skipped
+            if run_image and mode == "screening" and max(clinical_score, 1 - clinical_score) >= SCREEN_SKIP_IMAGE_CONFIDENCE:
+                run_image = False
+                STAGES_SKIPPED.labels(stage="cnn", reason="confident_clinical").inc()
         
-        # Preprocess data
-        preprocessed_data = preprocessor.preprocess(structured_data)
+        if run_image:
+            with time_stage("cnn"):
+                # Process image in memory; the embedding comes from the same forward pass
+                image_score, embedding = cnn_predictor.predict_with_embedding(image)
         
-        # Get predictions from ML and CNN models
-        ml_prediction = ml_predictor.predict(preprocessed_data)
-        cnn_prediction = cnn_predictor.predict(image)  # Process image in memory
+        combined_score = ensemble_scorer.combine(
+            np.nan if clinical_score is None else clinical_score,
+            np.nan if image_score is None else image_score
+        )
+        combined_score = None if np.isnan(combined_score) else float(combined_score)
+        clinical_affected = bool(clinical_verdict(clinical_score)) if clinical_score is not None else None
+        image_affected = bool(image_verdict(image_score)) if image_score is not None else None
         
         # Log the final predictions
-        logger.info(f"Final ML prediction (clinical model): {ml_prediction} - {'Affected' if ml_prediction == 1 else 'Not Affected'}")
-        logger.info(f"Final CNN prediction (image model): {cnn_prediction} - {'Affected' if cnn_prediction == 0 else 'Not Affected'}")
+        logger.info("Final ML prediction (clinical model): %s", _verdict_label(clinical_affected))
+        logger.info("Final CNN prediction (image model): %s", _verdict_label(image_affected))
+        logger.info("Scores: clinical %s, image %s, combined %s", clinical_score, image_score, combined_score)
         
-        # Format result string (similar to your original approach)
-        result = f"""
-        Lumpy Skin Disease Diagnostic Report:
+        return InferenceResult(
+            clinical_data=clinical_data,
+            city=city,
+            temperature=temperature,
+            clinical_score=clinical_score,
+            image_score=image_score,
+            combined_score=combined_score,
+            clinical_affected=clinical_affected,
+            image_affected=image_affected,
+            embedding=embedding,
+            clinical_model_version=ml_predictor.version if run_clinical else None,
+            image_model_version=cnn_predictor.version if run_image else None,
+            mode=mode,
+        )
         
-        **ML Model Prediction:** {'Lumpy' if ml_prediction == 1 else 'Not Lumpy'}
-        **CNN Model Prediction:** {'Lumpy' if cnn_prediction == 0 else 'Not Lumpy'}
+    except MissingFeaturesError:
+        raise
+    except Exception as e:
+        logger.error("Error in prediction function", exc_info=True)
+        raise PredictionError(f"Prediction function encountered an error: {str(e)}")
+
+def complete_prediction(
+    db: Session,
+    user_id: int,
+    inference: InferenceResult,
+    image: Optional[Image.Image],
+    latitude: float = None,
+    longitude: float = None,
+    language: str = "English",
+    content_hash: Optional[str] = None,
+    idempotency_key: Optional[str] = None
+) -> Prediction:
+    """
+    Write the report for a request's model outputs and store the prediction.
+
+    "full" requests get an LLM report, bounded by LLM_REPORT_DEADLINE_SECONDS
+    with the templated report as fallback; the other modes get a templated
+    summary.
+    """
+    try:
+        clinical_data, city, temperature = inference.clinical_data, inference.city, inference.temperature
+        clinical_affected, image_affected = inference.clinical_affected, inference.image_affected
+        combined_score, embedding, mode = inference.combined_score, inference.embedding, inference.mode
         
-        **Input Data:**
-        - Longitude: {clinical_data.get('longitude', longitude)}
-        - Latitude: {clinical_data.get('latitude', latitude)}
-        - Monthly Cloud Cover: {clinical_data.get('cloud_cover')}
-        - Potential EvapoTranspiration: {clinical_data.get('evapotranspiration')}
-        - Precipitation: {clinical_data.get('precipitation')}
-        - Minimum Temperature: {clinical_data.get('min_temp')}
-        - Mean Temperature: {clinical_data.get('mean_temp')}
-        - Maximum Temperature: {clinical_data.get('max_temp')}
-        - Vapour Pressure: {clinical_data.get('vapour_pressure')}
-        - Wet Day Frequency: {clinical_data.get('wet_day_freq')}
-        """
+        # Only full-mode predictions that are not clearly low risk are worth a Gemini report
+        use_llm = mode == "full" and not (combined_score is not None and combined_score < LLM_SKIP_BELOW_RISK)
         
-        # Generate LLM report using the LLM class
-        report = llm.inference(image=image, result=result, language=language, temperature=temperature, city=city)
+        # A near-identical photo with the same inputs already has a report worth reusing
+        duplicate = None
+        if use_llm and embedding is not None:
+            with time_stage("near_duplicate"):
+                duplicate = find_near_duplicate(
+                    db, user_id, embedding, inference.image_model_version, clinical_data,
+                    language, city, clinical_affected, image_affected
+                )
+        
+        report_html = None
+        if duplicate is not None:
+            STAGES_SKIPPED.labels(stage="llm", reason="near_duplicate").inc()
+            report, report_html = duplicate.report, duplicate.report_html
+        elif use_llm:
+            report = _llm_report(image, clinical_data, clinical_affected, image_affected,
+                                 latitude, longitude, language, temperature, city)
+        else:
+            STAGES_SKIPPED.labels(stage="llm", reason="low_risk" if mode == "full" else mode).inc()
+            report = build_templated_report(
+                image_affected=image_affected,
+                clinical_affected=clinical_affected,
+                clinical_data=clinical_data,
+                city=city,
+                temperature=temperature,
+                summary=True,
+            )
         
         # Create prediction record WITHOUT storing any image data
         prediction = Prediction(
             user_id=user_id,
             image_path=None,  # No image path stored
             clinical_features=clinical_data,
-            image_model_result=bool(cnn_prediction == 0),
-            clinical_model_result=bool(ml_prediction == 1),
+            image_model_result=image_affected,
+            clinical_model_result=clinical_affected,
+            clinical_model_version=inference.clinical_model_version,
+            image_model_version=inference.image_model_version,
+            clinical_score=inference.clinical_score,
+            image_score=inference.image_score,
+            combined_score=combined_score,
+            pipeline_mode=mode,
+            duplicate_of_id=duplicate.id if duplicate is not None else None,
             latitude=latitude,
             longitude=longitude,
             city=city,
             temperature=temperature,
             language=language,
-            report=report
+            report=report,
+            report_html=report_html or render_report_html(report)
         )
         
-        db.add(prediction)
-        db.commit()
-        db.refresh(prediction)
+        # Journaled and written to the database by the background writer; stored here
+        # only when write-behind is off
+        with time_stage("journal"):
+            try:
+                handed_off = prediction_writer.submit(
+                    prediction, content_hash, idempotency_key,
+                    affected_city=city if clinical_affected or image_affected else None,
+                    embedding=embedding
+                )
+            except IntegrityError:
+                raise DuplicateSubmissionError("Prediction already stored for this idempotency key")
         
-        # Update disease stats if disease detected
-        if ml_prediction == 1 or cnn_prediction == 0:
-            update_disease_stats(db, city)
+        if not handed_off:
+            with time_stage("db_commit"):
+                db.add(prediction)
+                if content_hash:
+                    # Stored in the same transaction so a prediction is never saved without its dedup record
+                    db.add(PredictionRequest(
+                        user_id=user_id,
+                        idempotency_key=idempotency_key,
+                        content_hash=content_hash,
+                        prediction=prediction
+                    ))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    raise DuplicateSubmissionError("Prediction already stored for this idempotency key")
+                db.refresh(prediction)
+                
+                # Update disease stats if disease detected
+                if clinical_affected or image_affected:
+                    update_disease_stats(db, city)
+            
+            # With write-behind, the writer indexes the embedding once the prediction is stored
+            if embedding is not None:
+                index_prediction(prediction, embedding)
         
         return prediction
         
+    except DuplicateSubmissionError:
+        raise
     except Exception as e:
         logger.error("Error in prediction function", exc_info=True)
         db.rollback()
         raise PredictionError(f"Prediction function encountered an error: {str(e)}")
 
+def make_prediction(
+    db: Session,
+    user_id: int,
+    image: Optional[Image.Image],  # Image object for in-memory processing; not needed in "clinical" mode
+    clinical_data: Dict[str, Any],
+    latitude: float = None,
+    longitude: float = None,
+    language: str = "English",
+    content_hash: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    mode: str = "full"
+) -> Prediction:
+    """Run the whole prediction pipeline for one request and store the result."""
+    inference = run_inference(image, clinical_data, latitude, longitude, mode)
+    return complete_prediction(
+        db, user_id, inference, image, latitude, longitude, language, content_hash, idempotency_key
+    )
+
 def update_disease_stats(db: Session, city: str):
     """Update disease stats for the given city"""
     if not city:
@@ -266,9 +604,88 @@ def update_disease_stats(db: Session, city: str):
     
     db.commit()
 
-def get_user_predictions(db: Session, user_id: int) -> List[Prediction]:
-    """Get all predictions for a user"""
-    return db.query(Prediction).filter(Prediction.user_id == user_id).order_by(Prediction.created_at.desc()).all()
+def _sort_predictions(predictions: List[Prediction], sort: str) -> List[Prediction]:
+    # Stored timestamps come back without the offset that pending ones still carry
+    predictions = sorted(
+        predictions, key=lambda p: p.created_at.replace(tzinfo=None) if p.created_at else datetime.datetime.min,
+        reverse=True
+    )
+    if sort == "risk":
+        predictions.sort(key=lambda p: (p.combined_score is None, -(p.combined_score or 0)))
+    return predictions
+
+def get_user_prediction_summaries(
+    db: Session,
+    user_id: int,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    sort: str = "recent",
+    include_pending: bool = False,
+) -> List[Prediction]:
+    """
+    Get a page of a user's predictions without the report columns, newest or highest risk (sort="risk") first.
+
+    With include_pending, predictions still waiting for the write-behind
+    writer are merged in as well.
+    """
+    # Taken before the query: a prediction written in between is then found at least once
+    pending = prediction_writer.pending_for_user(user_id) if include_pending else []
+    query = (
+        db.query(Prediction)
+        .options(load_only(
+            Prediction.id, Prediction.created_at, Prediction.city, Prediction.language,
+            Prediction.image_model_result, Prediction.clinical_model_result,
+            Prediction.combined_score
+        ))
+        .filter(Prediction.user_id == user_id)
+    )
+    if sort == "risk":
+        # Rows scored before ensemble scoring existed sort last
+        query = query.order_by(Prediction.combined_score.is_(None), Prediction.combined_score.desc())
+    query = query.order_by(Prediction.created_at.desc())
+    if not pending:
+        query = query.offset(offset)
+        return (query.limit(limit) if limit is not None else query).all()
+    # Pending predictions can land on any page, so merge from the top and slice the page out
+    predictions = (query.limit(offset + limit) if limit is not None else query).all()
+    stored = {prediction.id for prediction in predictions}
+    predictions = _sort_predictions(
+        predictions + [prediction for prediction in pending if prediction.id not in stored], sort
+    )
+    return predictions[offset:offset + limit] if limit is not None else predictions[offset:]
+
+def count_user_predictions(db: Session, user_id: int, include_pending: bool = False) -> int:
+    """Get the number of predictions a user has made"""
+    pending = {prediction.id for prediction in prediction_writer.pending_for_user(user_id)} if include_pending else set()
+    total = db.query(Prediction.id).filter(Prediction.user_id == user_id).count()
+    if pending:
+        # Some may have been written since they were looked up
+        total += len(pending) - db.query(Prediction.id).filter(Prediction.id.in_(pending)).count()
+    return total
+
+def get_prediction_report_html(db: Session, prediction_id: int, user_id: int) -> Optional[str]:
+    """
+    Get the rendered report HTML for one of the user's predictions.
+
+    Rows written before reports were pre-rendered are rendered on first
+    access and stored so later requests are served as is.
+    """
+    # Not in the database until the write-behind writer gets to it
+    pending = prediction_writer.pending_prediction(prediction_id)
+    if pending is not None:
+        return pending.report_html if pending.user_id == user_id else None
+    prediction = (
+        db.query(Prediction)
+        .options(load_only(Prediction.id, Prediction.report, Prediction.report_html))
+        .filter(Prediction.id == prediction_id, Prediction.user_id == user_id)
+        .first()
+    )
+    if prediction is None:
+        return None
+    if prediction.report_html is None:
+        prediction.report_html = render_report_html(prediction.report)
+        db.commit()
+    return prediction.report_html
 
 def get_city_disease_count(db: Session, city: str) -> int:
     """Get disease count for a city"""
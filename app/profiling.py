@@ -0,0 +1,221 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from .config import (
+    PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_SLOW_SAMPLE_RATE, PROFILE_INTERVAL_MS, PROFILE_DIR,
+    PROFILE_MAX_FILES
+)
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Leaf frames in these modules mean the thread is parked, not doing work
+_IDLE_MODULES = ('threading.py', 'selectors.py', 'queue.py', 'base_events.py')
+_PROFILE_NAME = re.compile(r'^[\w.-]+\.collapsed$')
+
+
+class ProfileStore:
+    """Bounded on-disk ring of profile files; the oldest files are evicted first."""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, name: str, content: str) -> str:
+        """Atomically write a profile and evict old ones beyond ``max_files``."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        with self._lock:
+            files = self.list()
+            for stale in files[self.max_files:]:
+                try:
+                    os.remove(os.path.join(self.directory, stale['name']))
+                except FileNotFoundError:
+                    pass
+        return path
+
+    def list(self) -> List[Dict]:
+        """Profiles newest first with size and modification time."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and _PROFILE_NAME.match(entry.name):
+                stat = entry.stat()
+                entries.append({
+                    'name': entry.name,
+                    'size_bytes': stat.st_size,
+                    'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                })
+        entries.sort(key=lambda item: item['created_at'], reverse=True)
+        return entries
+
+    def path_for(self, name: str) -> Optional[str]:
+        """Resolve a profile name to a path, rejecting anything outside the store."""
+        if not _PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+class _Session:
+    """Samples collected on behalf of one request."""
+
+    __slots__ = ('stacks', 'samples')
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+
+
+class StackSampler:
+    """
+    Process-wide wall-clock stack sampler.
+
+    A single background thread snapshots every thread's Python stack at a
+    fixed interval while at least one request is being profiled, and adds
+    each busy stack to all open sessions. Sampling every thread rather than
+    the request's own means work handed to the threadpool (model inference,
+    database calls) is captured too; under concurrency a session therefore
+    also contains stacks from overlapping requests.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+
+    def start_session(self) -> _Session:
+        session = _Session()
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        return session
+
+    def stop_session(self, session: _Session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._sessions:
+                    self._wakeup.wait()
+            stacks = self._collect(own_id)
+            with self._lock:
+                for session in self._sessions:
+                    session.samples += 1
+                    session.stacks.update(stacks)
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _collect(own_id: int) -> List[str]:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or os.path.basename(frame.f_code.co_filename) in _IDLE_MODULES:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            frames.append(f"thread:{names.get(thread_id, thread_id)}")
+            stacks.append(';'.join(reversed(frames)))
+        return stacks
+
+
+def _render(session: _Session, method: str, path: str, status: int, duration_ms: float, reason: str) -> str:
+    """Collapsed-stack output (flamegraph.pl / speedscope compatible) with a comment header."""
+    header = [
+        f"# request: {method} {path}",
+        f"# status: {status}",
+        f"# duration_ms: {duration_ms:.1f}",
+        f"# reason: {reason}",
+        f"# samples: {session.samples} every {PROFILE_INTERVAL_MS}ms",
+    ]
+    body = [f"{stack} {count}" for stack, count in session.stacks.most_common()]
+    return '\n'.join(header + body) + '\n'
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in ASGI middleware that profiles a sample of requests.
+
+    A request is profiled when it falls within ``PROFILE_SAMPLE_RATE`` or,
+    if ``PROFILE_SLOW_MS`` is set, within ``PROFILE_SLOW_SAMPLE_RATE``; the
+    latter profiles are kept only when the request turns out slower than the
+    threshold. Sampling a fraction keeps the stack sampler off most requests,
+    and profiles are rendered and written in the threadpool.
+    """
+
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, slow_ms: float = PROFILE_SLOW_MS,
+                 slow_sample_rate: float = PROFILE_SLOW_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.slow_sample_rate = slow_sample_rate if slow_ms > 0 else 0.0
+        self.enabled = sample_rate > 0 or self.slow_sample_rate > 0
+        self.sampler = StackSampler(PROFILE_INTERVAL_MS / 1000.0)
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["path"] in ("/metrics",) \
+                or scope["path"].startswith(("/static", "/api/admin/profiles")):
+            await self.app(scope, receive, send)
+            return
+
+        draw = random.random()
+        sampled = draw < self.sample_rate
+        if not sampled and draw >= self.sample_rate + self.slow_sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        session = self.sampler.start_session()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.sampler.stop_session(session)
+            duration_ms = (time.perf_counter() - start) * 1000
+            slow = self.slow_ms > 0 and duration_ms >= self.slow_ms
+            if (sampled or slow) and session.samples:
+                await run_in_threadpool(
+                    self._store, session, scope, status_holder["status"], duration_ms, 'slow' if slow else 'sampled'
+                )
+
+    def _store(self, session: _Session, scope, status: int, duration_ms: float, reason: str):
+        slug = re.sub(r'[^\w]+', '_', scope["path"]).strip('_')[:40] or 'root'
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{reason}-{int(duration_ms)}ms-{scope['method']}-{slug}.collapsed"
+        try:
+            profile_store.save(name, _render(session, scope["method"], scope["path"], status, duration_ms, reason))
+            logger.info("Stored %s profile %s", reason, name)
+        except OSError:
+            logger.error("Failed to store request profile", exc_info=True)
+
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
@@ -0,0 +1,272 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from fastapi import HTTPException, Request, status
+from .config import (
+    RATE_LIMIT_PREDICT_USER, RATE_LIMIT_PREDICT_IP, RATE_LIMIT_PREDICT_GLOBAL,
+    RATE_LIMIT_LOGIN, RATE_LIMIT_SIGNUP, RATE_LIMIT_REDIS_URL, TRUST_FORWARDED_FOR,
+    PREDICT_MAX_CONCURRENCY, PREDICT_MAX_QUEUE, PREDICT_QUEUE_TIMEOUT
+)
+from .metrics import RATE_LIMITED, ADMISSION_REJECTED, ADMISSION_QUEUE_DEPTH
+from .models import User
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Policy(NamedTuple):
+    """Token bucket parameters: ``capacity`` tokens, refilled at ``rate`` tokens per second."""
+    name: str
+    capacity: float
+    rate: float
+
+
+def parse_policy(name: str, spec: str) -> Policy:
+    """Parse a "<requests>/<period>" spec such as "10/minute" into a Policy."""
+    count, _, period = spec.partition("/")
+    seconds = _PERIODS.get(period.strip().lower())
+    if seconds is None:
+        seconds = float(period)
+    capacity = float(count)
+    return Policy(name, capacity, capacity / seconds)
+
+
+class InMemoryBackend:
+    """Token buckets held in process memory; correct for a single worker process."""
+
+    # Idle buckets are pruned once the map grows past this size
+    MAX_BUCKETS = 100_000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, policy: Policy, cost: float = 1.0) -> Tuple[bool, float]:
+        limiting, retry_after = self.acquire_all([(key, policy)], cost)
+        return limiting is None, retry_after
+
+    def acquire_all(self, limits: Sequence[Tuple[str, Policy]], cost: float = 1.0) -> Tuple[Optional[int], float]:
+        """
+        Take ``cost`` tokens from every bucket in ``limits``, or from none of them.
+
+        Returns:
+            tuple: (index of the bucket that refused, or None when all had enough; seconds to wait)
+        """
+        now = time.monotonic()
+        with self._lock:
+            refilled: List[float] = []
+            limiting, retry_after = None, 0.0
+            for index, (key, policy) in enumerate(limits):
+                tokens, updated, _ = self._buckets.get(key, (policy.capacity, now, 0.0))
+                tokens = min(policy.capacity, tokens + (now - updated) * policy.rate)
+                refilled.append(tokens)
+                if tokens < cost and (cost - tokens) / policy.rate > retry_after:
+                    limiting, retry_after = index, (cost - tokens) / policy.rate
+            charge = cost if limiting is None else 0.0
+            for (key, policy), tokens in zip(limits, refilled):
+                # Time after which an untouched bucket is full again and can be forgotten
+                self._buckets[key] = (tokens - charge, now, policy.capacity / policy.rate)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._prune(now)
+        return limiting, retry_after
+
+    def _prune(self, now: float):
+        # Buckets idle long enough to have refilled completely carry no state
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < v[2]}
+
+
+class RedisBackend:
+    """
+    Token buckets shared by all workers and nodes through Redis.
+
+    The refill-and-take step for all buckets of a request runs as one Lua
+    script, so it is atomic across clients and either every bucket is
+    charged or none is.
+    """
+
+    _SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local cost = tonumber(ARGV[2])
+    local tokens = {}
+    local limiting = 0
+    local retry_after = 0
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[1 + 2 * i])
+        local rate = tonumber(ARGV[2 + 2 * i])
+        local state = redis.call('HMGET', key, 'tokens', 'updated')
+        local available = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        available = math.min(capacity, available + math.max(0, now - updated) * rate)
+        tokens[i] = available
+        if available < cost and (cost - available) / rate > retry_after then
+            limiting = i
+            retry_after = (cost - available) / rate
+        end
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[1 + 2 * i])
+        local rate = tonumber(ARGV[2 + 2 * i])
+        if limiting == 0 then
+            tokens[i] = tokens[i] - cost
+        end
+        redis.call('HSET', key, 'tokens', tokens[i], 'updated', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+    return {limiting, tostring(retry_after)}
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self._SCRIPT)
+
+    def acquire(self, key: str, policy: Policy, cost: float = 1.0) -> Tuple[bool, float]:
+        limiting, retry_after = self.acquire_all([(key, policy)], cost)
+        return limiting is None, retry_after
+
+    def acquire_all(self, limits: Sequence[Tuple[str, Policy]], cost: float = 1.0) -> Tuple[Optional[int], float]:
+        args = [time.time(), cost]
+        for _, policy in limits:
+            args += [policy.capacity, policy.rate]
+        limiting, retry_after = self._script(keys=[f"ratelimit:{key}" for key, _ in limits], args=args)
+        # Lua indexes from 1; 0 means every bucket had enough tokens
+        return (int(limiting) - 1 if int(limiting) else None), float(retry_after)
+
+
+class RateLimiter:
+    """Applies named token-bucket policies against a pluggable backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def check(self, policy: Policy, identity: str):
+        """
+        Take one token from ``identity``'s bucket for ``policy``.
+
+        Raises:
+            HTTPException: 429 with Retry-After when the bucket is empty
+        """
+        self.check_all([(policy, identity)])
+
+    def check_all(self, limits: Sequence[Tuple[Policy, str]]):
+        """
+        Take one token from each (policy, identity) bucket, only if every one of them has a token.
+
+        A request refused by one policy therefore never drains the others.
+
+        Raises:
+            HTTPException: 429 with Retry-After when any bucket is empty
+        """
+        try:
+            limiting, retry_after = self.backend.acquire_all(
+                [(f"{policy.name}:{identity}", policy) for policy, identity in limits]
+            )
+        except Exception:
+            # A broken shared backend must not take the API down with it
+            logger.error("Rate limit backend failed; allowing request", exc_info=True)
+            return
+        if limiting is not None:
+            RATE_LIMITED.labels(policy=limits[limiting][0].name).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests. Please try again later.",
+                headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+            )
+
+
+class AdmissionController:
+    """
+    Bounds concurrent work on an expensive route within one worker.
+
+    Up to ``max_concurrency`` requests run at once and up to ``max_queue``
+    more may wait, each for at most ``queue_timeout`` seconds. Anything
+    beyond that is rejected with 503 straight away so clients back off
+    instead of piling up behind a saturated worker.
+    """
+
+    def __init__(self, route: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.route = route
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+
+    def _reject(self, reason: str):
+        ADMISSION_REJECTED.labels(route=self.route, reason=reason).inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy. Please retry shortly.",
+            headers={"Retry-After": "5"},
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                self._reject("queue_full")
+            self._waiting += 1
+            ADMISSION_QUEUE_DEPTH.labels(route=self.route).set(self._waiting)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout")
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUE_DEPTH.labels(route=self.route).set(self._waiting)
+        else:
+            await self._semaphore.acquire()
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+def client_ip(request: Request) -> str:
+    """Client address, honouring X-Forwarded-For only when configured to."""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+PREDICT_USER_POLICY = parse_policy("predict_user", RATE_LIMIT_PREDICT_USER)
+PREDICT_IP_POLICY = parse_policy("predict_ip", RATE_LIMIT_PREDICT_IP)
+PREDICT_GLOBAL_POLICY = parse_policy("predict_global", RATE_LIMIT_PREDICT_GLOBAL)
+LOGIN_POLICY = parse_policy("login", RATE_LIMIT_LOGIN)
+SIGNUP_POLICY = parse_policy("signup", RATE_LIMIT_SIGNUP)
+
+rate_limiter = RateLimiter(RedisBackend(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else InMemoryBackend())
+
+predict_admission = AdmissionController(
+    "/api/predict", PREDICT_MAX_CONCURRENCY, PREDICT_MAX_QUEUE, PREDICT_QUEUE_TIMEOUT
+)
+
+
+def charge_prediction(request: Request, current_user: User):
+    """
+    Charge a new prediction to the per-user, per-IP and global budgets.
+
+    Called only once a submission is known to need the pipeline, so replayed
+    retries are free; a request refused by any budget charges none of them.
+    """
+    rate_limiter.check_all([
+        (PREDICT_USER_POLICY, str(current_user.id)),
+        (PREDICT_IP_POLICY, client_ip(request)),
+        (PREDICT_GLOBAL_POLICY, "all"),
+    ])
+
+
+def limit_login(request: Request):
+    """Dependency enforcing the per-IP login budget."""
+    rate_limiter.check(LOGIN_POLICY, client_ip(request))
+
+
+def limit_signup(request: Request):
+    """Dependency enforcing the per-IP signup budget."""
+    rate_limiter.check(SIGNUP_POLICY, client_ip(request))
@@ -0,0 +1,268 @@
+import datetime
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+from .config import MODELS_DIR, MODEL_VERSION, MODEL_WATCH_SECONDS
+from .features import FEATURE_NAMES
+from .metrics import MODEL_SWAPS
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+ARTIFACTS = ("scaler_object.joblib", "randomforest_best_model.pkl", "mobilenet_lumpy_skin_model.h5")
+
+# Version name for artifacts stored directly in the models directory (the pre-registry layout)
+ROOT_VERSION = "root"
+
+# File in the models directory naming the version workers should serve
+CURRENT_FILE = "CURRENT"
+
+
+class ModelBundle:
+    """
+    One fully loaded, immutable set of models from a single artifact version.
+
+    Requests take a reference to the active bundle and use it throughout, so
+    swapping in a new bundle never changes the models under a running request.
+    """
+
+    def __init__(self, version: str, path: str):
+        # Imported here because prediction.py depends on this module
+        from .prediction import DataPreprocessor, ML_Model_Predictor, CNN_Model_Predictor
+
+        self.version = version
+        self.path = path
+        self.preprocessor = DataPreprocessor(path)
+        self.ml_predictor = ML_Model_Predictor(path)
+        self.cnn_predictor = CNN_Model_Predictor(path)
+        self.loaded_at = datetime.datetime.utcnow()
+
+    def warm(self):
+        """
+        Validate the models and run one prediction through each of them.
+
+        Catches incompatible artifacts before they serve traffic and pays
+        TensorFlow's first-call graph tracing outside the request path.
+
+        Raises:
+            ModelLoadingError: If an artifact does not match the expected interface
+        """
+        from .prediction import ModelLoadingError
+
+        expected = len(FEATURE_NAMES)
+        n_features = getattr(self.ml_predictor.model, "n_features_in_", expected)
+        if n_features != expected:
+            raise ModelLoadingError(f"Random forest expects {n_features} features, not {expected}")
+        output_shape = getattr(self.cnn_predictor.model, "output_shape", None)
+        if output_shape is not None and output_shape[-1] != 2:
+            raise ModelLoadingError(f"CNN output shape {output_shape} is not two-class")
+
+        scaled = self.preprocessor.preprocess([0.0] * expected)
+        self.ml_predictor.predict(scaled)
+        self.cnn_predictor.predict_with_embedding(Image.new("RGB", (224, 224)))
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "clinical_model_version": self.ml_predictor.version,
+            "image_model_version": self.cnn_predictor.version,
+            "loaded_at": self.loaded_at.isoformat(),
+        }
+
+
+class ModelRegistry:
+    """
+    Discovers versioned model artifacts and hot-swaps the active bundle.
+
+    Versions are subdirectories of the models directory containing every
+    artifact; artifacts placed directly in the directory form the "root"
+    version. New versions are loaded, validated and warmed off the request
+    path, then activated with a single reference swap.
+    """
+
+    def __init__(self, root: str = MODELS_DIR):
+        self.root = root
+        self._active: Optional[ModelBundle] = None
+        self._load_lock = threading.Lock()
+        self._watch_stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.status: Dict[str, Any] = {"state": "idle", "version": None, "error": None}
+
+    def _is_complete(self, path: str) -> bool:
+        return all(os.path.isfile(os.path.join(path, name)) for name in ARTIFACTS)
+
+    def available(self) -> List[str]:
+        """Versions with a complete set of artifacts, oldest name first."""
+        versions = [ROOT_VERSION] if self._is_complete(self.root) else []
+        if os.path.isdir(self.root):
+            versions += sorted(
+                entry.name for entry in os.scandir(self.root)
+                if entry.is_dir() and self._is_complete(entry.path)
+            )
+        return versions
+
+    def promoted_version(self) -> Optional[str]:
+        """Version named by the CURRENT file, if there is one."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def resolve(self, version: Optional[str] = None) -> Tuple[str, str]:
+        """
+        Resolve a version name to its artifact directory.
+
+        Args:
+            version: Version to resolve; defaults to MODEL_VERSION, then the
+                CURRENT file, then the root artifacts, then the newest version
+
+        Returns:
+            Tuple[str, str]: (version, directory)
+
+        Raises:
+            ModelLoadingError: If the version does not exist or is incomplete
+        """
+        from .prediction import ModelLoadingError
+
+        if version is None:
+            version = MODEL_VERSION or self.promoted_version()
+        if version is None:
+            available = self.available()
+            if not available:
+                raise ModelLoadingError(f"No complete model artifacts found in {self.root}")
+            version = ROOT_VERSION if ROOT_VERSION in available else available[-1]
+
+        if version == ROOT_VERSION:
+            path = self.root
+        elif os.path.basename(version) != version or version.startswith("."):
+            raise ModelLoadingError(f"Invalid model version name: {version}")
+        else:
+            path = os.path.join(self.root, version)
+        if not self._is_complete(path):
+            raise ModelLoadingError(f"Model version {version} is missing artifacts")
+        return version, path
+
+    def load(self, version: Optional[str] = None, promote: bool = False) -> ModelBundle:
+        """
+        Load, validate and warm a version, then make it the active bundle.
+
+        Args:
+            version: Version to load; see ``resolve`` for the default
+            promote: Also write the CURRENT file so other workers follow
+
+        Returns:
+            ModelBundle: The newly active bundle
+        """
+        with self._load_lock:
+            return self._load_locked(version, promote)
+
+    def _load_locked(self, version: Optional[str], promote: bool) -> ModelBundle:
+        self.status = {"state": "loading", "version": version, "error": None}
+        try:
+            version, path = self.resolve(version)
+            logger.info("Loading model version %s from %s", version, path)
+            bundle = ModelBundle(version, path)
+            bundle.warm()
+        except Exception as e:
+            MODEL_SWAPS.labels(outcome="failed").inc()
+            self.status = {"state": "failed", "version": version, "error": str(e)}
+            logger.error("Model version %s failed to load; keeping the active bundle", version, exc_info=True)
+            raise
+
+        previous, self._active = self._active, bundle
+        if promote:
+            self._write_current(version)
+        MODEL_SWAPS.labels(outcome="activated").inc()
+        self.status = {"state": "idle", "version": version, "error": None}
+        logger.info(
+            "Activated model version %s (previous %s)",
+            version, previous.version if previous else None
+        )
+        return bundle
+
+    def load_in_background(self, version: Optional[str] = None, promote: bool = False) -> bool:
+        """
+        Start loading a version on a background thread.
+
+        Returns:
+            bool: False if another load is already in progress
+        """
+        # Claimed here rather than in the thread so concurrent callers cannot both start a load
+        if not self._load_lock.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self._load_locked(version, promote)
+            except Exception:
+                pass  # Already logged and recorded in status
+            finally:
+                self._load_lock.release()
+
+        try:
+            threading.Thread(target=run, name="model-loader", daemon=True).start()
+        except BaseException:
+            self._load_lock.release()
+            raise
+        return True
+
+    def _write_current(self, version: str):
+        path = os.path.join(self.root, CURRENT_FILE)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(version)
+        os.replace(temp_path, path)
+
+    def current(self) -> ModelBundle:
+        """
+        The active bundle.
+
+        Raises:
+            ModelLoadingError: If no version has been loaded; the app loads one at
+                startup so requests never pay for a model load
+        """
+        bundle = self._active
+        if bundle is None:
+            from .prediction import ModelLoadingError
+
+            raise ModelLoadingError("No model version is loaded")
+        return bundle
+
+    def clear(self):
+        self.stop_watching()
+        self._active = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "active": self._active.describe() if self._active else None,
+            "available": self.available(),
+            "promoted": self.promoted_version(),
+            "loader": self.status,
+        }
+
+    def start_watching(self, interval: float = MODEL_WATCH_SECONDS):
+        """Poll the CURRENT file and hot-swap when another worker promotes a version."""
+        if interval <= 0 or MODEL_VERSION or self._watcher is not None:
+            return
+        self._watch_stop.clear()
+
+        def watch():
+            while not self._watch_stop.wait(interval):
+                promoted = self.promoted_version()
+                active = self._active
+                failed = self.status["state"] == "failed" and self.status["version"] == promoted
+                if promoted and active is not None and promoted != active.version and not failed:
+                    logger.info("Model version %s was promoted; loading it", promoted)
+                    self.load_in_background(promoted)
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._watch_stop.set()
+        self._watcher = None
+
+
+model_registry = ModelRegistry()
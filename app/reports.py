@@ -0,0 +1,134 @@
+import re
+from typing import Any, Dict, Optional
+import markdown
+import nh3
+
+# Tags and attributes allowed in rendered report HTML; everything else is stripped
+ALLOWED_TAGS = {
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'br', 'hr', 'strong', 'em', 'b', 'i',
+    'ul', 'ol', 'li', 'blockquote', 'code', 'pre', 'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+ALLOWED_ATTRIBUTES = {'th': {'align'}, 'td': {'align'}}
+
+_MARKDOWN_HEADING = re.compile(r'^#{1,6}\s')
+_LIST_ITEM = re.compile(r'^([*+-]|\d+\.)\s')
+
+# Clinical feature keys with the labels used in reports
+FEATURE_LABELS = (
+    ('longitude', 'Longitude'),
+    ('latitude', 'Latitude'),
+    ('cloud_cover', 'Monthly Cloud Cover'),
+    ('evapotranspiration', 'Potential EvapoTranspiration'),
+    ('precipitation', 'Precipitation'),
+    ('min_temp', 'Minimum Temperature'),
+    ('mean_temp', 'Mean Temperature'),
+    ('max_temp', 'Maximum Temperature'),
+    ('vapour_pressure', 'Vapour Pressure'),
+    ('wet_day_freq', 'Wet Day Frequency'),
+)
+
+
+def _verdict(affected: Optional[bool]) -> str:
+    if affected is None:
+        return "Not evaluated"
+    return "Lumpy Skin Disease indicated" if affected else "No Lumpy Skin Disease indicated"
+
+
+def build_templated_report(
+    image_affected: Optional[bool],
+    clinical_affected: Optional[bool],
+    clinical_data: Dict[str, Any],
+    city: Optional[str] = None,
+    temperature: Optional[float] = None,
+    summary: bool = False,
+) -> str:
+    """
+    Build a markdown report from the model results without calling the LLM.
+
+    Used when the LLM is unavailable so a prediction is never lost, and
+    follows the heading layout the LLM is prompted to produce. With
+    ``summary`` it is the short report for requests that asked for no LLM
+    report, so the input listing is left out.
+
+    Args:
+        image_affected: CNN verdict, or None if the image model did not run
+        clinical_affected: Random Forest verdict, or None if it did not run
+        clinical_data: Clinical/climate features submitted with the request
+        city: Location of the case
+        temperature: Local temperature in Celsius
+        summary: Produce the short screening summary instead of the LLM fallback
+    """
+    any_affected = bool(image_affected) or bool(clinical_affected)
+    lines = [
+        "# Diagnostic Report",
+        "",
+        "## Prediction Summary",
+        f"- **Image analysis (CNN):** {_verdict(image_affected)}",
+        f"- **Clinical analysis (Random Forest):** {_verdict(clinical_affected)}",
+        f"- **Location:** {city or 'not specified'}",
+        f"- **Current temperature:** {f'{temperature}°C' if temperature is not None else 'not available'}",
+    ]
+    if not summary:
+        lines += ["", "## Input Data"]
+        for key, label in FEATURE_LABELS:
+            value = clinical_data.get(key)
+            lines.append(f"- {label}: {value if value is not None else 'not provided'}")
+
+    lines += ["", "## Management Recommendations"]
+    if any_affected:
+        lines += [
+            "- **Isolate the animal** from the herd and restrict animal movement.",
+            "- Control biting insects (flies, mosquitoes, ticks) around the premises.",
+            "- Contact a veterinarian promptly to confirm the diagnosis and plan treatment.",
+            "- Vaccinate in-contact animals if advised by local veterinary services.",
+        ]
+    else:
+        lines += [
+            "- Continue routine monitoring of the herd for skin nodules, fever or reduced milk yield.",
+            "- Maintain vector control and biosecurity measures.",
+            "- Consult a veterinarian if any symptoms appear.",
+        ]
+    if summary:
+        note = "*This is a screening summary generated from the model results; a detailed AI report was not needed for this request.*"
+    else:
+        note = "*This is an automated summary generated from the model results; the detailed AI report was not available.*"
+    lines += ["", note]
+    return "\n".join(lines)
+
+
+def convert_to_markdown(report_text: Optional[str]) -> str:
+    """
+    Normalise LLM report text to markdown.
+
+    Lines wrapped entirely in ``**`` are promoted to level 2 headings, and a
+    blank line is inserted before a list that directly follows a paragraph
+    (marked renders those as lists, Python-Markdown does not).
+    """
+    if not report_text:
+        return ''
+
+    markdown_lines = []
+    for line in report_text.split('\n'):
+        stripped = line.strip()
+        if (_LIST_ITEM.match(stripped) and markdown_lines and markdown_lines[-1].strip()
+                and not _LIST_ITEM.match(markdown_lines[-1].strip())):
+            markdown_lines.append('')
+        if _MARKDOWN_HEADING.match(stripped):
+            markdown_lines.append(line)
+        elif len(stripped) > 4 and stripped.startswith('**') and stripped.endswith('**'):
+            markdown_lines.append(f"## {stripped[2:-2]}")
+        elif stripped:
+            markdown_lines.append(line)
+        else:
+            markdown_lines.append('')
+    return '\n'.join(markdown_lines)
+
+
+def render_report_html(report_text: Optional[str]) -> str:
+    """Render a report to sanitized HTML, ready to insert into the page as is."""
+    html = markdown.markdown(
+        convert_to_markdown(report_text),
+        extensions=['tables', 'sane_lists'],
+        output_format='html',
+    )
+    return nh3.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES)
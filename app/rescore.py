@@ -0,0 +1,307 @@
+"""
+Re-score stored predictions after the clinical model artifacts change.
+
+Usage:
+    python -m app.rescore [--chunk-size N] [--checkpoint PATH] [--force] [--dry-run] [--model-version V]
+
+Rows are read in primary-key order with keyset pagination, so each chunk is
+an index range scan and memory stays bounded by the chunk size no matter how
+many predictions exist. Each chunk is scaled and scored in a single
+vectorized call, written back with one bulk update, and committed together
+with the matching disease-stats corrections before the checkpoint advances.
+Interrupted runs resume from the checkpoint, and rows already stamped with
+the current ``clinical_model_version`` are skipped. Rows stored without some
+climate features are filled from the weather of their grid cell, as a live
+request would be; rows that still cannot be scored are counted as skipped.
+
+Only the clinical model can be replayed: uploaded images are never stored,
+so ``image_model_result`` is left as it was.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from .config import RESCORE_CHUNK_SIZE, RESCORE_CHECKPOINT
+from .database import SessionLocal, Base, engine, migrate_schema
+from .features import FEATURE_NAMES, feature_vector, fill_missing_features, get_cell_climates
+from .models import Prediction
+from .prediction import DataPreprocessor, ML_Model_Predictor
+from .registry import model_registry
+from .write_behind import apply_stats_deltas
+from .runtime import configure_runtime
+from .scoring import ensemble_scorer, clinical_verdict
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def load_checkpoint(path: str, model_version: str) -> int:
+    """
+    Last prediction id processed by an earlier run for ``model_version``.
+
+    A checkpoint written for a different model version is ignored, since
+    every row has to be re-scored against the new artifacts.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("model_version") != model_version:
+        logger.info("Ignoring checkpoint for model version %s", state.get("model_version"))
+        return 0
+    return int(state.get("last_id", 0))
+
+
+def save_checkpoint(path: str, model_version: str, last_id: int, totals: Dict[str, int]):
+    """Write the checkpoint atomically so a crash never leaves it half written."""
+    state = {
+        "model_version": model_version,
+        "last_id": last_id,
+        "updated_at": datetime.datetime.utcnow().isoformat(),
+        **totals,
+    }
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def fetch_chunk(db: Session, after_id: int, chunk_size: int, model_version: str, force: bool) -> List[Tuple]:
+    """
+    Next chunk of rows with ``id > after_id``, in id order.
+
+    Only the columns needed for scoring are selected; memory is bounded by
+    ``chunk_size``. Rows already scored by ``model_version`` are filtered out
+    unless ``force`` is set.
+    """
+    query = (
+        db.query(
+            Prediction.id,
+            Prediction.clinical_features,
+            Prediction.clinical_model_result,
+            Prediction.image_model_result,
+            Prediction.image_score,
+            Prediction.city,
+            Prediction.latitude,
+            Prediction.longitude,
+        )
+        .filter(Prediction.id > after_id)
+        # Image-only predictions never had a clinical verdict to replay
+        .filter(or_(Prediction.pipeline_mode.is_(None), Prediction.pipeline_mode != "image"))
+    )
+    if not force:
+        query = query.filter(or_(
+            Prediction.clinical_model_version.is_(None),
+            Prediction.clinical_model_version != model_version,
+        ))
+    return query.order_by(Prediction.id).limit(chunk_size).all()
+
+
+def _stored_features(row) -> Optional[Dict[str, Any]]:
+    clinical_data = row.clinical_features
+    if isinstance(clinical_data, str):
+        clinical_data = json.loads(clinical_data)
+    return clinical_data if isinstance(clinical_data, dict) else None
+
+
+def fill_rows(rows: List[Tuple]) -> Dict[int, Dict[str, Any]]:
+    """
+    Derive missing climate features for ``rows``, as the live pipeline does.
+
+    Weather for every grid cell involved is fetched in one batch through
+    ``get_cell_climates``, so it reflects the conditions at re-scoring time
+    rather than when the prediction was made.
+
+    Returns:
+        Dict[int, Dict[str, Any]]: Filled features by row position, for rows that were incomplete
+    """
+    incomplete = []
+    for position, row in enumerate(rows):
+        clinical_data = _stored_features(row)
+        if clinical_data is None or all(clinical_data.get(name) is not None for name in FEATURE_NAMES):
+            continue
+        latitude = clinical_data.get("latitude") if clinical_data.get("latitude") is not None else row.latitude
+        longitude = clinical_data.get("longitude") if clinical_data.get("longitude") is not None else row.longitude
+        if latitude is None or longitude is None:
+            continue
+        incomplete.append((position, clinical_data, float(latitude), float(longitude)))
+    if not incomplete:
+        return {}
+
+    climates = get_cell_climates([(latitude, longitude) for _, _, latitude, longitude in incomplete])
+    filled = {}
+    for (position, clinical_data, latitude, longitude), climate in zip(incomplete, climates):
+        if climate is not None:
+            filled[position] = fill_missing_features(clinical_data, latitude, longitude, climate)
+    return filled
+
+
+def feature_matrix(rows: List[Tuple], filled: Optional[Dict[int, Dict[str, Any]]] = None) -> Tuple[np.ndarray, List[int]]:
+    """
+    Stack the clinical features of ``rows`` into a float matrix.
+
+    Args:
+        rows: Rows from fetch_chunk
+        filled: Features to use instead of the stored ones, by row position (see fill_rows)
+
+    Returns:
+        tuple: (matrix, positions of the rows it contains); rows with missing
+        or non-numeric features are left out
+    """
+    filled = filled or {}
+    vectors, positions = [], []
+    for position, row in enumerate(rows):
+        clinical_data = filled.get(position) or _stored_features(row)
+        if clinical_data is None:
+            continue
+        try:
+            vector = np.asarray(feature_vector(clinical_data), dtype=np.float64)
+        except (TypeError, ValueError):
+            continue
+        if np.isnan(vector).any():
+            continue
+        vectors.append(vector)
+        positions.append(position)
+    if not vectors:
+        return np.empty((0, 0)), positions
+    return np.vstack(vectors), positions
+
+
+def rescore(
+    chunk_size: int = RESCORE_CHUNK_SIZE,
+    checkpoint_path: str = RESCORE_CHECKPOINT,
+    force: bool = False,
+    dry_run: bool = False,
+    version: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Re-score every stored prediction against the current clinical model.
+
+    Args:
+        chunk_size: Rows read, scored and written per transaction
+        checkpoint_path: JSON file recording progress for resuming
+        force: Re-score rows already stamped with the current model version
+        dry_run: Score and report changes without writing anything
+        version: Model registry version to score with; defaults to the active one
+
+    Returns:
+        Dict[str, Any]: Model version and row counts for the run
+    """
+    version, models_dir = model_registry.resolve(version)
+    preprocessor = DataPreprocessor(models_dir)
+    ml_predictor = ML_Model_Predictor(models_dir)
+    model_version = ml_predictor.version
+
+    last_id = 0 if force else load_checkpoint(checkpoint_path, model_version)
+    totals = {"scanned": 0, "rescored": 0, "changed": 0, "filled": 0, "skipped": 0}
+    logger.info("Re-scoring predictions with clinical model %s from id %s", model_version, last_id)
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        while True:
+            rows = fetch_chunk(db, last_id, chunk_size, model_version, force)
+            if not rows:
+                break
+            last_id = rows[-1].id
+            totals["scanned"] += len(rows)
+
+            # Rows missing climate features are filled as a live request would be;
+            # those that still cannot be scored (no coordinates or weather) are skipped
+            filled = fill_rows(rows)
+            matrix, positions = feature_matrix(rows, filled)
+            totals["skipped"] += len(rows) - len(positions)
+            totals["filled"] += sum(position in filled for position in positions)
+
+            if positions:
+                scores = ml_predictor.predict_proba(preprocessor.preprocess_batch(matrix))
+                # Stored image scores are fused with the new clinical scores; no image is re-scored
+                image_scores = np.array(
+                    [np.nan if rows[p].image_score is None else rows[p].image_score for p in positions]
+                )
+                combined = ensemble_scorer.combine(scores, image_scores)
+                # Rows whose CNN verdict predates stored image scores cannot be fused consistently
+                fusable = [rows[p].image_score is not None or rows[p].image_model_result is None for p in positions]
+                results = clinical_verdict(scores)
+                mappings = []
+                deltas = defaultdict(int)
+                for index, position in enumerate(positions):
+                    row = rows[position]
+                    result = bool(results[index])
+                    mapping = {
+                        "id": row.id,
+                        "clinical_model_result": result,
+                        "clinical_model_version": model_version,
+                        "clinical_score": float(scores[index]),
+                        "combined_score": float(combined[index]) if fusable[index] else None,
+                    }
+                    if position in filled:
+                        # Keep the features the new score was computed from
+                        mapping["clinical_features"] = filled[position]
+                    mappings.append(mapping)
+                    if bool(row.clinical_model_result) != result:
+                        totals["changed"] += 1
+                        was_affected = bool(row.image_model_result) or bool(row.clinical_model_result)
+                        is_affected = bool(row.image_model_result) or result
+                        deltas[row.city] += int(is_affected) - int(was_affected)
+                totals["rescored"] += len(mappings)
+
+                if not dry_run:
+                    db.bulk_update_mappings(Prediction, mappings)
+                    apply_stats_deltas(db, deltas)
+                    db.commit()
+
+            if not dry_run:
+                save_checkpoint(checkpoint_path, model_version, last_id, totals)
+            elapsed = time.perf_counter() - started
+            logger.info(
+                "Re-scored through id %s: %s scanned, %s changed (%.0f rows/s)",
+                last_id, totals["scanned"], totals["changed"], totals["scanned"] / max(elapsed, 1e-9)
+            )
+    except Exception:
+        db.rollback()
+        logger.error("Re-scoring stopped at id %s; rerun to resume from the checkpoint", last_id, exc_info=True)
+        raise
+    finally:
+        db.close()
+
+    logger.info("Re-scoring complete: %s", totals)
+    return {"model_version": model_version, "last_id": last_id, "dry_run": dry_run, **totals}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Re-score stored predictions with the current clinical model.")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE,
+                        help="rows scored and written per transaction")
+    parser.add_argument("--checkpoint", default=RESCORE_CHECKPOINT,
+                        help="checkpoint file used to resume interrupted runs")
+    parser.add_argument("--force", action="store_true",
+                        help="start from the beginning and re-score rows already at the current version")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report how many results would change without writing")
+    parser.add_argument("--model-version",
+                        help="model registry version to score with (defaults to the active version)")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_runtime()
+    Base.metadata.create_all(bind=engine)
+    migrate_schema()
+    summary = rescore(
+        args.chunk_size, args.checkpoint, force=args.force, dry_run=args.dry_run, version=args.model_version
+    )
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
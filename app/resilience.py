@@ -0,0 +1,155 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Type, TypeVar
+from .config import (
+    CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+)
+from .metrics import CIRCUIT_STATE, record_external_error
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """Raised without calling the dependency while its circuit is open."""
+    pass
+
+class NonRetryableError(Exception):
+    """Wraps failures that retrying cannot fix (bad credentials, malformed requests)."""
+    pass
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls fail fast for ``reset_timeout`` seconds. The first call after that
+    window is let through as a trial (half-open); its outcome closes or
+    re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+                self._publish()
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Circuit %s closed", self.name)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+            self._publish()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Circuit %s opened after %d consecutive failures", self.name, self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                self._publish()
+
+    def _publish(self):
+        CIRCUIT_STATE.labels(dependency=self.name).set(self._STATE_VALUES[self._state])
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for a dependency."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff for the given zero-based retry attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def call_with_resilience(
+    dependency: str,
+    operation: str,
+    fn: Callable[[], T],
+    retries: int = 0,
+    non_retryable: Tuple[Type[BaseException], ...] = (NonRetryableError,),
+    breaker: Optional[CircuitBreaker] = None,
+    deadline: Optional[float] = None,
+) -> T:
+    """
+    Call an external dependency through its circuit breaker with retries.
+
+    Args:
+        dependency: Dependency name, used for the breaker and metrics
+        operation: Operation name for metrics and logs
+        fn: Zero-argument callable performing one attempt; it must enforce its own timeout
+        retries: Extra attempts after the first failure
+        non_retryable: Exception types that fail immediately without retrying
+        breaker: Breaker to use (defaults to the shared one for ``dependency``)
+        deadline: ``time.monotonic()`` value after which no retry is started
+
+    Returns:
+        The result of ``fn``
+
+    Raises:
+        CircuitOpenError: If the circuit is open
+        Exception: The last error raised by ``fn``
+    """
+    breaker = breaker or get_breaker(dependency)
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            record_external_error(dependency, f"{operation}_circuit_open")
+            raise CircuitOpenError(f"{dependency} circuit is open")
+        try:
+            result = fn()
+        except non_retryable:
+            # The dependency answered; the request itself was bad
+            breaker.record_success()
+            record_external_error(dependency, operation)
+            raise
+        except Exception as e:
+            breaker.record_failure()
+            record_external_error(dependency, operation)
+            delay = backoff_delay(attempt)
+            if attempt == retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            logger.warning("%s %s failed (%s); retry %d/%d in %.2fs",
+                           dependency, operation, e, attempt + 1, retries, delay)
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
@@ -0,0 +1,149 @@
+"""
+Per-worker CPU budget for inference.
+
+TensorFlow, OpenBLAS/MKL behind numpy and scikit-learn, and joblib each
+size their thread pools to every core on the machine. With several uvicorn
+workers on one node that multiplies into heavy oversubscription, so
+``configure_runtime`` gives each worker a fixed share instead. It must run
+before the models load: TensorFlow only accepts thread settings before its
+runtime initializes.
+"""
+import fcntl
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+from .config import (
+    WEB_CONCURRENCY, INFERENCE_THREADS, TF_INTER_OP_THREADS, RF_N_JOBS, BLAS_THREADS, CPU_AFFINITY
+)
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Lock files through which workers on a node claim distinct core blocks
+_SLOT_LOCK_PATTERN = os.path.join(tempfile.gettempdir(), "lsd-worker-slot-{}.lock")
+
+# Held open for the life of the process so the claimed slot stays taken
+_slot_lock_file = None
+
+_settings: Dict[str, Any] = {}
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(spec: str) -> List[int]:
+    """Parse a CPU list such as "0-3,8" into sorted CPU ids."""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return sorted(cpus)
+
+
+def _claim_worker_slot(workers: int) -> Optional[int]:
+    """Claim the lowest free worker slot on this node, or None if all are taken."""
+    global _slot_lock_file
+    for slot in range(workers):
+        lock_file = open(_SLOT_LOCK_PATTERN.format(slot), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            continue
+        _slot_lock_file = lock_file
+        return slot
+    return None
+
+
+def _pin_cpus(spec: str, workers: int) -> Optional[List[int]]:
+    """Apply CPU_AFFINITY and return the CPUs the process is pinned to."""
+    if not spec or not hasattr(os, "sched_setaffinity"):
+        return None
+    cpus = available_cpus()
+    if spec == "auto":
+        slot = _claim_worker_slot(workers)
+        if slot is None:
+            logger.warning("No free worker slot for CPU pinning; leaving affinity unchanged")
+            return None
+        block = max(1, len(cpus) // workers)
+        cpus = cpus[slot * block:(slot + 1) * block] or cpus[-block:]
+    else:
+        cpus = parse_cpu_list(spec)
+    os.sched_setaffinity(0, cpus)
+    return cpus
+
+
+def configure_runtime() -> Dict[str, Any]:
+    """
+    Pin the worker and bound every inference thread pool to its CPU share.
+
+    Returns:
+        Dict[str, Any]: The settings that were requested
+    """
+    workers = max(1, WEB_CONCURRENCY)
+    pinned = _pin_cpus(CPU_AFFINITY, workers)
+    share = len(pinned) if pinned else max(1, len(available_cpus()) // workers)
+    intra_op = INFERENCE_THREADS or share
+    blas = BLAS_THREADS or intra_op
+
+    # Libraries that start later read these; the calls below cover those already loaded
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(blas)
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=blas)
+    except ImportError:
+        logger.warning("threadpoolctl is not installed; BLAS thread limits rely on environment variables only")
+
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+    except RuntimeError:
+        # Raised once TensorFlow's runtime has started; the existing pools are kept
+        logger.warning("TensorFlow already initialized; thread settings not applied", exc_info=True)
+
+    _settings.update({
+        "workers": workers,
+        "cpu_affinity": pinned,
+        "intra_op_threads": intra_op,
+        "inter_op_threads": TF_INTER_OP_THREADS,
+        "rf_n_jobs": RF_N_JOBS,
+        "blas_threads": blas,
+    })
+    logger.info("Runtime configured: %s", _settings)
+    return dict(_settings)
+
+
+def runtime_report() -> Dict[str, Any]:
+    """Requested settings next to what each library actually reports."""
+    report: Dict[str, Any] = {
+        "requested": dict(_settings),
+        "cpu_count": os.cpu_count(),
+        "cpu_affinity": available_cpus(),
+    }
+    try:
+        import tensorflow as tf
+        report["tensorflow"] = {
+            "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads(),
+            "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads(),
+        }
+    except Exception:
+        report["tensorflow"] = None
+    try:
+        from threadpoolctl import threadpool_info
+        report["native_thread_pools"] = [
+            {key: pool.get(key) for key in ("user_api", "internal_api", "num_threads")}
+            for pool in threadpool_info()
+        ]
+    except ImportError:
+        report["native_thread_pools"] = None
+    return report
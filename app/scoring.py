@@ -0,0 +1,93 @@
+from typing import NamedTuple, Tuple, Union
+import numpy as np
+from .config import ENSEMBLE_METHOD, ENSEMBLE_WEIGHTS, ENSEMBLE_BIAS, CLINICAL_PLATT, IMAGE_PLATT
+
+ArrayLike = Union[float, np.ndarray]
+
+# Probabilities are clipped away from 0 and 1 before taking logits
+_EPSILON = 1e-6
+
+METHODS = ("weighted", "logistic")
+
+
+def sigmoid(x: ArrayLike) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.asarray(x, dtype=np.float64)))
+
+
+def logit(p: ArrayLike) -> np.ndarray:
+    p = np.clip(np.asarray(p, dtype=np.float64), _EPSILON, 1 - _EPSILON)
+    return np.log(p / (1 - p))
+
+
+def clinical_verdict(score: ArrayLike) -> np.ndarray:
+    """Clinical model label from its probability; matches RandomForest.predict (ties go to "not affected")."""
+    return np.asarray(score) > 0.5
+
+
+def image_verdict(score: ArrayLike) -> np.ndarray:
+    """Image model label from its probability; matches argmax over [lumpy, normal] (ties go to "lumpy")."""
+    return np.asarray(score) >= 0.5
+
+
+class PlattScaler(NamedTuple):
+    """Platt scaling ``sigmoid(a * logit(p) + b)``; (1, 0) leaves probabilities unchanged."""
+    a: float
+    b: float
+
+    def __call__(self, p: ArrayLike) -> np.ndarray:
+        return sigmoid(self.a * logit(p) + self.b)
+
+
+def parse_pair(spec: str) -> Tuple[float, float]:
+    """Parse a "<x>,<y>" setting into two floats."""
+    first, second = (float(part) for part in spec.split(","))
+    return first, second
+
+
+class EnsembleScorer:
+    """
+    Fuses the clinical and image model probabilities into one risk score.
+
+    Each model's probability is first Platt-calibrated. ``weighted`` then
+    takes a weighted mean of the calibrated probabilities; ``logistic``
+    applies a stacked logistic regression, ``sigmoid(w_c * logit(p_c) +
+    w_i * logit(p_i) + bias)``. Inputs may be scalars or arrays so a whole
+    batch is fused in one call. A missing (NaN) score drops that model from
+    the fusion; the result is NaN only when both are missing.
+    """
+
+    def __init__(self, method: str, weights: Tuple[float, float], bias: float,
+                 clinical_platt: PlattScaler, image_platt: PlattScaler):
+        if method not in METHODS:
+            raise ValueError(f"Unknown ensemble method {method!r}; expected one of {METHODS}")
+        self.method = method
+        self.clinical_weight, self.image_weight = weights
+        self.bias = bias
+        self.clinical_platt = clinical_platt
+        self.image_platt = image_platt
+
+    def combine(self, clinical_score: ArrayLike, image_score: ArrayLike) -> np.ndarray:
+        clinical = np.asarray(clinical_score, dtype=np.float64)
+        image = np.asarray(image_score, dtype=np.float64)
+        has_clinical = ~np.isnan(clinical)
+        has_image = ~np.isnan(image)
+        clinical = self.clinical_platt(np.where(has_clinical, clinical, 0.5))
+        image = self.image_platt(np.where(has_image, image, 0.5))
+        clinical_weight = np.where(has_clinical, self.clinical_weight, 0.0)
+        image_weight = np.where(has_image, self.image_weight, 0.0)
+
+        if self.method == "weighted":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return (clinical_weight * clinical + image_weight * image) / (clinical_weight + image_weight)
+        combined = sigmoid(clinical_weight * logit(clinical) + image_weight * logit(image) + self.bias)
+        # Nothing to fuse when neither model ran
+        return np.where(has_clinical | has_image, combined, np.nan)
+
+
+ensemble_scorer = EnsembleScorer(
+    ENSEMBLE_METHOD,
+    parse_pair(ENSEMBLE_WEIGHTS),
+    ENSEMBLE_BIAS,
+    PlattScaler(*parse_pair(CLINICAL_PLATT)),
+    PlattScaler(*parse_pair(IMAGE_PLATT)),
+)
@@ -1,32 +1,69 @@
 import requests
-from typing import Optional, Tuple
-from .config import WEATHER_API_KEY
+from typing import Any, Optional, Tuple
+from .config import WEATHER_API_KEY, WEATHER_API_BASE_URL, WEATHER_TIMEOUT_SECONDS, WEATHER_MAX_RETRIES
+from .resilience import call_with_resilience, NonRetryableError
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Reuse TCP/TLS connections to OpenWeatherMap across calls
+_session = requests.Session()
+
+
+def _get_json(operation: str, url: str) -> Any:
+    """
+    GET a JSON document from OpenWeatherMap with timeout, retries and circuit breaking.
+
+    Client errors (4xx) are not retried since they indicate a bad key or request.
+    """
+    def attempt():
+        response = _session.get(url, timeout=WEATHER_TIMEOUT_SECONDS)
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise NonRetryableError(f"OpenWeatherMap {operation} returned {response.status_code}")
+        response.raise_for_status()
+        return response.json()
+
+    return call_with_resilience("openweathermap", operation, attempt, retries=WEATHER_MAX_RETRIES)
 
 
 def get_temperature_by_coords(lat: float, lon: float) -> Optional[float]:
     """Get current temperature for given coordinates"""
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
-    
+    data = get_current_weather(lat, lon)
     try:
-        response = requests.get(url)
-        data = response.json()
-        if response.status_code == 200:
-            return data["main"]["temp"]
-        return None
-    except Exception as e:
-        print(f"Error fetching weather data: {e}")
+        return data["main"]["temp"] if data else None
+    except (KeyError, TypeError) as e:
+        logger.warning("Unexpected weather payload: %s", e)
         return None
 
 def get_city_by_coords(lat: float, lon: float) -> Optional[str]:
     """Get city name for given coordinates"""
-    url = f"https://api.openweathermap.org/geo/1.0/reverse?lat={lat}&lon={lon}&limit=1&appid={WEATHER_API_KEY}"
-    
+    url = f"{WEATHER_API_BASE_URL}/geo/1.0/reverse?lat={lat}&lon={lon}&limit=1&appid={WEATHER_API_KEY}"
+
     try:
-        response = requests.get(url)
-        data = response.json()
-        if response.status_code == 200 and data:
+        data = _get_json("reverse_geocode", url)
+        if data:
             return data[0]["name"]
         return None
     except Exception as e:
-        print(f"Error fetching location data: {e}")
-        return None 
\ No newline at end of file
+        logger.warning("Error fetching location data: %s", e)
+        return None
+
+def get_current_weather(lat: float, lon: float) -> Optional[dict]:
+    """Get the current weather document for given coordinates"""
+    url = f"{WEATHER_API_BASE_URL}/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
+
+    try:
+        return _get_json("weather", url)
+    except Exception as e:
+        logger.warning("Error fetching weather data: %s", e)
+        return None
+
+def get_forecast(lat: float, lon: float) -> Optional[dict]:
+    """Get the 5-day / 3-hour forecast document for given coordinates"""
+    url = f"{WEATHER_API_BASE_URL}/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
+
+    try:
+        return _get_json("forecast", url)
+    except Exception as e:
+        logger.warning("Error fetching forecast data: %s", e)
+        return None
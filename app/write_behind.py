@@ -0,0 +1,877 @@
+"""
+Write-behind persistence for finished predictions.
+
+``complete_prediction`` hands its result to ``prediction_writer.submit``, which
+appends it to a local journal and queues it; the response goes out without
+touching the database. A background thread writes queued predictions, their
+idempotency records and disease stats increments in batched transactions,
+so request latency no longer includes database lock waits.
+
+Durability: an entry is in the journal (fsynced unless WRITE_BEHIND_FSYNC
+is off) before ``submit`` returns. Concurrent submissions share one fsync
+(group commit), and neither the append nor the fsync holds the queue lock.
+Each worker journals to its own segment files under WRITE_BEHIND_DIR and
+holds a lock file for as long as it runs. A starting worker replays the
+journal of any owner whose lock is free, i.e. one that exited without
+draining its queue. Replay skips predictions already in the database, and
+each prediction is committed together with its stats increment, so entries
+are applied exactly once.
+
+Ids: responses carry the prediction id, so ids cannot wait for the insert.
+Each worker reserves blocks of ID_BLOCK_SIZE ids in ``id_blocks`` (one short
+write per block) and hands them out locally; the writer thread reserves the
+next block while the current one is half used. Every prediction of a worker
+that started write-behind takes its id from a block, including those written
+inline while the queue is full or the writer is stopping. A block is closed
+once every id it handed out is in the database; the analytics export stops
+below the lowest open block so rows still in a queue are never skipped.
+
+A prediction that the database rejects is never discarded: when another
+worker stored the same Idempotency-Key first, it is kept without the key,
+and anything else is set aside in ``rejected.jsonl`` for an operator.
+
+Until its batch is written, a prediction is served from memory: see
+``pending_prediction``, ``pending_for_user`` and ``find_pending``. Image
+embeddings travel with their prediction and are added to the embedding
+index once the prediction is committed.
+"""
+import base64
+import datetime
+import fcntl
+import glob
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import create_engine, func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+from .config import (
+    WRITE_BEHIND_DIR, WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_SECONDS,
+    WRITE_BEHIND_MAX_PENDING, WRITE_BEHIND_FSYNC, WRITE_BEHIND_SEGMENT_ENTRIES,
+    ID_BLOCK_SIZE, ID_BLOCK_MAX_AGE_SECONDS, ID_BLOCK_STALE_SECONDS
+)
+from .database import SQLALCHEMY_DATABASE_URL, connect_args
+from .embeddings import index_embeddings
+from .metrics import time_stage, WRITE_BEHIND_PENDING, WRITE_BEHIND_WRITES
+from .models import Prediction, PredictionRequest, DiseaseStats, IdBlock, local_now
+from app.logger import get_logger
+
+logger = get_logger(__name__)
+
+_PREDICTION_COLUMNS = tuple(column.key for column in Prediction.__table__.columns)
+
+# The writer's own small pool: request threads hold pooled connections while they submit,
+# so reservations and flushes must never wait for one of those
+WriterSession = sessionmaker(
+    autocommit=False, autoflush=False,
+    bind=create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args, pool_size=2, max_overflow=2)
+)
+
+# Backoff between attempts while the database is unavailable
+RETRY_MIN_SECONDS = 0.1
+RETRY_MAX_SECONDS = 5.0
+
+# How often an idle writer wakes to retire aged id blocks
+IDLE_TICK_SECONDS = 1.0
+
+# Entries the database will not accept, kept for an operator to inspect
+REJECTED_FILE = "rejected.jsonl"
+
+
+class ConflictingIdError(Exception):
+    """A journaled prediction's id is already taken by a different stored prediction."""
+
+
+def apply_stats_deltas(db: Session, deltas: Dict[str, int]):
+    """Adjust per-city disease counts by the given amounts."""
+    for city, delta in deltas.items():
+        if not city or delta == 0:
+            continue
+        stats = db.query(DiseaseStats).filter(DiseaseStats.city == city).first()
+        if stats:
+            stats.disease_count = max(0, stats.disease_count + delta)
+        elif delta > 0:
+            db.add(DiseaseStats(city=city, disease_count=delta))
+
+
+def _encode(value: Any) -> str:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def _decode(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Restore the datetimes that were journaled as ISO strings."""
+    for record in (entry["prediction"], entry.get("request")):
+        if record and isinstance(record.get("created_at"), str):
+            record["created_at"] = datetime.datetime.fromisoformat(record["created_at"])
+    return entry
+
+
+def _pack_embedding(embedding: np.ndarray) -> str:
+    # float16, as stored in the index
+    return base64.b64encode(np.asarray(embedding, dtype=np.float16).tobytes()).decode("ascii")
+
+
+def _unpack_embedding(packed: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(packed), dtype=np.float16).astype(np.float32)
+
+
+def _index(entries: List[Dict[str, Any]]):
+    """Index the embeddings of stored entries."""
+    index_embeddings([
+        (
+            entry["prediction"]["image_model_version"], entry["prediction"]["id"],
+            entry["prediction"]["user_id"], _unpack_embedding(entry["embedding"])
+        )
+        for entry in entries if entry.get("embedding")
+    ])
+
+
+def _naive(value: Any) -> Any:
+    # Stored timestamps come back without their offset
+    return value.replace(tzinfo=None) if isinstance(value, datetime.datetime) else value
+
+
+def _write_entries(db: Session, entries: List[Dict[str, Any]]) -> int:
+    """
+    Insert journaled predictions not yet in the database, in one transaction.
+
+    An id that is already stored is skipped only when the stored row is the
+    same prediction (an earlier write of this entry).
+
+    Returns:
+        int: Number of predictions inserted
+
+    Raises:
+        ConflictingIdError: If an id is already used by a different prediction
+        IntegrityError: If a row violates a constraint (a reused Idempotency-Key)
+    """
+    ids = [entry["prediction"]["id"] for entry in entries]
+    present = {
+        row.id: row for row in
+        db.query(Prediction.id, Prediction.user_id, Prediction.created_at).filter(Prediction.id.in_(ids))
+    }
+    fresh = []
+    for entry in entries:
+        record = entry["prediction"]
+        row = present.get(record["id"])
+        if row is None:
+            fresh.append(entry)
+        elif row.user_id != record["user_id"] or _naive(row.created_at) != _naive(record["created_at"]):
+            raise ConflictingIdError(f"Prediction id {record['id']} is already used by another prediction")
+    if fresh:
+        db.bulk_insert_mappings(Prediction, [entry["prediction"] for entry in fresh])
+        db.bulk_insert_mappings(PredictionRequest, [entry["request"] for entry in fresh if entry.get("request")])
+        apply_stats_deltas(db, Counter(entry["stats_city"] for entry in fresh if entry.get("stats_city")))
+    db.commit()
+    return len(fresh)
+
+
+def _write_entry(entry: Dict[str, Any]) -> int:
+    """Write one entry; if another worker stored its Idempotency-Key first, store it without the key."""
+    db = WriterSession()
+    try:
+        try:
+            return _write_entries(db, [entry])
+        except IntegrityError:
+            db.rollback()
+            request = entry.get("request")
+            if not request or not request.get("idempotency_key"):
+                raise
+        # The client already has this prediction, so it is kept; the earlier record keeps
+        # the key and later retries replay that one
+        logger.warning(
+            "Idempotency-Key of prediction %s was stored by another worker first; storing it without the key",
+            entry["prediction"]["id"]
+        )
+        inserted = _write_entries(db, [dict(entry, request=dict(request, idempotency_key=None))])
+        WRITE_BEHIND_WRITES.labels(outcome="key_conflict").inc()
+        return inserted
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _set_aside(directory: str, entry: Dict[str, Any]):
+    with open(os.path.join(directory, REJECTED_FILE), "a") as f:
+        f.write(json.dumps(entry, default=_encode) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _store(directory: str, entries: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Write a batch, one entry at a time if the database rejects the batch.
+
+    Entries the database still rejects are set aside in REJECTED_FILE rather
+    than lost.
+
+    Returns:
+        Tuple[int, List[Dict[str, Any]]]: Number of predictions inserted, and
+        the entries now in the database (all but those set aside)
+
+    Raises:
+        SQLAlchemyError: If the database is unavailable
+    """
+    db = WriterSession()
+    try:
+        return _write_entries(db, entries), entries
+    except (IntegrityError, ConflictingIdError):
+        db.rollback()
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    inserted = 0
+    stored = []
+    for entry in entries:
+        try:
+            inserted += _write_entry(entry)
+            stored.append(entry)
+        except (IntegrityError, ConflictingIdError):
+            logger.error(
+                "Prediction %s was rejected by the database; set aside in %s",
+                entry["prediction"]["id"], REJECTED_FILE, exc_info=True
+            )
+            _set_aside(directory, entry)
+            WRITE_BEHIND_WRITES.labels(outcome="rejected").inc()
+    return inserted, stored
+
+
+class Journal:
+    """
+    Append-only journal segments of one worker.
+
+    A segment is deleted once every entry in it has been committed and the
+    journal has moved on to a newer segment. Appends only write; ``sync``
+    makes them durable, with concurrent callers sharing one fsync.
+    """
+
+    def __init__(self, directory: str, owner: str, fsync: bool, segment_entries: int):
+        self.directory = directory
+        self.owner = owner
+        self.fsync = fsync
+        self.segment_entries = segment_entries
+        os.makedirs(directory, exist_ok=True)
+        # Held until close; a free lock tells other workers this journal is orphaned
+        self._lock_path = os.path.join(directory, f"{owner}.lock")
+        self._lock_file = open(self._lock_path, "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        self._lock = threading.Lock()  # appends, rotation and segment bookkeeping
+        self._sync_lock = threading.Lock()  # one fsync at a time
+        self._outstanding: Dict[int, int] = defaultdict(int)
+        self._appended = 0  # sequence number of the last appended entry
+        self._synced = 0
+        self._rotated_fds: List[int] = []  # previous segments awaiting their final fsync
+        self._segment = -1
+        self._fd = None
+        self._rotate()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{self.owner}.{segment:06d}.journal")
+
+    def _rotate(self):
+        if self._fd is not None:
+            if self.fsync:
+                # Closed by the next sync, after it is flushed; a sync in progress may still use it
+                self._rotated_fds.append(self._fd)
+            else:
+                os.close(self._fd)
+            if not self._outstanding.get(self._segment):
+                self._remove(self._segment)
+        self._segment += 1
+        self._written = 0
+        self._fd = os.open(self._path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def _remove(self, segment: int):
+        self._outstanding.pop(segment, None)
+        try:
+            os.remove(self._path(segment))
+        except FileNotFoundError:
+            pass
+
+    def append(self, entry: Dict[str, Any]) -> Tuple[int, int]:
+        """
+        Write an entry to the current segment.
+
+        Returns:
+            Tuple[int, int]: (segment, sequence number to pass to ``sync``)
+        """
+        line = (json.dumps(entry, default=_encode) + "\n").encode()
+        with self._lock:
+            if self._written >= self.segment_entries:
+                self._rotate()
+            os.write(self._fd, line)
+            self._written += 1
+            self._outstanding[self._segment] += 1
+            self._appended += 1
+            return self._segment, self._appended
+
+    def sync(self, sequence: int):
+        """Return once the entry with this sequence number is on disk."""
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= sequence:
+                # Covered by an fsync another caller made while this one waited
+                return
+            with self._lock:
+                fd, target = self._fd, self._appended
+                rotated, self._rotated_fds = self._rotated_fds, []
+            for old_fd in rotated:
+                os.fsync(old_fd)
+                os.close(old_fd)
+            os.fsync(fd)
+            self._synced = target
+
+    def release(self, segment: int):
+        """Mark one entry of a segment as committed."""
+        with self._lock:
+            self._outstanding[segment] -= 1
+            if self._outstanding[segment] <= 0 and segment != self._segment:
+                self._remove(segment)
+
+    def close(self):
+        """Close the journal; segments with uncommitted entries are kept for replay."""
+        with self._sync_lock, self._lock:
+            for fd in self._rotated_fds:
+                os.close(fd)
+            self._rotated_fds = []
+            os.close(self._fd)
+            self._fd = None
+            if not self._outstanding.get(self._segment):
+                self._remove(self._segment)
+            if not any(self._outstanding.values()):
+                os.remove(self._lock_path)
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+
+def replay_orphans(directory: str, own_owner: Optional[str] = None) -> int:
+    """
+    Write the journals of workers that exited without draining them.
+
+    Returns:
+        int: Number of predictions inserted
+    """
+    inserted = 0
+    for lock_path in sorted(glob.glob(os.path.join(directory, "*.lock"))):
+        owner = os.path.basename(lock_path)[:-len(".lock")]
+        if owner == own_owner:
+            continue
+        lock_file = open(lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Its worker is still running
+            lock_file.close()
+            continue
+        try:
+            segments = sorted(glob.glob(os.path.join(directory, f"{owner}.*.journal")))
+            entries = []
+            written = 0
+            for path in segments:
+                with open(path) as f:
+                    for line_number, line in enumerate(f, 1):
+                        try:
+                            entries.append(_decode(json.loads(line)))
+                        except (ValueError, KeyError):
+                            # A torn final line from a crash mid-append was never acknowledged
+                            logger.warning("Skipping unreadable journal line %s:%s", path, line_number)
+            for start in range(0, len(entries), WRITE_BEHIND_BATCH_SIZE):
+                batch_inserted, stored = _store(directory, entries[start:start + WRITE_BEHIND_BATCH_SIZE])
+                written += batch_inserted
+                # Entries committed before the crash may not have been indexed yet
+                _index(stored)
+            # Everything this owner handed out is now stored
+            db = WriterSession()
+            try:
+                db.query(IdBlock).filter(IdBlock.owner == owner, IdBlock.closed_at.is_(None)).update(
+                    {IdBlock.closed_at: datetime.datetime.utcnow()}, synchronize_session=False
+                )
+                db.commit()
+            finally:
+                db.close()
+            for path in segments:
+                os.remove(path)
+            os.remove(lock_path)
+            inserted += written
+            logger.info("Replayed %s journal entries of %s (%s inserted)", len(entries), owner, written)
+        except (OSError, SQLAlchemyError):
+            logger.error("Could not replay the journal of %s; it will be retried", owner, exc_info=True)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+    WRITE_BEHIND_WRITES.labels(outcome="replayed").inc(inserted)
+    return inserted
+
+
+class _IdBlockState:
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.next = start
+        self.opened = time.monotonic()
+
+    @property
+    def used(self) -> int:
+        return self.next - self.start
+
+    def exhausted(self) -> bool:
+        return self.next > self.end or time.monotonic() - self.opened > ID_BLOCK_MAX_AGE_SECONDS
+
+
+class WriteBehindWriter:
+    """Journals finished predictions and writes them to the database in batches."""
+
+    def __init__(
+        self,
+        directory: str = WRITE_BEHIND_DIR,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_seconds: float = WRITE_BEHIND_FLUSH_SECONDS,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+    ):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.owner = None
+        # Queue and pending lookups; held only for in-memory updates
+        self._cond = threading.Condition()
+        self._queue = deque()  # (entry, journal segment, id block start)
+        self._journaling = 0  # submissions accepted but still being journaled
+        self._pending: Dict[int, Tuple[Prediction, Optional[str]]] = {}  # id -> (prediction, fingerprint)
+        self._pending_embeddings: Dict[int, np.ndarray] = {}
+        self._pending_keys: Dict[Tuple[int, str], int] = {}
+        self._pending_hashes: Dict[Tuple[int, str], int] = {}
+        # Id blocks; reservations happen outside this lock, under _reserve_lock
+        self._id_lock = threading.Lock()
+        self._reserve_lock = threading.Lock()
+        self._block: Optional[_IdBlockState] = None
+        self._spare: Optional[_IdBlockState] = None
+        self._block_pending: Dict[int, int] = defaultdict(int)
+        self._retired_blocks = set()
+        self._journal: Optional[Journal] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stopping
+
+    def start(self):
+        """Open this worker's journal and start the writer thread, which first replays orphaned journals."""
+        if self._thread is not None:
+            return
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._journal = Journal(self.directory, self.owner, WRITE_BEHIND_FSYNC, WRITE_BEHIND_SEGMENT_ENTRIES)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        logger.info("Write-behind persistence started (journal owner %s)", self.owner)
+
+    def stop(self, timeout: float = 30.0):
+        """
+        Drain the queue, close finished id blocks and the journal.
+
+        Predictions submitted from now on are written inline, still under
+        reserved ids.
+        """
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # The journal lock is released when the process exits, so the next worker replays the rest
+            logger.warning("Write-behind writer did not drain within %ss; pending entries stay journaled", timeout)
+            return
+        self._retire_blocks(spare=True)
+        self._close_retired_blocks()
+        self._journal.close()
+        self._journal = None
+        self._thread = None
+        logger.info("Write-behind persistence stopped")
+
+    def _reserve_block(self) -> _IdBlockState:
+        """
+        Reserve the next ID_BLOCK_SIZE ids; concurrent reservations of the same range collide on the key.
+
+        Raises:
+            SQLAlchemyError: If the database is unavailable or every attempt collided
+        """
+        db = WriterSession()
+        try:
+            for attempt in range(5):
+                try:
+                    start = max(
+                        db.query(func.max(IdBlock.end_id)).scalar() or 0,
+                        db.query(func.max(Prediction.id)).scalar() or 0,
+                    ) + 1
+                    db.add(IdBlock(start_id=start, end_id=start + ID_BLOCK_SIZE - 1, owner=self.owner))
+                    db.commit()
+                    return _IdBlockState(start, start + ID_BLOCK_SIZE - 1)
+                except IntegrityError:
+                    db.rollback()
+                    if attempt == 4:
+                        raise
+        finally:
+            db.close()
+
+    def _take_id(self) -> Optional[Tuple[int, int]]:
+        """Hand out the next reserved id, moving to the spare block when needed; None if none is reserved."""
+        with self._id_lock:
+            block = self._block
+            if block is None or block.exhausted():
+                if block is not None:
+                    self._retired_blocks.add(block.start)
+                block, self._spare = self._spare, None
+                self._block = block
+                if block is None:
+                    return None
+                # Its age counts from first use
+                block.opened = time.monotonic()
+            prediction_id = block.next
+            block.next += 1
+            self._block_pending[block.start] += 1
+            return prediction_id, block.start
+
+    def _next_id(self) -> Tuple[int, int]:
+        taken = self._take_id()
+        if taken is not None:
+            return taken
+        # No spare was ready (first request after start or an idle spell): reserve one here
+        with self._reserve_lock:
+            taken = self._take_id()
+            if taken is not None:
+                return taken
+            block = self._reserve_block()
+            with self._id_lock:
+                if self._spare is not None:
+                    self._retired_blocks.add(self._spare.start)
+                self._spare = block
+        taken = self._take_id()
+        return taken if taken is not None else self._next_id()
+
+    def _ensure_spare(self):
+        """Reserve the next block once the current one is half used, so requests never wait for it."""
+        with self._id_lock:
+            block = self._block
+            wanted = (
+                self._spare is None and block is not None
+                and not self._stopping and block.used * 2 >= ID_BLOCK_SIZE
+            )
+        if not wanted:
+            return
+        with self._reserve_lock:
+            with self._id_lock:
+                if self._spare is not None:
+                    return
+            spare = self._reserve_block()
+            with self._id_lock:
+                self._spare = spare
+
+    def _retire_blocks(self, spare: bool = False):
+        """Stop handing out ids from the current block (and the spare); they are closed once stored."""
+        with self._id_lock:
+            for block in (self._block, self._spare if spare else None):
+                if block is not None:
+                    self._retired_blocks.add(block.start)
+            self._block = None
+            if spare:
+                self._spare = None
+
+    def _retire_idle_blocks(self):
+        with self._id_lock:
+            block, spare = self._block, self._spare
+            if block is not None and block.exhausted():
+                self._retired_blocks.add(block.start)
+                self._block = None
+            # An unused spare holds back the analytics export as much as an open block does
+            if self._block is None and spare is not None and time.monotonic() - spare.opened > ID_BLOCK_MAX_AGE_SECONDS:
+                self._retired_blocks.add(spare.start)
+                self._spare = None
+
+    def _id_stored(self, block_start: int):
+        with self._id_lock:
+            self._block_pending[block_start] -= 1
+
+    def submit(
+        self,
+        prediction: Prediction,
+        content_hash: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        affected_city: Optional[str] = None,
+        embedding: Optional[np.ndarray] = None,
+    ) -> bool:
+        """
+        Journal a finished prediction for background writing.
+
+        Assigns ``prediction.id`` and ``created_at``. When the queue is full or
+        the writer is stopping, the prediction is written inline instead,
+        still under a reserved id.
+
+        Args:
+            prediction: Unsaved prediction
+            content_hash: Request fingerprint for the idempotency record, if any
+            idempotency_key: Client supplied Idempotency-Key, if any
+            affected_city: City whose disease count the prediction increments, if any
+            embedding: Image embedding to index once the prediction is stored, if any
+
+        Returns:
+            bool: False, leaving the prediction untouched, if write-behind was
+            never started; the caller then stores it itself
+
+        Raises:
+            IntegrityError: If an inline write violates a constraint (a reused Idempotency-Key)
+            SQLAlchemyError: If no ids could be reserved or an inline write failed
+        """
+        if self.owner is None:
+            return False
+        prediction.id, block_start = self._next_id()
+        prediction.created_at = prediction.created_at or local_now()
+        entry = {
+            "prediction": {column: getattr(prediction, column) for column in _PREDICTION_COLUMNS},
+            "request": {
+                "user_id": prediction.user_id,
+                "idempotency_key": idempotency_key,
+                "content_hash": content_hash,
+                "prediction_id": prediction.id,
+                "created_at": datetime.datetime.utcnow(),
+            } if content_hash else None,
+            "stats_city": affected_city,
+            "embedding": _pack_embedding(embedding) if embedding is not None else None,
+        }
+
+        with self._cond:
+            queued = self.running and len(self._queue) + self._journaling < self.max_pending
+            if queued:
+                self._journaling += 1
+                self._track(entry, prediction, embedding)
+        if queued:
+            try:
+                segment, sequence = self._journal.append(entry)
+                self._journal.sync(sequence)
+            except OSError:
+                logger.error("Could not journal prediction %s; writing it inline", prediction.id, exc_info=True)
+                with self._cond:
+                    self._journaling -= 1
+                    self._untrack(entry)
+                    self._cond.notify_all()
+            else:
+                with self._cond:
+                    self._journaling -= 1
+                    self._queue.append((entry, segment, block_start))
+                    WRITE_BEHIND_PENDING.set(len(self._queue))
+                    self._cond.notify_all()
+                return True
+
+        # Backed up (usually the database is slow or down) or shutting down: write inline
+        # so the caller sees the outcome
+        WRITE_BEHIND_WRITES.labels(outcome="inline").inc()
+        db = WriterSession()
+        try:
+            _write_entries(db, [entry])
+        except (SQLAlchemyError, ConflictingIdError):
+            db.rollback()
+            raise
+        finally:
+            db.close()
+            self._id_stored(block_start)
+            if not self.running:
+                # No writer thread is left to retire the block
+                self._retire_blocks(spare=True)
+            self._close_retired_blocks()
+        _index([entry])
+        return True
+
+    def _track(self, entry: Dict[str, Any], prediction: Prediction, embedding: Optional[np.ndarray]):
+        """Make a queued prediction visible to lookups; called with the lock held."""
+        request = entry.get("request")
+        self._pending[prediction.id] = (prediction, request["content_hash"] if request else None)
+        if embedding is not None:
+            self._pending_embeddings[prediction.id] = embedding
+        if request:
+            self._pending_hashes[(request["user_id"], request["content_hash"])] = prediction.id
+            if request["idempotency_key"]:
+                self._pending_keys[(request["user_id"], request["idempotency_key"])] = prediction.id
+
+    def _untrack(self, entry: Dict[str, Any]):
+        """Drop a written prediction from the lookups; called with the lock held."""
+        prediction_id = entry["prediction"]["id"]
+        self._pending.pop(prediction_id, None)
+        self._pending_embeddings.pop(prediction_id, None)
+        request = entry.get("request")
+        if request:
+            key = (request["user_id"], request["content_hash"])
+            if self._pending_hashes.get(key) == prediction_id:
+                del self._pending_hashes[key]
+            key = (request["user_id"], request["idempotency_key"])
+            if self._pending_keys.get(key) == prediction_id:
+                del self._pending_keys[key]
+
+    def pending_prediction(self, prediction_id: int) -> Optional[Prediction]:
+        """A submitted prediction that has not been written yet."""
+        with self._cond:
+            pending = self._pending.get(prediction_id)
+        return pending[0] if pending is not None else None
+
+    def pending_for_user(self, user_id: int) -> List[Prediction]:
+        """A user's submitted predictions that have not been written yet, oldest first."""
+        with self._cond:
+            return [prediction for prediction, _ in self._pending.values() if prediction.user_id == user_id]
+
+    def pending_predictions(self) -> Dict[int, Prediction]:
+        """Every submitted prediction that has not been written yet, by id."""
+        with self._cond:
+            return {prediction_id: prediction for prediction_id, (prediction, _) in self._pending.items()}
+
+    def pending_embeddings(self) -> Dict[int, np.ndarray]:
+        """Image embeddings of submitted predictions that have not been written (and indexed) yet."""
+        with self._cond:
+            return dict(self._pending_embeddings)
+
+    def find_pending(
+        self, user_id: int, idempotency_key: Optional[str], content_hash: str
+    ) -> Optional[Tuple[str, Prediction]]:
+        """
+        The not yet written prediction of an earlier identical submission.
+
+        Returns:
+            Optional[Tuple[str, Prediction]]: Its stored fingerprint and the prediction
+        """
+        with self._cond:
+            if idempotency_key:
+                prediction_id = self._pending_keys.get((user_id, idempotency_key))
+            else:
+                prediction_id = self._pending_hashes.get((user_id, content_hash))
+            if prediction_id is None:
+                return None
+            prediction, fingerprint = self._pending[prediction_id]
+        return fingerprint, prediction
+
+    def _take_batch(self) -> Optional[List[Tuple[Dict[str, Any], int, int]]]:
+        """The next batch; empty once stopped and drained, None when woken with nothing to write."""
+        with self._cond:
+            deadline = None
+            while True:
+                if self._queue and (len(self._queue) >= self.batch_size or self._stopping):
+                    break
+                if self._queue and deadline is None:
+                    deadline = time.monotonic() + self.flush_seconds
+                if self._stopping and not self._queue and not self._journaling:
+                    return []
+                timeout = deadline - time.monotonic() if deadline is not None else IDLE_TICK_SECONDS
+                if timeout <= 0:
+                    break
+                # Wakes for new submissions too, so a spare block can be reserved in time
+                self._cond.wait(timeout)
+                if not self._queue and not self._stopping:
+                    return None
+            return [self._queue[i] for i in range(min(len(self._queue), self.batch_size))]
+
+    def _close_retired_blocks(self):
+        """Close retired blocks whose ids are all stored; called without the locks held."""
+        with self._id_lock:
+            # Retired blocks hand out no more ids, so their pending counts only go down
+            closable = [start for start in self._retired_blocks if not self._block_pending.get(start)]
+        if not closable:
+            return
+        db = WriterSession()
+        try:
+            db.query(IdBlock).filter(IdBlock.start_id.in_(closable)).update(
+                {IdBlock.closed_at: datetime.datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            logger.warning("Could not close id blocks %s; will retry", closable, exc_info=True)
+            return
+        finally:
+            db.close()
+        with self._id_lock:
+            for start in closable:
+                self._retired_blocks.discard(start)
+                self._block_pending.pop(start, None)
+
+    def _commit(self, entries: List[Dict[str, Any]]) -> int:
+        with time_stage("db_flush"):
+            inserted, stored = _store(self.directory, entries)
+        # Indexed while still pending, so similar-case lookups see them throughout
+        _index(stored)
+        return inserted
+
+    def _run(self):
+        try:
+            replay_orphans(self.directory, self.owner)
+        except Exception:
+            logger.error("Journal replay failed", exc_info=True)
+
+        failures = 0
+        while True:
+            try:
+                self._ensure_spare()
+            except Exception:
+                # Requests reserve blocks themselves until this succeeds
+                logger.warning("Could not reserve a spare id block", exc_info=True)
+            try:
+                batch = self._take_batch()
+                if batch is None:
+                    self._retire_idle_blocks()
+                    self._close_retired_blocks()
+                    continue
+                if not batch:
+                    return
+                committed = self._commit([entry for entry, _, _ in batch])
+            except Exception:
+                # Usually the database is unavailable or locked for too long; entries stay
+                # queued and journaled, and the loop keeps running whatever went wrong
+                failures += 1
+                logger.warning("Write-behind flush failed (attempt %s); retrying", failures, exc_info=True)
+                time.sleep(min(RETRY_MAX_SECONDS, RETRY_MIN_SECONDS * 2 ** (failures - 1)))
+                continue
+            failures = 0
+            WRITE_BEHIND_WRITES.labels(outcome="committed").inc(committed)
+
+            with self._cond:
+                for entry, _, _ in batch:
+                    self._queue.popleft()
+                    self._untrack(entry)
+                WRITE_BEHIND_PENDING.set(len(self._queue))
+                self._cond.notify_all()
+            for entry, segment, block_start in batch:
+                self._id_stored(block_start)
+                try:
+                    self._journal.release(segment)
+                except OSError:
+                    # The segment is deleted at the next release or replayed harmlessly
+                    logger.warning("Could not release journal segment %s", segment, exc_info=True)
+            try:
+                self._close_retired_blocks()
+            except Exception:
+                logger.warning("Could not close retired id blocks", exc_info=True)
+
+
+def export_limit(db: Session) -> Optional[int]:
+    """Lowest prediction id that may still be waiting in a write-behind queue, if any."""
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=ID_BLOCK_STALE_SECONDS)
+    return (
+        db.query(func.min(IdBlock.start_id))
+        .filter(IdBlock.closed_at.is_(None), IdBlock.allocated_at >= cutoff)
+        .scalar()
+    )
+
+
+prediction_writer = WriteBehindWriter()
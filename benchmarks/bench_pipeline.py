@@ -0,0 +1,212 @@
+"""
+End-to-end benchmark for the prediction pipeline.
+
+Runs entirely offline: the Gemini client and OpenWeatherMap lookups are
+replaced by stubs, and small synthetic models stand in for any missing
+artifacts in ``final_models/``. Results are written as JSON under
+``benchmarks/results/`` so runs can be compared across commits.
+
+Usage:
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --concurrency 1 4 8 --iterations 200
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .common import compare_results, format_table, run_threaded, save_results, summarize
+from . import stubs
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ('preprocess', 'ml_predict', 'cnn_predict', 'make_prediction', 'api_predict')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help='Concurrency levels to run each benchmark at')
+    parser.add_argument('--iterations', type=int, default=100,
+                        help='Calls per benchmark for the cheap stages')
+    parser.add_argument('--pipeline-iterations', type=int, default=30,
+                        help='Calls per benchmark for CNN, make_prediction and the API route')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--llm-latency', type=float, default=0.0,
+                        help='Seconds the stub LLM sleeps per call, to model upstream latency')
+    parser.add_argument('--mode', default='full', choices=('full', 'screening', 'clinical', 'image'),
+                        help='Pipeline mode for make_prediction and api_predict')
+    parser.add_argument('--output', help='Result file path (default: benchmarks/results/<time>-<rev>.json)')
+    parser.add_argument('--compare', help='Previous result file to print deltas against')
+    return parser.parse_args(argv)
+
+
+def configure_environment(work_dir: str) -> list:
+    """Point the app at a scratch database and a complete models directory before it is imported."""
+    models_dir, synthesized = stubs.prepare_models_dir(os.path.join(REPO_ROOT, 'final_models'), work_dir)
+    os.environ['MODELS_DIR'] = models_dir
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    os.environ['WRITE_BEHIND_DIR'] = os.path.join(work_dir, 'write_behind')
+    os.environ['EMBEDDING_INDEX_DIR'] = os.path.join(work_dir, 'embedding_index')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-secret')
+    os.environ.setdefault('ALGORITHM', 'HS256')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # Measure the pipeline itself rather than the protective limits in front of it
+    for name in ('RATE_LIMIT_PREDICT_USER', 'RATE_LIMIT_PREDICT_IP', 'RATE_LIMIT_PREDICT_GLOBAL',
+                 'RATE_LIMIT_LOGIN', 'RATE_LIMIT_SIGNUP'):
+        os.environ.setdefault(name, '1000000/second')
+    os.environ.setdefault('PREDICT_MAX_QUEUE', '100000')
+    os.environ.setdefault('PREDICT_QUEUE_TIMEOUT', '3600')
+    return synthesized
+
+
+def install_stubs(llm_latency: float):
+    """Replace network-bound collaborators inside the already imported app modules."""
+    from app import features, prediction
+
+    stubs.StubLLM.latency = llm_latency
+    prediction.LLM = stubs.StubLLM
+    prediction.get_city_by_coords = stubs.stub_city_by_coords
+    features.get_current_weather = stubs.stub_current_weather
+    features.get_forecast = stubs.stub_forecast
+
+
+def bench_api(app, user, image_bytes: bytes, clinical: dict, iterations: int, concurrency: int,
+              mode: str = 'full') -> dict:
+    """Drive ``POST /api/predict`` through the ASGI stack with ``concurrency`` concurrent clients."""
+    import httpx
+    from app.auth import get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    payload = {'clinical_data': json.dumps(clinical), 'language': 'English',
+               'longitude': str(clinical['longitude']), 'mode': mode}
+    counter = itertools.count()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            async def call():
+                # Nudge the latitude (within the same weather grid cell) so every request is
+                # distinct and duplicate-submission handling does not replay earlier results
+                data = dict(payload, latitude=str(clinical['latitude'] + next(counter) * 1e-9))
+                start = time.perf_counter()
+                response = await client.post(
+                    '/api/predict', data=data,
+                    files={'image': ('bench.jpg', image_bytes, 'image/jpeg')}
+                )
+                return time.perf_counter() - start, response.status_code != 200
+
+            for _ in range(3):
+                await call()
+
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def bounded():
+                async with semaphore:
+                    return await call()
+
+            start = time.perf_counter()
+            outcomes = await asyncio.gather(*(bounded() for _ in range(iterations)))
+            return outcomes, time.perf_counter() - start
+
+    try:
+        outcomes, wall = asyncio.run(run())
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+    latencies = [elapsed for elapsed, failed in outcomes if not failed]
+    return summarize('api_predict', concurrency, latencies, wall, sum(failed for _, failed in outcomes))
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    invocation_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='lsd-bench-')
+    # The app resolves static/, templates/ and final_models/ relative to the working directory
+    os.chdir(REPO_ROOT)
+    synthesized = configure_environment(work_dir)
+
+    sys.path.insert(0, REPO_ROOT)
+    from PIL import Image
+    from io import BytesIO
+    from app.database import SessionLocal
+    from app.models import User
+    from app.main import app
+    from app.prediction import get_models, initialize_models, make_prediction
+
+    install_stubs(args.llm_latency)
+    # As at app startup: models are loaded up front, never by the first request
+    initialize_models()
+    preprocessor, ml_predictor, cnn_predictor, _ = get_models()
+
+    rng = np.random.default_rng(42)
+    clinical = stubs.sample_clinical_data(rng)
+    features = [clinical[key] for key in (
+        'longitude', 'latitude', 'cloud_cover', 'evapotranspiration', 'precipitation',
+        'min_temp', 'mean_temp', 'max_temp', 'vapour_pressure', 'wet_day_freq'
+    )]
+    image_bytes = stubs.sample_image_bytes(rng)
+    scaled = preprocessor.preprocess(features)
+
+    db = SessionLocal()
+    user = User(username='bench', email='bench@example.com', hashed_password='x')
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+
+    def run_make_prediction():
+        session = SessionLocal()
+        try:
+            make_prediction(
+                db=session, user_id=user.id, image=Image.open(BytesIO(image_bytes)),
+                clinical_data=clinical, latitude=clinical['latitude'],
+                longitude=clinical['longitude'], mode=args.mode
+            )
+        finally:
+            session.close()
+
+    benchmarks = {
+        'preprocess': (lambda: preprocessor.preprocess(features), args.iterations),
+        'ml_predict': (lambda: ml_predictor.predict(scaled), args.iterations),
+        'cnn_predict': (lambda: cnn_predictor.predict(Image.open(BytesIO(image_bytes))), args.pipeline_iterations),
+        'make_prediction': (run_make_prediction, args.pipeline_iterations),
+    }
+
+    results = []
+    for stage in args.stages:
+        for concurrency in args.concurrency:
+            if stage == 'api_predict':
+                result = bench_api(app, user, image_bytes, clinical, args.pipeline_iterations, concurrency, args.mode)
+            else:
+                fn, iterations = benchmarks[stage]
+                result = run_threaded(stage, fn, iterations, concurrency)
+            results.append(result)
+            print(f"{stage} x{concurrency}: p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms "
+                  f"rps={result['throughput_rps']}", file=sys.stderr)
+
+    path = save_results(results, {
+        'synthetic_artifacts': synthesized,
+        'llm_stub_latency_s': args.llm_latency,
+        'mode': args.mode,
+        'iterations': args.iterations,
+        'pipeline_iterations': args.pipeline_iterations,
+    }, os.path.join(invocation_dir, args.output) if args.output else None)
+
+    print(format_table(results))
+    print(f'\nResults written to {path}')
+    if args.compare:
+        print('\nChange vs baseline:')
+        for line in compare_results(os.path.join(invocation_dir, args.compare), results):
+            print(f'  {line}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
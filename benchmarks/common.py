@@ -0,0 +1,153 @@
+"""Shared timing, resource and reporting helpers for the benchmark harness."""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MiB (Linux), falling back to peak RSS."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(name: str, concurrency: int, latencies: List[float], wall_seconds: float,
+              errors: int = 0) -> Dict:
+    """
+    Reduce raw per-call latencies to a result record.
+
+    Args:
+        name: Benchmark name
+        concurrency: Number of concurrent callers
+        latencies: Per-call latencies in seconds
+        wall_seconds: Wall-clock duration of the whole run
+        errors: Number of failed calls
+    """
+    samples = np.asarray(latencies, dtype=np.float64) * 1000.0
+    p50, p95, p99 = (np.percentile(samples, [50, 95, 99]) if samples.size else (float('nan'),) * 3)
+    return {
+        'name': name,
+        'concurrency': concurrency,
+        'requests': int(samples.size),
+        'errors': errors,
+        'throughput_rps': round(samples.size / wall_seconds, 3) if wall_seconds > 0 else None,
+        'mean_ms': round(float(samples.mean()), 3) if samples.size else None,
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'rss_mb': round(current_rss_mb(), 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run_threaded(name: str, fn: Callable[[], object], iterations: int, concurrency: int,
+                 warmup: int = 3) -> Dict:
+    """
+    Call ``fn`` ``iterations`` times spread over ``concurrency`` threads.
+
+    A few warmup calls run first so one-off costs such as graph tracing or
+    lazy imports are not attributed to the measured run.
+    """
+    for _ in range(warmup):
+        fn()
+
+    def timed_call(_):
+        start = time.perf_counter()
+        try:
+            fn()
+            return time.perf_counter() - start, False
+        except Exception:
+            return time.perf_counter() - start, True
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed_call, range(iterations)))
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed for elapsed, failed in outcomes if not failed]
+    errors = sum(1 for _, failed in outcomes if failed)
+    return summarize(name, concurrency, latencies, wall, errors)
+
+
+def git_revision() -> Optional[str]:
+    """Short commit hash of the working tree, if available."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(RESULTS_DIR), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results: List[Dict], meta: Dict, output: Optional[str] = None) -> str:
+    """Write results and run metadata to JSON and return the file path."""
+    revision = git_revision()
+    meta = {
+        'git_revision': revision,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        **meta,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f'{stamp}-{revision or "unknown"}.json')
+    with open(output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    return output
+
+
+def compare_results(baseline_path: str, results: List[Dict]) -> List[str]:
+    """Format p50/p99/throughput deltas against a previously saved run."""
+    with open(baseline_path) as f:
+        baseline = {(r['name'], r['concurrency']): r for r in json.load(f)['results']}
+
+    lines = []
+    for result in results:
+        previous = baseline.get((result['name'], result['concurrency']))
+        if not previous:
+            continue
+        deltas = []
+        for key in ('p50_ms', 'p99_ms', 'throughput_rps'):
+            old, new = previous.get(key), result.get(key)
+            if old and new:
+                deltas.append(f'{key} {old:.2f} -> {new:.2f} ({(new - old) / old * 100:+.1f}%)')
+        lines.append(f"{result['name']} x{result['concurrency']}: " + ', '.join(deltas))
+    return lines
+
+
+def format_table(results: List[Dict]) -> str:
+    """Render results as a fixed-width text table."""
+    header = f"{'benchmark':<28}{'conc':>5}{'reqs':>7}{'err':>5}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>9}"
+    rows = [header, '-' * len(header)]
+    for r in results:
+        rows.append(
+            f"{r['name']:<28}{r['concurrency']:>5}{r['requests']:>7}{r['errors']:>5}"
+            f"{r['throughput_rps'] or 0:>10.2f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+            f"{r['p99_ms']:>10.2f}{r['rss_mb']:>9.1f}"
+        )
+    return '\n'.join(rows)
@@ -0,0 +1,276 @@
+"""
+Local stand-ins for Gemini and OpenWeatherMap with tunable latency and failures.
+
+Each upstream is described by a ``ServiceProfile`` parsed from a spec such as
+
+    latency=lognormal:0.8:0.5,error_rate=0.02,timeout_rate=0.01
+
+``latency`` is ``fixed:S``, ``uniform:LO:HI`` or ``lognormal:MEDIAN:SIGMA``
+(seconds). ``error_rate`` of calls fail with ``error_status``, and
+``timeout_rate`` of calls hang for ``hang`` seconds, which is longer than the
+app's client timeouts.
+
+The fakes come in two forms that share the same profiles and payloads:
+
+- HTTP servers, for an app running as its own process. Point it at them with
+  WEATHER_API_BASE_URL and GEMINI_API_ENDPOINT:
+
+      python -m benchmarks.fakes --weather-port 8081 --gemini-port 8082 \\
+          --gemini-profile "latency=lognormal:2:0.4,error_rate=0.05"
+
+- In-process replacements for the weather HTTP session and the Gemini
+  client, installed by ``install_in_process`` once the app has loaded its
+  models.
+
+Both forms sit below the app's timeout, retry and circuit breaker layer, so
+degraded upstreams are handled exactly as they would be in production.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from . import stubs
+
+
+class ServiceProfile:
+    """Latency distribution and failure mix of one fake upstream."""
+
+    DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 error_status: int = 503, hang: float = 60.0, seed: Optional[int] = None):
+        kind, *params = latency.split(':')
+        if kind not in self.DISTRIBUTIONS:
+            raise ValueError(f'Unknown latency distribution {kind!r}; expected one of {self.DISTRIBUTIONS}')
+        self.latency = latency
+        self._kind = kind
+        self._params = [float(p) for p in params]
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.error_status = error_status
+        self.hang = hang
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed: Optional[int] = None) -> 'ServiceProfile':
+        """Build a profile from a ``key=value,...`` spec; empty means instant and always healthy."""
+        options = {}
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            key, _, value = item.partition('=')
+            if key == 'latency':
+                options[key] = value
+            elif key in ('error_rate', 'timeout_rate', 'hang'):
+                options[key] = float(value)
+            elif key == 'error_status':
+                options[key] = int(value)
+            else:
+                raise ValueError(f'Unknown profile option {key!r}')
+        return cls(seed=seed, **options)
+
+    def sample(self) -> Tuple[str, float]:
+        """
+        Draw the outcome of one call.
+
+        Returns:
+            Tuple[str, float]: ("ok" | "error" | "timeout", seconds to wait before answering)
+        """
+        with self._lock:
+            roll = self._rng.random()
+            if self._kind == 'fixed':
+                delay = self._params[0]
+            elif self._kind == 'uniform':
+                delay = self._rng.uniform(*self._params)
+            else:
+                median, sigma = self._params
+                delay = self._rng.lognormvariate(0.0, sigma) * median
+        if roll < self.timeout_rate:
+            return 'timeout', self.hang
+        if roll < self.timeout_rate + self.error_rate:
+            return 'error', delay
+        return 'ok', delay
+
+    def describe(self) -> dict:
+        return {
+            'latency': self.latency, 'error_rate': self.error_rate, 'timeout_rate': self.timeout_rate,
+            'error_status': self.error_status, 'hang': self.hang,
+        }
+
+
+def weather_response(path: str, query: dict) -> Tuple[int, Any]:
+    """Status and JSON body the fake OpenWeatherMap returns for a path."""
+    lat = float(query.get('lat', ['0'])[0])
+    lon = float(query.get('lon', ['0'])[0])
+    if path.endswith('/geo/1.0/reverse'):
+        return 200, [{'name': stubs.stub_city_by_coords(lat, lon), 'lat': lat, 'lon': lon}]
+    if path.endswith('/data/2.5/weather'):
+        return 200, stubs.stub_current_weather(lat, lon)
+    if path.endswith('/data/2.5/forecast'):
+        return 200, stubs.stub_forecast(lat, lon)
+    return 404, {'cod': '404', 'message': 'Not found'}
+
+
+def gemini_response() -> dict:
+    """A generateContent response body carrying the canned report."""
+    return {
+        'candidates': [{
+            'content': {'role': 'model', 'parts': [{'text': stubs.CANNED_REPORT}]},
+            'finishReason': 'STOP',
+            'index': 0,
+        }],
+        'usageMetadata': {'promptTokenCount': 0, 'candidatesTokenCount': 0, 'totalTokenCount': 0},
+    }
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status: int, body: Any):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, route):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        outcome, delay = self.server.profile.sample()
+        time.sleep(delay)
+        if outcome == 'ok':
+            self._reply(*route(urlsplit(self.path)))
+        else:
+            status = self.server.profile.error_status
+            self._reply(status, {'error': {'code': status, 'message': f'Fake upstream {outcome}'}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _WeatherHandler(_FakeHandler):
+    def do_GET(self):
+        self._handle(lambda url: weather_response(url.path, parse_qs(url.query)))
+
+
+class _GeminiHandler(_FakeHandler):
+    def do_POST(self):
+        self._handle(lambda url: (200, gemini_response()) if url.path.endswith(':generateContent')
+                     else (404, {'error': {'code': 404, 'message': 'Not found'}}))
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering like one upstream, shaped by a profile."""
+
+    daemon_threads = True
+
+    def __init__(self, handler, profile: ServiceProfile, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), handler)
+        self.profile = profile
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakeServer':
+        threading.Thread(target=self.serve_forever, name=f'fake-{self.url}', daemon=True).start()
+        return self
+
+
+def start_fake_weather(profile: ServiceProfile, host: str = '127.0.0.1', port: int = 0) -> FakeServer:
+    return FakeServer(_WeatherHandler, profile, host, port).start()
+
+
+def start_fake_gemini(profile: ServiceProfile, host: str = '127.0.0.1', port: int = 0) -> FakeServer:
+    return FakeServer(_GeminiHandler, profile, host, port).start()
+
+
+class FakeWeatherSession:
+    """Stands in for the ``requests.Session`` in ``app.weather``."""
+
+    def __init__(self, profile: ServiceProfile):
+        self.profile = profile
+
+    def get(self, url: str, timeout: Optional[float] = None, **kwargs):
+        import requests
+
+        outcome, delay = self.profile.sample()
+        if outcome == 'timeout':
+            time.sleep(min(delay, timeout or delay))
+            raise requests.Timeout(f'Fake OpenWeatherMap timed out after {timeout}s')
+        time.sleep(delay)
+        parts = urlsplit(url)
+        status, body = (
+            weather_response(parts.path, parse_qs(parts.query)) if outcome == 'ok'
+            else (self.profile.error_status, {'cod': str(self.profile.error_status), 'message': 'Fake upstream error'})
+        )
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode()
+        response.headers['Content-Type'] = 'application/json'
+        response.url = url
+        return response
+
+
+class FakeGenerativeModel:
+    """Stands in for ``genai.GenerativeModel`` inside the app's ``LLM``."""
+
+    def __init__(self, profile: ServiceProfile):
+        self.profile = profile
+
+    def generate_content(self, prompt: Any, request_options: Optional[dict] = None):
+        outcome, delay = self.profile.sample()
+        timeout = (request_options or {}).get('timeout')
+        if outcome == 'timeout':
+            time.sleep(min(delay, timeout or delay))
+            raise TimeoutError(f'Fake Gemini timed out after {timeout}s')
+        time.sleep(delay)
+        if outcome == 'error':
+            raise ConnectionError(f'Fake Gemini returned {self.profile.error_status}')
+        return SimpleNamespace(text=stubs.CANNED_REPORT)
+
+
+def install_in_process(weather_profile: ServiceProfile, gemini_profile: ServiceProfile):
+    """Swap the app's upstream clients for fakes; call after the models (and LLM) are initialized."""
+    from app import prediction, weather
+
+    weather._session = FakeWeatherSession(weather_profile)
+    prediction.get_llm().model = FakeGenerativeModel(gemini_profile)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--weather-port', type=int, default=8081)
+    parser.add_argument('--gemini-port', type=int, default=8082)
+    parser.add_argument('--weather-profile', default='latency=lognormal:0.15:0.5',
+                        help='Latency/failure profile of the fake OpenWeatherMap')
+    parser.add_argument('--gemini-profile', default='latency=lognormal:2:0.4',
+                        help='Latency/failure profile of the fake Gemini')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    weather_server = start_fake_weather(ServiceProfile.parse(args.weather_profile, args.seed), args.host, args.weather_port)
+    gemini_server = start_fake_gemini(ServiceProfile.parse(args.gemini_profile, args.seed), args.host, args.gemini_port)
+    print(f'WEATHER_API_BASE_URL={weather_server.url}')
+    print(f'GEMINI_API_ENDPOINT={gemini_server.url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        weather_server.shutdown()
+        gemini_server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
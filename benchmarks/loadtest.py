@@ -0,0 +1,322 @@
+"""
+Open-loop load test of the user-facing flows against fake upstreams.
+
+Flows (signup, login, predict, dashboard) arrive as a Poisson process at
+``--rps`` for ``--duration`` seconds, picked by the ``--mix`` weights.
+Arrivals do not wait for earlier flows to finish, so a slow server shows up
+as growing latency rather than a quietly reduced request rate; arrivals
+beyond ``--max-in-flight`` concurrent flows are counted as dropped.
+Throughput and latency percentiles are reported per route, and results are
+saved as JSON next to the pipeline benchmark's so runs can be compared.
+
+Without ``--target`` the app runs in this process over ASGI, with synthetic
+models for any missing artifacts and Gemini/OpenWeatherMap replaced by the
+fakes in ``benchmarks/fakes.py``. ``--fakes server`` serves those fakes over
+local HTTP instead, exercising the real clients end to end. With
+``--target`` an already running server is driven; start it with its rate
+limits raised and pointed at ``python -m benchmarks.fakes``.
+
+Usage:
+    python -m benchmarks.loadtest --rps 5 --duration 60
+    python -m benchmarks.loadtest --mix predict=1 --gemini-profile "latency=lognormal:2:0.4,error_rate=0.1"
+    python -m benchmarks.loadtest --target http://127.0.0.1:8000 --rps 20 --users 50
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .bench_pipeline import REPO_ROOT, configure_environment
+from .common import compare_results, format_table, save_results, summarize
+from . import fakes, stubs
+
+FLOWS = ('signup', 'login', 'predict', 'dashboard')
+PASSWORD = 'loadtest-password'
+
+# Counters scraped from /metrics before and after the run to show how the app coped
+WATCHED_COUNTERS = (
+    'lsd_report_fallbacks_total', 'lsd_external_call_errors_total',
+    'lsd_rate_limited_total', 'lsd_admission_rejected_total',
+)
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "predict=6,dashboard=3" into flow weights."""
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        flow, _, weight = item.partition('=')
+        if flow not in FLOWS:
+            raise argparse.ArgumentTypeError(f'Unknown flow {flow!r}; expected one of {FLOWS}')
+        mix[flow] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('The mix needs at least one flow with a positive weight')
+    return mix
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', help='Base URL of a running server (default: run the app in-process)')
+    parser.add_argument('--rps', type=float, default=5.0, help='Target flow arrival rate per second')
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds to generate arrivals for')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('predict=5,dashboard=3,login=1,signup=1'),
+                        help='Flow weights, e.g. predict=5,dashboard=3,login=1,signup=1')
+    parser.add_argument('--users', type=int, default=10, help='Users signed up before the run starts')
+    parser.add_argument('--max-in-flight', type=int, default=200,
+                        help='Concurrent flows beyond which new arrivals are dropped')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Client timeout per request in seconds')
+    parser.add_argument('--mode', default='full', choices=('full', 'screening', 'clinical', 'image'),
+                        help='Pipeline mode sent with predict requests')
+    parser.add_argument('--fakes', default='inprocess', choices=('inprocess', 'server'),
+                        help='How upstreams are faked for the in-process app')
+    parser.add_argument('--weather-profile', default='latency=lognormal:0.15:0.5',
+                        help='Latency/failure profile of the fake OpenWeatherMap')
+    parser.add_argument('--gemini-profile', default='latency=lognormal:2:0.4',
+                        help='Latency/failure profile of the fake Gemini')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Result file path (default: benchmarks/results/<time>-<rev>.json)')
+    parser.add_argument('--compare', help='Previous result file to print deltas against')
+    return parser.parse_args(argv)
+
+
+class Recorder:
+    """Per-route latencies and status codes; status 0 marks a transport failure."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def record(self, route: str, latency: float, status: int):
+        self.samples[route].append((latency, status))
+
+    def results(self, wall_seconds: float, concurrency: int) -> List[Dict]:
+        results = []
+        for route in sorted(self.samples):
+            samples = self.samples[route]
+            ok = [latency for latency, status in samples if 200 <= status < 300]
+            result = summarize(route, concurrency, ok, wall_seconds, len(samples) - len(ok))
+            statuses = Counter(status for _, status in samples)
+            result['status_counts'] = {str(status): statuses[status] for status in sorted(statuses)}
+            results.append(result)
+        return results
+
+
+class Scenario:
+    """The user flows, each a short sequence of timed requests."""
+
+    def __init__(self, client, recorder: Recorder, mode: str, seed: int):
+        self.client = client
+        self.recorder = recorder
+        self.mode = mode
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+        self.images = [stubs.sample_image_bytes(self.np_rng) for _ in range(4)]
+        self.run_id = f'{int(time.time()):x}'
+        self.user_ids = itertools.count()
+        self.tokens: Dict[str, str] = {}
+
+    async def request(self, route: str, method: str, url: str, **kwargs):
+        import httpx
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(route, time.perf_counter() - start, 0)
+            return None
+        self.recorder.record(route, time.perf_counter() - start, response.status_code)
+        return response
+
+    def _any_user(self) -> Optional[str]:
+        return self.rng.choice(list(self.tokens)) if self.tokens else None
+
+    async def _login(self, username: str) -> bool:
+        response = await self.request('POST /api/token', 'POST', '/api/token',
+                                      data={'username': username, 'password': PASSWORD})
+        if response is not None and response.status_code == 200:
+            self.tokens[username] = response.json()['access_token']
+            return True
+        return False
+
+    async def signup(self):
+        username = f'load-{self.run_id}-{next(self.user_ids)}'
+        response = await self.request('POST /api/signup', 'POST', '/api/signup', json={
+            'username': username, 'email': f'{username}@example.com', 'password': PASSWORD,
+        })
+        if response is not None and response.status_code == 200:
+            await self._login(username)
+
+    async def login(self):
+        username = self._any_user()
+        if username:
+            await self._login(username)
+
+    async def predict(self):
+        username = self._any_user()
+        if not username:
+            return
+        clinical = stubs.sample_clinical_data(self.np_rng)
+        await self.request(
+            'POST /api/predict', 'POST', '/api/predict',
+            headers={'Authorization': f'Bearer {self.tokens[username]}'},
+            data={
+                'clinical_data': json.dumps(clinical), 'language': 'English', 'mode': self.mode,
+                'latitude': str(clinical['latitude']), 'longitude': str(clinical['longitude']),
+            },
+            files={'image': ('loadtest.jpg', self.rng.choice(self.images), 'image/jpeg')},
+        )
+
+    async def dashboard(self):
+        username = self._any_user()
+        if username:
+            await self.request('GET /dashboard', 'GET', '/dashboard',
+                               headers={'Authorization': f'Bearer {self.tokens[username]}'})
+
+
+async def drive(scenario: Scenario, mix: Dict[str, float], rps: float, duration: float,
+                max_in_flight: int, rng: random.Random) -> Dict:
+    """Launch flows at Poisson arrival times and wait for the stragglers."""
+    flows, weights = zip(*mix.items())
+    in_flight = set()
+    launched = dropped = 0
+    start = time.perf_counter()
+    arrival = start
+    while True:
+        arrival += rng.expovariate(rps)
+        if arrival - start >= duration:
+            break
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        if len(in_flight) >= max_in_flight:
+            dropped += 1
+            continue
+        task = asyncio.create_task(getattr(scenario, rng.choices(flows, weights)[0])())
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        launched += 1
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    return {'launched': launched, 'dropped': dropped, 'wall_seconds': time.perf_counter() - start}
+
+
+async def scrape_counters(client) -> Dict[str, float]:
+    """Current totals of WATCHED_COUNTERS, keyed by sample name and labels."""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    try:
+        response = await client.get('/metrics')
+    except Exception:
+        return {}
+    if response.status_code != 200:
+        return {}
+    totals = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            if sample.name in WATCHED_COUNTERS:
+                labels = ','.join(f'{key}={value}' for key, value in sorted(sample.labels.items()))
+                totals[f'{sample.name}{{{labels}}}' if labels else sample.name] = sample.value
+    return totals
+
+
+async def run(client, args) -> Dict:
+    # Seed the user pool outside the measured window, then record from a clean slate
+    scenario = Scenario(client, Recorder(), args.mode, args.seed)
+    for _ in range(args.users):
+        await scenario.signup()
+    recorder = scenario.recorder = Recorder()
+    if not scenario.tokens and set(args.mix) != {'signup'}:
+        raise RuntimeError('No users could be signed up; check that the target is reachable and signup is allowed')
+
+    before = await scrape_counters(client)
+    stats = await drive(scenario, args.mix, args.rps, args.duration, args.max_in_flight, random.Random(args.seed))
+    after = await scrape_counters(client)
+    stats['counters'] = {name: after[name] - before.get(name, 0.0) for name in after
+                         if after[name] - before.get(name, 0.0)}
+    stats['results'] = recorder.results(stats['wall_seconds'], args.max_in_flight)
+    return stats
+
+
+def prepare_in_process_app(args, work_dir: str):
+    """Import the app against a scratch database, with upstream fakes served locally if requested."""
+    os.chdir(REPO_ROOT)
+    configure_environment(work_dir)
+    os.environ.setdefault('GEMINI_API_KEY', 'loadtest-key')
+    os.environ.setdefault('WEATHER_API_KEY', 'loadtest-key')
+    if args.fakes == 'server':
+        os.environ['WEATHER_API_BASE_URL'] = fakes.start_fake_weather(
+            fakes.ServiceProfile.parse(args.weather_profile, args.seed)).url
+        os.environ['GEMINI_API_ENDPOINT'] = fakes.start_fake_gemini(
+            fakes.ServiceProfile.parse(args.gemini_profile, args.seed)).url
+    sys.path.insert(0, REPO_ROOT)
+    from app.main import app
+    return app
+
+
+async def run_in_process(app, args) -> Dict:
+    import httpx
+
+    # Run the app's own startup and shutdown so models load exactly as they do under uvicorn
+    async with app.router.lifespan_context(app):
+        if args.fakes == 'inprocess':
+            fakes.install_in_process(
+                fakes.ServiceProfile.parse(args.weather_profile, args.seed),
+                fakes.ServiceProfile.parse(args.gemini_profile, args.seed),
+            )
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=args.timeout) as client:
+            return await run(client, args)
+
+
+async def run_against_target(args) -> Dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout, limits=limits) as client:
+        return await run(client, args)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    invocation_dir = os.getcwd()
+    if args.target:
+        stats = asyncio.run(run_against_target(args))
+    else:
+        app = prepare_in_process_app(args, tempfile.mkdtemp(prefix='lsd-loadtest-'))
+        stats = asyncio.run(run_in_process(app, args))
+
+    results = stats.pop('results')
+    meta = {
+        'target': args.target or 'in-process',
+        'fakes': None if args.target else args.fakes,
+        'target_rps': args.rps,
+        'achieved_rps': round((stats['launched'] + stats['dropped']) / args.duration, 3),
+        'duration_s': args.duration,
+        'mix': args.mix,
+        'mode': args.mode,
+        'weather_profile': None if args.target else args.weather_profile,
+        'gemini_profile': None if args.target else args.gemini_profile,
+        **stats,
+    }
+    path = save_results(results, meta, os.path.join(invocation_dir, args.output) if args.output else None)
+
+    print(format_table(results))
+    print(f"\nFlows launched: {stats['launched']}, dropped: {stats['dropped']}, "
+          f"arrivals {meta['achieved_rps']}/s (target {args.rps}/s), last flow done after {stats['wall_seconds']:.1f}s")
+    for name, delta in sorted(stats['counters'].items()):
+        print(f'  {name}: +{delta:g}')
+    print(f'\nResults written to {path}')
+    if args.compare:
+        print('\nChange vs baseline:')
+        for line in compare_results(os.path.join(invocation_dir, args.compare), results):
+            print(f'  {line}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -41,17 +41,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
-    // Weather API key - this comes from the template where it was injected from the server
-    // If WEATHER_API_KEY is not defined, provide a fallback for development/testing
-    const apiKey = typeof WEATHER_API_KEY !== 'undefined' ? WEATHER_API_KEY : '';
-    
-    if (!apiKey) {
-        console.warn('Weather API key is not available. Weather data will not be loaded.');
-        weatherStatus.textContent = 'Weather API key not available. Please enter data manually.';
-        weatherFieldsContainer.style.display = 'block'; // Show fields if API key is not available
-        toggleWeatherFieldsBtn.style.display = 'none';  // Hide toggle button
-    }
-    
     getLocationBtn.addEventListener('click', function() {
         if (navigator.geolocation) {
             locationStatus.textContent = 'Getting location...';
@@ -73,13 +62,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     
                     weatherStatus.textContent = 'Fetching weather data...';
                     
-                    // Fetch weather data if API key is available
-                    if (apiKey) {
-                        fetchWeatherData(latitude, longitude);
-                    } else {
-                        weatherStatus.textContent = 'Weather API not available. Please enter data manually.';
-                        weatherFieldsContainer.style.display = 'block'; // Show fields
-                    }
+                    // Climate features are derived on the server from the coordinates
+                    fetchWeatherData(latitude, longitude);
                 },
                 // Error callback
                 function(error) {
@@ -118,130 +102,39 @@ document.addEventListener('DOMContentLoaded', function() {
         weatherSummary.style.display = 'block';
     }
     
-    // Function to fetch weather data
+    // Function to fetch weather-derived clinical features from the server
     function fetchWeatherData(lat, lon) {
-        // API endpoint for current weather
-        const currentWeatherUrl = `https://api.openweathermap.org/data/2.5/weather?lat=${lat}&lon=${lon}&appid=${apiKey}&units=metric`;
-        
-        // API endpoint for 5-day forecast (to get min/max temperatures)
-        const forecastUrl = `https://api.openweathermap.org/data/2.5/forecast?lat=${lat}&lon=${lon}&appid=${apiKey}&units=metric`;
+        const featuresUrl = `/api/climate-features?latitude=${encodeURIComponent(lat)}&longitude=${encodeURIComponent(lon)}`;
         
-        // First get current weather for mean temperature and cloud cover
-        fetch(currentWeatherUrl)
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error(`Weather API error: ${response.status}`);
-                }
-                return response.json();
-            })
-            .then(data => {
-                console.log('Current weather data:', data);
-                
-                // Set mean temperature from current weather
-                if (data && data.main && data.main.temp) {
-                    meanTempInput.value = data.main.temp.toFixed(2);
-                }
-                
-                // Set cloud cover (in percentage)
-                if (data && data.clouds && typeof data.clouds.all !== 'undefined') {
-                    cloudCoverInput.value = data.clouds.all;
-                }
-                
-                // Set precipitation if available (rain in last 3 hours)
-                if (data && data.rain && data.rain['3h']) {
-                    precipitationInput.value = data.rain['3h'].toFixed(2);
-                } else {
-                    // If no rain data, default to 0
-                    precipitationInput.value = '0.00';
-                }
-                
-                // Estimate vapor pressure from humidity and temperature
-                if (data && data.main && data.main.humidity && data.main.temp) {
-                    // Simple approximation for vapor pressure (hPa) based on humidity and temperature
-                    const humidity = data.main.humidity; // in %
-                    const temperature = data.main.temp; // in Celsius
-                    
-                    // Saturation vapor pressure (hPa) using Magnus formula
-                    const satVaporPressure = 6.112 * Math.exp((17.67 * temperature) / (temperature + 243.5));
-                    
-                    // Actual vapor pressure (hPa)
-                    const vaporPressure = (humidity / 100) * satVaporPressure;
-                    
-                    vapourPressureInput.value = vaporPressure.toFixed(2);
-                }
-                
-                // Now get forecast data for min/max
-                return fetch(forecastUrl);
-            })
+        fetch(featuresUrl, {
+            headers: {
+                'Authorization': `Bearer ${localStorage.getItem('access_token')}`
+            }
+        })
             .then(response => {
                 if (!response.ok) {
-                    throw new Error(`Forecast API error: ${response.status}`);
+                    throw new Error(`Climate features error: ${response.status}`);
                 }
                 return response.json();
             })
             .then(data => {
-                console.log('Forecast data:', data);
+                const fields = {
+                    cloud_cover: cloudCoverInput,
+                    evapotranspiration: evapotranspirationInput,
+                    precipitation: precipitationInput,
+                    min_temp: minTempInput,
+                    mean_temp: meanTempInput,
+                    max_temp: maxTempInput,
+                    vapour_pressure: vapourPressureInput,
+                    wet_day_freq: wetDayFreqInput
+                };
                 
-                if (data && data.list && data.list.length > 0) {
-                    // Extract min and max temperatures from the forecast
-                    let minTemp = 100; // Start with a high value
-                    let maxTemp = -100; // Start with a low value
-                    let rainDays = 0; // Count days with rain
-                    
-                    // Check the next 5 days (40 readings for 3-hour intervals)
-                    const readings = data.list.slice(0, 40);
-                    
-                    // Group readings by day to count wet days
-                    const dailyRainCheck = {};
-                    
-                    readings.forEach(reading => {
-                        if (reading.main) {
-                            if (reading.main.temp_min < minTemp) {
-                                minTemp = reading.main.temp_min;
-                            }
-                            if (reading.main.temp_max > maxTemp) {
-                                maxTemp = reading.main.temp_max;
-                            }
-                            
-                            // Check for rainfall to count wet days
-                            const date = reading.dt_txt.split(' ')[0]; // Get just the date
-                            if (!dailyRainCheck[date]) {
-                                dailyRainCheck[date] = false;
-                            }
-                            
-                            // If there's rain in this 3-hour period, mark the day as wet
-                            if (reading.rain && reading.rain['3h'] > 0) {
-                                dailyRainCheck[date] = true;
-                            }
-                        }
-                    });
-                    
-                    // Count wet days
-                    rainDays = Object.values(dailyRainCheck).filter(isWet => isWet).length;
-                    
-                    // Update the input fields
-                    minTempInput.value = minTemp.toFixed(2);
-                    maxTempInput.value = maxTemp.toFixed(2);
-                    
-                    // Estimate wet day frequency based on forecast
-                    // This is days with rain / total days in forecast
-                    const daysInForecast = Object.keys(dailyRainCheck).length;
-                    if (daysInForecast > 0) {
-                        wetDayFreqInput.value = (rainDays / daysInForecast * 30).toFixed(2); // Scale to monthly
+                // Fill every feature the server could derive
+                Object.entries(fields).forEach(([name, input]) => {
+                    if (data[name] !== undefined && data[name] !== null) {
+                        input.value = Number(data[name]).toFixed(2);
                     }
-                    
-                    // Estimate evapotranspiration based on temperature and other factors
-                    // This is a simplified version of the Hargreaves equation
-                    const meanTemp = (minTemp + maxTemp) / 2;
-                    const tempRange = maxTemp - minTemp;
-                    const extraterrestrialRadiation = 15; // Approximate value, varies by latitude and time of year
-                    
-                    // Simplified Hargreaves formula for reference evapotranspiration (mm/day)
-                    const eto = 0.0023 * extraterrestrialRadiation * Math.sqrt(tempRange) * (meanTemp + 17.8);
-                    
-                    // Set monthly value (approx. 30 days)
-                    evapotranspirationInput.value = (eto * 30).toFixed(2);
-                }
+                });
                 
                 // Update the weather summary display
                 updateWeatherSummary();
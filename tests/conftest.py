@@ -0,0 +1,35 @@
+"""
+Shared test setup.
+
+Files the app writes (database, journals, indexes, logs) go to a temporary
+directory; this runs before any test imports ``app.config``.
+"""
+import os
+import tempfile
+import pytest
+
+WORK_DIR = tempfile.mkdtemp(prefix="lsd-tests-")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}"
+os.environ["WRITE_BEHIND_DIR"] = os.path.join(WORK_DIR, "write_behind")
+os.environ["EMBEDDING_INDEX_DIR"] = os.path.join(WORK_DIR, "embedding_index")
+os.environ["ANALYTICS_DIR"] = os.path.join(WORK_DIR, "analytics")
+os.environ["PROFILE_DIR"] = os.path.join(WORK_DIR, "profiles")
+os.environ["LOG_DIR"] = os.path.join(WORK_DIR, "logs")
+os.environ["RESCORE_CHECKPOINT"] = os.path.join(WORK_DIR, "rescore_checkpoint.json")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables."""
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
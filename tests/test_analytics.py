@@ -0,0 +1,88 @@
+import datetime
+import os
+import pytest
+from app.analytics import export_predictions, load_state, summarize
+from app.models import IdBlock, Prediction
+
+pytest.importorskip("pyarrow")
+
+
+def add_predictions(db, *specs):
+    rows = []
+    for created_at, city, clinical, image, score in specs:
+        rows.append(Prediction(
+            user_id=1, created_at=created_at, city=city, clinical_model_result=clinical,
+            image_model_result=image, combined_score=score, pipeline_mode="full",
+            clinical_features={"mean_temp": 27.5, "precipitation": "3.2"},
+        ))
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+
+def parts(directory):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), directory)
+        for root, _, names in os.walk(directory) for name in names if name.endswith(".parquet")
+    )
+
+
+def test_export_is_incremental_and_partitioned_by_month(db, tmp_path):
+    directory = str(tmp_path / "analytics")
+    add_predictions(
+        db,
+        (datetime.datetime(2026, 5, 30), "Pune", True, False, 0.7),
+        (datetime.datetime(2026, 6, 1), "Pune", False, False, 0.1),
+        (datetime.datetime(2026, 6, 2), "Nashik", False, True, 0.6),
+    )
+    state = export_predictions(db, directory, chunk_size=2)
+    assert state["exported"] == 3 and state["last_id"] == 3 and state["rows"] == 3
+    assert parts(directory) == [
+        "month=2026-05/part-000000000001-000000000002.parquet",
+        "month=2026-06/part-000000000001-000000000002.parquet",
+        "month=2026-06/part-000000000003-000000000003.parquet",
+    ]
+
+    # Nothing new: the high-water mark keeps earlier rows from being written twice
+    assert export_predictions(db, directory)["exported"] == 0
+    add_predictions(db, (datetime.datetime(2026, 6, 3), "Pune", True, True, 0.9))
+    state = export_predictions(db, directory)
+    assert state["exported"] == 1 and state["rows"] == 4
+    assert load_state(directory)["last_id"] == 4
+
+
+def test_export_stops_below_an_open_write_behind_block(db, tmp_path):
+    directory = str(tmp_path / "analytics")
+    add_predictions(db, *[(datetime.datetime(2026, 6, day), "Pune", False, False, 0.1) for day in (1, 2, 3)])
+    db.add(IdBlock(start_id=3, end_id=103, owner="worker"))
+    db.commit()
+    assert export_predictions(db, directory)["last_id"] == 2
+
+    db.query(IdBlock).update({IdBlock.closed_at: datetime.datetime.utcnow()})
+    db.commit()
+    assert export_predictions(db, directory)["last_id"] == 3
+
+
+def test_summarize(db, tmp_path):
+    directory = str(tmp_path / "analytics")
+    add_predictions(
+        db,
+        (datetime.datetime(2026, 5, 30), "Pune", True, False, 0.7),
+        (datetime.datetime(2026, 6, 1), "Pune", False, False, 0.1),
+        (datetime.datetime(2026, 6, 2), "Nashik", False, True, 0.6),
+    )
+    export_predictions(db, directory)
+
+    by_month = summarize("month", directory=directory)
+    assert [(row["month"], row["predictions"], row["affected"]) for row in by_month] == [
+        ("2026-05", 1, 1), ("2026-06", 2, 1),
+    ]
+    assert by_month[1]["mean_combined_score"] == pytest.approx(0.35)
+
+    by_city = summarize("city", since=datetime.date(2026, 6, 1), directory=directory)
+    assert [(row["city"], row["predictions"]) for row in by_city] == [("Nashik", 1), ("Pune", 1)]
+    assert summarize("city", city="Pune", until=datetime.date(2026, 6, 1), directory=directory)[0]["predictions"] == 1
+
+    with pytest.raises(ValueError):
+        summarize("user_id", directory=directory)
+    assert summarize(directory=str(tmp_path / "missing")) == []
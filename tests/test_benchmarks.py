@@ -0,0 +1,58 @@
+import json
+import math
+import pytest
+from benchmarks.common import compare_results, format_table, run_threaded, save_results, summarize
+
+
+def test_summarize_reports_percentiles_in_milliseconds():
+    result = summarize("stage", 2, [0.001 * n for n in range(1, 101)], wall_seconds=2.0, errors=1)
+    assert result["requests"] == 100 and result["errors"] == 1
+    assert result["throughput_rps"] == 50.0
+    assert result["mean_ms"] == pytest.approx(50.5)
+    assert result["p50_ms"] == pytest.approx(50.5)
+    assert result["p99_ms"] == pytest.approx(99.01)
+    assert result["rss_mb"] > 0
+
+
+def test_summarize_without_samples():
+    result = summarize("stage", 1, [], wall_seconds=0.0, errors=3)
+    assert result["requests"] == 0 and result["mean_ms"] is None and result["throughput_rps"] is None
+    assert math.isnan(result["p50_ms"])
+
+
+def test_run_threaded_counts_failures_separately():
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) % 2 == 0:
+            raise RuntimeError("fail")
+
+    result = run_threaded("flaky", fn, iterations=10, concurrency=2, warmup=0)
+    assert len(calls) == 10
+    assert result["requests"] + result["errors"] == 10
+    assert result["errors"] == 5
+
+
+def test_saved_results_compare_against_a_new_run(tmp_path):
+    baseline = [{"name": "cnn", "concurrency": 1, "p50_ms": 10.0, "p99_ms": 20.0, "throughput_rps": 100.0}]
+    path = save_results(baseline, {"iterations": 5}, output=str(tmp_path / "baseline.json"))
+    saved = json.loads((tmp_path / "baseline.json").read_text())
+    assert saved["meta"]["iterations"] == 5 and "timestamp" in saved["meta"]
+
+    current = [
+        {"name": "cnn", "concurrency": 1, "p50_ms": 5.0, "p99_ms": 30.0, "throughput_rps": 200.0},
+        {"name": "new", "concurrency": 1, "p50_ms": 1.0, "p99_ms": 1.0, "throughput_rps": 1.0},
+    ]
+    lines = compare_results(path, current)
+    assert lines == [
+        "cnn x1: p50_ms 10.00 -> 5.00 (-50.0%), p99_ms 20.00 -> 30.00 (+50.0%), "
+        "throughput_rps 100.00 -> 200.00 (+100.0%)"
+    ]
+
+
+def test_format_table_has_a_row_per_result():
+    result = summarize("make_prediction", 4, [0.01, 0.02], wall_seconds=1.0)
+    table = format_table([result]).splitlines()
+    assert table[0].startswith("benchmark")
+    assert table[2].startswith("make_prediction") and len(table) == 3
@@ -0,0 +1,75 @@
+import gzip
+import json
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from app import compression
+from app.compression import CompressionMiddleware, choose_encoding
+
+LARGE = {"items": ["lumpy skin disease"] * 200}
+
+
+@pytest.fixture
+def client():
+    app = Starlette(routes=[
+        Route("/large", lambda request: JSONResponse(LARGE)),
+        Route("/small", lambda request: PlainTextResponse("ok")),
+        Route("/image", lambda request: Response(b"\x89PNG" * 1000, media_type="image/png")),
+        Route("/etag", lambda request: JSONResponse(LARGE, headers={"ETag": '"abc"'})),
+    ])
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return TestClient(app)
+
+
+def test_choose_encoding_prefers_brotli(monkeypatch):
+    assert choose_encoding("gzip, deflate, br") == ("br" if compression.brotli else "gzip")
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("gzip, deflate, br") == "gzip"
+
+
+def test_choose_encoding_honours_quality_values():
+    assert choose_encoding("br;q=0, gzip;q=0.5") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+
+
+def test_large_json_is_gzipped(client):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    # The client decodes transparently; the wire size is what shrank
+    assert response.json() == LARGE
+    assert int(response.headers["content-length"]) < len(json.dumps(LARGE))
+
+
+def test_large_json_is_brotli_encoded_when_accepted(client):
+    if compression.brotli is None:
+        pytest.skip("brotli is not installed")
+    response = client.get("/large", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "br"
+
+
+def test_small_and_binary_responses_pass_through(client):
+    for path in ("/small", "/image"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+
+def test_uncompressed_without_accept_encoding(client):
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == LARGE
+
+
+def test_strong_etag_is_weakened(client):
+    response = client.get("/etag", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["etag"] == 'W/"abc"'
+
+
+def test_gzip_body_is_a_valid_gzip_stream(client):
+    with client.stream("GET", "/large", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+    assert json.loads(gzip.decompress(raw)) == LARGE
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from app.embeddings import EmbeddingIndex, INITIAL_CAPACITY, find_similar_cases
+from app.models import Prediction, User
+
+DIM = 8
+
+
+def unit(seed: int) -> np.ndarray:
+    vector = np.random.default_rng(seed).normal(size=DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return EmbeddingIndex(str(tmp_path / "index"), DIM)
+
+
+def test_add_many_appends_once_per_prediction(index):
+    assert index.add_many([(1, 7, unit(1)), (2, 7, unit(2))]) == 2
+    # Replayed or retried predictions are not indexed twice
+    assert index.add_many([(2, 7, unit(2)), (3, 8, unit(3))]) == 1
+    assert index.count == 3
+    np.testing.assert_allclose(index.vector_for(2), unit(2), atol=1e-3)
+    assert index.vector_for(99) is None
+
+
+def test_add_many_grows_past_the_initial_capacity(index):
+    items = [(i, 1, unit(i)) for i in range(1, INITIAL_CAPACITY + 10)]
+    assert index.add_many(items) == len(items)
+    assert index.capacity >= len(items)
+    np.testing.assert_allclose(index.vector_for(INITIAL_CAPACITY + 5), unit(INITIAL_CAPACITY + 5), atol=1e-3)
+
+
+def test_other_processes_rows_are_mapped_on_refresh(index):
+    other = EmbeddingIndex(index.directory, DIM)
+    other.add(5, 1, unit(5))
+    np.testing.assert_allclose(index.vector_for(5), unit(5), atol=1e-3)
+
+
+def test_search_filters_by_user_and_excludes_the_query(index):
+    index.add_many([(1, 1, unit(1)), (2, 1, unit(1)), (3, 2, unit(1)), (4, 1, unit(4))])
+    neighbours = index.search(unit(1), k=5, user_id=1, exclude_id=1)
+    assert [prediction_id for prediction_id, _ in neighbours][0] == 2
+    assert 3 not in {prediction_id for prediction_id, _ in neighbours}
+
+
+def test_similar_cases_include_pending_predictions(db):
+    user = User(username="vet", email="vet@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    # Nothing is stored or indexed yet; both predictions are still with the write-behind writer
+    pending = {
+        1: Prediction(id=1, user_id=user.id, image_model_version="cnn-test", city="Pune"),
+        2: Prediction(id=2, user_id=user.id, image_model_version="cnn-test", city="Nashik"),
+    }
+    embeddings = {1: unit(1), 2: unit(1)}
+    cases = find_similar_cases(db, 1, user.id, 5, pending=pending, pending_embeddings=embeddings)
+    assert [case["id"] for case in cases] == [2]
+    assert cases[0]["city"] == "Nashik"
+    assert find_similar_cases(db, 1, user.id + 1, 5, pending=pending, pending_embeddings=embeddings) is None
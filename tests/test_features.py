@@ -0,0 +1,122 @@
+import math
+import numpy as np
+import pytest
+from app import features
+from app.features import (
+    CLIMATE_FEATURES, _arrays_from_payloads, derive_features, fill_missing_features, get_cell_climates, grid_cell
+)
+
+
+def payload(temp, humidity, clouds, rain, days):
+    """Current/forecast documents; ``days`` lists (temp_min, temp_max, rain) per 3-hour reading and day."""
+    readings = []
+    for day, day_readings in enumerate(days):
+        for hour, (low, high, wet) in enumerate(day_readings):
+            reading = {"dt_txt": f"2026-06-{day + 1:02d} {hour * 3:02d}:00:00", "main": {"temp_min": low, "temp_max": high}}
+            if wet:
+                reading["rain"] = {"3h": wet}
+            readings.append(reading)
+    current = {"main": {"temp": temp, "humidity": humidity}, "clouds": {"all": clouds}}
+    if rain:
+        current["rain"] = {"3h": rain}
+    return current, {"list": readings}
+
+
+def reference_features(current, forecast):
+    """Per-location derivation written out longhand, as the browser used to compute it."""
+    temp, humidity = current["main"]["temp"], current["main"]["humidity"]
+    readings = forecast["list"][:40]
+    low = min(r["main"]["temp_min"] for r in readings)
+    high = max(r["main"]["temp_max"] for r in readings)
+    days = {}
+    for r in readings:
+        day = r["dt_txt"].split(" ")[0]
+        days[day] = days.get(day, False) or r.get("rain", {}).get("3h", 0) > 0
+    et = 0.0023 * 15.0 * math.sqrt(max(high - low, 0)) * ((low + high) / 2 + 17.8) * 30
+    return {
+        "cloud_cover": current["clouds"]["all"],
+        "evapotranspiration": et,
+        "precipitation": current.get("rain", {}).get("3h", 0),
+        "min_temp": low,
+        "mean_temp": temp,
+        "max_temp": high,
+        "vapour_pressure": humidity / 100 * 6.112 * math.exp(17.67 * temp / (temp + 243.5)),
+        "wet_day_freq": sum(days.values()) / len(days) * 30,
+    }
+
+
+PAYLOADS = [
+    payload(28.0, 70, 40, 0.0, [[(22, 30, 0), (23, 31, 1.5)], [(21, 29, 0)], [(20, 33, 0.2), (24, 32, 0)]]),
+    payload(15.5, 90, 100, 2.5, [[(10, 18, 3.0)], [(9, 16, 1.0)]]),
+    payload(35.0, 20, 0, 0.0, [[(25, 41, 0)] * 8] * 5),
+]
+
+
+def test_vectorized_derivation_matches_per_location_reference():
+    derived = derive_features(**_arrays_from_payloads(PAYLOADS))
+    for i, (current, forecast) in enumerate(PAYLOADS):
+        expected = reference_features(current, forecast)
+        for name in CLIMATE_FEATURES:
+            assert derived[name][i] == pytest.approx(expected[name]), name
+
+
+def test_batch_matches_single_location_calls():
+    batch = derive_features(**_arrays_from_payloads(PAYLOADS))
+    for i, item in enumerate(PAYLOADS):
+        single = derive_features(**_arrays_from_payloads([item]))
+        for name in CLIMATE_FEATURES:
+            np.testing.assert_allclose(single[name], batch[name][i:i + 1])
+
+
+def test_missing_forecast_leaves_forecast_features_undefined():
+    current, _ = PAYLOADS[0]
+    with pytest.warns(RuntimeWarning):
+        derived = derive_features(**_arrays_from_payloads([(current, {"list": []})]))
+    assert derived["mean_temp"][0] == 28.0
+    assert np.isnan(derived["min_temp"][0]) and np.isnan(derived["wet_day_freq"][0])
+
+
+@pytest.fixture
+def weather(monkeypatch):
+    """Serves PAYLOADS[0] for every cell and counts the lookups."""
+    calls = []
+    features._cache.clear()
+    monkeypatch.setattr(features, "get_current_weather", lambda lat, lon: calls.append((lat, lon)) or PAYLOADS[0][0])
+    monkeypatch.setattr(features, "get_forecast", lambda lat, lon: PAYLOADS[0][1])
+    yield calls
+    features._cache.clear()
+
+
+def test_fill_missing_features_keeps_client_values(weather):
+    filled = fill_missing_features({"mean_temp": 12.0, "cloud_cover": None}, 18.52, 73.85)
+    expected = reference_features(*PAYLOADS[0])
+    assert filled["mean_temp"] == 12.0
+    assert filled["cloud_cover"] == 40
+    assert filled["wet_day_freq"] == pytest.approx(expected["wet_day_freq"], abs=0.01)
+    assert (filled["latitude"], filled["longitude"]) == (18.52, 73.85)
+    assert all(filled[name] is not None for name in CLIMATE_FEATURES)
+
+
+def test_complete_or_unlocated_features_are_not_looked_up(weather):
+    complete = dict.fromkeys(CLIMATE_FEATURES, 1.0)
+    assert fill_missing_features(complete, 18.5, 73.8) == {**complete, "latitude": 18.5, "longitude": 73.8}
+    assert fill_missing_features({"mean_temp": None}, None, None) == {"mean_temp": None}
+    assert weather == []
+
+
+def test_weather_is_fetched_once_per_grid_cell(weather):
+    coords = [(18.51, 73.81), (18.52, 73.82), (19.05, 72.85)]
+    assert grid_cell(*coords[0]) == grid_cell(*coords[1])
+    climates = get_cell_climates(coords)
+    assert climates[0] is climates[1] and climates[2] is not None
+    assert len(weather) == 2
+    get_cell_climates(coords)
+    assert len(weather) == 2
+
+
+def test_unavailable_weather_leaves_features_missing(monkeypatch):
+    features._cache.clear()
+    monkeypatch.setattr(features, "get_current_weather", lambda lat, lon: None)
+    monkeypatch.setattr(features, "get_forecast", lambda lat, lon: None)
+    assert get_cell_climates([(18.5, 73.8)]) == [None]
+    assert fill_missing_features({"mean_temp": None}, 18.5, 73.8)["mean_temp"] is None
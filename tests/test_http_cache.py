@@ -0,0 +1,67 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from app.http_cache import ETagMiddleware, compute_etag, conditional_response
+
+REPORT = b"<p>Report</p>"
+
+
+def report(request: Request):
+    return conditional_response(request, REPORT, "text/html; charset=utf-8", cache_control="private, max-age=86400")
+
+
+@pytest.fixture
+def client():
+    app = Starlette(routes=[
+        Route("/api/data", lambda request: JSONResponse({"count": 3})),
+        Route("/api/report", report),
+        Route("/api/missing", lambda request: JSONResponse({"detail": "Not found"}, status_code=404)),
+        Route("/api/stream", lambda request: StreamingResponse(iter([b"a", b"b"]))),
+        Route("/page", lambda request: JSONResponse({"count": 3})),
+    ])
+    app.add_middleware(ETagMiddleware)
+    return TestClient(app)
+
+
+def test_api_get_gets_an_etag(client):
+    response = client.get("/api/data")
+    assert response.status_code == 200
+    assert response.headers["etag"] == compute_etag(response.content)
+    assert response.headers["cache-control"] == "private, no-cache"
+
+
+def test_matching_if_none_match_returns_304(client):
+    etag = client.get("/api/data").headers["etag"]
+    response = client.get("/api/data", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_weak_and_listed_etags_match(client):
+    etag = client.get("/api/data").headers["etag"]
+    assert client.get("/api/data", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get("/api/data", headers={"If-None-Match": "*"}).status_code == 304
+
+
+def test_stale_etag_returns_the_body(client):
+    response = client.get("/api/data", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json() == {"count": 3}
+
+
+def test_conditional_response_answers_304(client):
+    first = client.get("/api/report")
+    assert first.headers["cache-control"] == "private, max-age=86400"
+    second = client.get("/api/report", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+    assert second.content == b""
+
+
+def test_errors_streams_and_pages_are_left_alone(client):
+    assert "etag" not in client.get("/api/missing").headers
+    assert "etag" not in client.get("/api/stream").headers
+    assert "etag" not in client.get("/page").headers
@@ -0,0 +1,145 @@
+import asyncio
+import datetime
+import pytest
+from fastapi import HTTPException
+from app import idempotency
+from app.idempotency import InFlightDeduplicator, find_replay, request_fingerprint
+from app.models import Prediction, PredictionRequest
+
+CLINICAL = {"mean_temp": 27.5, "precipitation": 3.2}
+
+
+def fingerprint(**overrides) -> str:
+    args = dict(user_id=1, image_data=b"image", clinical_data=CLINICAL, language="English",
+                latitude=18.5, longitude=73.8, mode="full")
+    args.update(overrides)
+    return request_fingerprint(**args)
+
+
+def store(db, user_id: int, key, content_hash: str, age: datetime.timedelta = datetime.timedelta()) -> Prediction:
+    prediction = Prediction(user_id=user_id, report="report")
+    db.add(prediction)
+    db.flush()
+    db.add(PredictionRequest(user_id=user_id, idempotency_key=key, content_hash=content_hash,
+                             prediction_id=prediction.id, created_at=datetime.datetime.utcnow() - age))
+    db.commit()
+    return prediction
+
+
+def test_fingerprint_covers_every_input():
+    assert fingerprint() == fingerprint(clinical_data=dict(reversed(list(CLINICAL.items()))))
+    variants = [
+        fingerprint(user_id=2), fingerprint(image_data=b"other"), fingerprint(clinical_data={"mean_temp": 28}),
+        fingerprint(language="Hindi"), fingerprint(latitude=18.6), fingerprint(longitude=None),
+        fingerprint(mode="screening"),
+    ]
+    assert len({fingerprint(), *variants}) == len(variants) + 1
+
+
+def test_same_key_and_payload_replays_the_prediction(db):
+    prediction = store(db, 1, "key-1", fingerprint())
+    assert find_replay(db, 1, "key-1", fingerprint()).id == prediction.id
+    # Keys are scoped to the user
+    assert find_replay(db, 2, "key-1", fingerprint(user_id=2)) is None
+
+
+def test_reused_key_with_different_payload_is_a_conflict(db):
+    store(db, 1, "key-1", fingerprint())
+    with pytest.raises(HTTPException) as error:
+        find_replay(db, 1, "key-1", fingerprint(language="Hindi"))
+    assert error.value.status_code == 409
+
+
+def test_expired_key_can_be_reused(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_KEY_TTL_SECONDS", 60)
+    store(db, 1, "key-1", fingerprint(), age=datetime.timedelta(minutes=5))
+    assert find_replay(db, 1, "key-1", fingerprint(language="Hindi")) is None
+
+
+def test_duplicate_without_key_replays_within_the_window(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WINDOW_SECONDS", 60)
+    recent = store(db, 1, None, fingerprint())
+    assert find_replay(db, 1, None, fingerprint()).id == recent.id
+    assert find_replay(db, 1, None, fingerprint(mode="image")) is None
+
+    stale = fingerprint(language="Marathi")
+    store(db, 1, None, stale, age=datetime.timedelta(minutes=5))
+    assert find_replay(db, 1, None, stale) is None
+
+
+def test_pending_prediction_is_checked_before_the_database(db, monkeypatch):
+    pending = Prediction(id=42, user_id=1)
+    monkeypatch.setattr(idempotency.prediction_writer, "find_pending",
+                        lambda user_id, key, content_hash: (fingerprint(), pending))
+    assert find_replay(db, 1, "key-1", fingerprint()) is pending
+    with pytest.raises(HTTPException) as error:
+        find_replay(db, 1, "key-1", fingerprint(language="Hindi"))
+    assert error.value.status_code == 409
+
+
+def test_concurrent_duplicates_share_one_computation():
+    async def scenario():
+        deduplicator = InFlightDeduplicator()
+        calls = []
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        tasks = [asyncio.create_task(deduplicator.run("same", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await asyncio.gather(*tasks) == ["result"] * 3
+        assert calls == [1]
+        # Finished keys are forgotten, so a later submission computes again
+        assert await deduplicator.run("same", compute) == "result"
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_reused_key_with_different_payload_in_flight_is_a_conflict():
+    async def scenario():
+        deduplicator = InFlightDeduplicator()
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return 7
+
+        first = asyncio.create_task(deduplicator.run("1:key-1", compute, fingerprint=fingerprint(), user_id=1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as error:
+            await deduplicator.run("1:key-1", compute, fingerprint=fingerprint(language="Hindi"), user_id=1)
+        assert error.value.status_code == 409
+        # The same payload under the same key still joins the running computation
+        same = asyncio.create_task(deduplicator.run("1:key-1", compute, fingerprint=fingerprint(), user_id=1))
+        await asyncio.sleep(0.01)
+        release.set()
+        assert await asyncio.gather(first, same) == [7, 7]
+        assert calls == [1]
+
+    asyncio.run(scenario())
+
+
+def test_duplicates_see_the_original_failure():
+    async def scenario():
+        deduplicator = InFlightDeduplicator()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            raise ValueError("model failed")
+
+        tasks = [asyncio.create_task(deduplicator.run("same", compute)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert deduplicator._in_flight == {}
+
+    asyncio.run(scenario())
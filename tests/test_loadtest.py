@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import random
+import pytest
+import requests
+from benchmarks import fakes
+from benchmarks.fakes import FakeGenerativeModel, FakeWeatherSession, ServiceProfile
+from benchmarks.loadtest import Recorder, drive, parse_mix
+
+
+def test_profile_spec_parsing():
+    profile = ServiceProfile.parse("latency=uniform:0.1:0.2,error_rate=0.1,timeout_rate=0.05,error_status=500")
+    assert profile.describe() == {
+        "latency": "uniform:0.1:0.2", "error_rate": 0.1, "timeout_rate": 0.05, "error_status": 500, "hang": 60.0,
+    }
+    assert ServiceProfile.parse("").sample() == ("ok", 0.0)
+    with pytest.raises(ValueError):
+        ServiceProfile.parse("latency=gamma:1")
+    with pytest.raises(ValueError):
+        ServiceProfile.parse("jitter=1")
+
+
+def test_profile_outcome_mix_and_latency():
+    profile = ServiceProfile.parse("latency=lognormal:0.5:0.3,error_rate=0.2,timeout_rate=0.1,hang=9", seed=1)
+    draws = [profile.sample() for _ in range(5000)]
+    outcomes = [outcome for outcome, _ in draws]
+    assert outcomes.count("timeout") / len(draws) == pytest.approx(0.1, abs=0.02)
+    assert outcomes.count("error") / len(draws) == pytest.approx(0.2, abs=0.02)
+    assert all(delay == 9 for outcome, delay in draws if outcome == "timeout")
+    delays = sorted(delay for outcome, delay in draws if outcome != "timeout")
+    assert delays[len(delays) // 2] == pytest.approx(0.5, rel=0.05)
+
+
+def test_fake_weather_session_answers_like_openweathermap():
+    session = FakeWeatherSession(ServiceProfile())
+    reverse = session.get("http://fake/geo/1.0/reverse?lat=18.5&lon=73.8&limit=1", timeout=5)
+    assert reverse.status_code == 200 and reverse.json()[0]["name"]
+    assert session.get("http://fake/nowhere", timeout=5).status_code == 404
+
+    failing = FakeWeatherSession(ServiceProfile(error_rate=1.0, error_status=502))
+    assert failing.get("http://fake/data/2.5/weather?lat=1&lon=2").status_code == 502
+    hanging = FakeWeatherSession(ServiceProfile(timeout_rate=1.0, hang=60))
+    with pytest.raises(requests.Timeout):
+        hanging.get("http://fake/data/2.5/weather?lat=1&lon=2", timeout=0.01)
+
+
+def test_fake_gemini_model():
+    assert FakeGenerativeModel(ServiceProfile()).generate_content("prompt").text
+    with pytest.raises(ConnectionError):
+        FakeGenerativeModel(ServiceProfile(error_rate=1.0)).generate_content("prompt")
+    with pytest.raises(TimeoutError):
+        FakeGenerativeModel(ServiceProfile(timeout_rate=1.0)).generate_content("prompt", {"timeout": 0.01})
+
+
+def test_fake_servers_over_http():
+    weather = fakes.start_fake_weather(ServiceProfile())
+    gemini = fakes.start_fake_gemini(ServiceProfile(error_rate=1.0, error_status=503))
+    try:
+        forecast = requests.get(f"{weather.url}/data/2.5/forecast?lat=18.5&lon=73.8", timeout=5)
+        assert forecast.status_code == 200 and forecast.json()
+        failed = requests.post(f"{gemini.url}/v1beta/models/gemini:generateContent", json={}, timeout=5)
+        assert failed.status_code == 503 and failed.json()["error"]["code"] == 503
+    finally:
+        for server in (weather, gemini):
+            server.shutdown()
+            server.server_close()
+
+
+def test_parse_mix():
+    assert parse_mix("predict=6, dashboard=3,login") == {"predict": 6.0, "dashboard": 3.0, "login": 1.0}
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mix("browse=1")
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mix("predict=0")
+
+
+def test_recorder_counts_non_2xx_as_errors():
+    recorder = Recorder()
+    for latency, status in ((0.1, 200), (0.2, 200), (0.3, 429), (0.4, 0)):
+        recorder.record("POST /api/predict", latency, status)
+    [result] = recorder.results(wall_seconds=1.0, concurrency=4)
+    assert result["requests"] == 2 and result["errors"] == 2
+    assert result["status_counts"] == {"0": 1, "200": 2, "429": 1}
+
+
+def test_drive_is_open_loop_and_drops_beyond_the_in_flight_cap():
+    class Scenario:
+        def __init__(self):
+            self.started = 0
+
+        async def predict(self):
+            self.started += 1
+            await asyncio.sleep(0.2)
+
+    scenario = Scenario()
+    stats = asyncio.run(drive(scenario, {"predict": 1.0}, rps=200, duration=0.1, max_in_flight=5,
+                              rng=random.Random(0)))
+    # Slow flows do not hold back arrivals; the ones past the cap are dropped
+    assert stats["launched"] == scenario.started == 5
+    assert stats["dropped"] > 0
+    assert stats["wall_seconds"] >= 0.2
@@ -0,0 +1,72 @@
+import json
+import logging
+import queue
+from logging.handlers import QueueListener
+from prometheus_client import REGISTRY
+from app.logger import DeferredQueueHandler, JsonFormatter
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def dropped_info() -> float:
+    return REGISTRY.get_sample_value("lsd_log_records_dropped_total", {"level": "INFO"}) or 0.0
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(f"test_logger.{name}")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def test_message_is_captured_at_the_logging_call():
+    records = queue.Queue()
+    logger = make_logger("freeze", DeferredQueueHandler(records))
+    state = {"status": "pending"}
+    logger.info("Prediction %s is %s", 7, state)
+    state["status"] = "stored"
+
+    record = records.get_nowait()
+    assert record.getMessage() == "Prediction 7 is {'status': 'pending'}"
+    assert record.args is None
+
+
+def test_tracebacks_are_formatted_on_the_listener():
+    records = queue.Queue()
+    logger = make_logger("traceback", DeferredQueueHandler(records))
+    try:
+        raise ValueError("bad input")
+    except ValueError:
+        logger.error("Scoring failed", exc_info=True, extra={"prediction_id": 3})
+
+    record = records.get_nowait()
+    assert record.exc_info is not None and record.exc_text is None
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload["message"] == "Scoring failed"
+    assert payload["prediction_id"] == 3
+    assert "ValueError: bad input" in payload["exception"]
+
+
+def test_full_queue_drops_only_records_below_warning():
+    records = queue.Queue(maxsize=1)
+    written = Capture()
+    listener = QueueListener(records, written, respect_handler_level=True)
+    logger = make_logger("full", DeferredQueueHandler(records, listener))
+    before = dropped_info()
+
+    logger.info("queued")
+    logger.info("dropped")
+    logger.warning("written directly")
+    logger.error("also written directly")
+
+    assert records.get_nowait().getMessage() == "queued"
+    assert dropped_info() == before + 1
+    assert [record.getMessage() for record in written.records] == ["written directly", "also written directly"]
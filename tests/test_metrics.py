@@ -0,0 +1,75 @@
+import pytest
+from prometheus_client import REGISTRY
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from app.metrics import MetricsMiddleware, record_cache, render_metrics, time_stage
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def latency_count(route: str, status: str = "200") -> float:
+    return sample("lsd_http_request_duration_seconds_count", method="GET", route=route, status=status)
+
+
+@pytest.fixture
+def client():
+    def metrics(request):
+        payload, content_type = render_metrics()
+        return Response(payload, media_type=content_type)
+
+    app = Starlette(routes=[
+        Route("/api/predictions/{prediction_id}", lambda request: JSONResponse({"id": request.path_params["prediction_id"]})),
+        Route("/boom", lambda request: JSONResponse({"detail": "boom"}, status_code=503)),
+        Route("/metrics", metrics),
+    ])
+    app.add_middleware(MetricsMiddleware)
+    return TestClient(app)
+
+
+def test_requests_are_labelled_by_route_template(client):
+    before = latency_count("/api/predictions/{prediction_id}")
+    client.get("/api/predictions/1")
+    client.get("/api/predictions/2")
+    assert latency_count("/api/predictions/{prediction_id}") == before + 2
+    assert sample("lsd_http_requests_in_flight", method="GET", route="/api/predictions/{prediction_id}") == 0
+
+
+def test_status_and_unmatched_routes(client):
+    before_error, before_unmatched = latency_count("/boom", "503"), latency_count("unmatched", "404")
+    client.get("/boom")
+    client.get("/no/such/page")
+    assert latency_count("/boom", "503") == before_error + 1
+    assert latency_count("unmatched", "404") == before_unmatched + 1
+
+
+def test_metrics_endpoint_is_not_observed(client):
+    before = latency_count("/metrics")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert b"lsd_http_request_duration_seconds" in response.content
+    assert latency_count("/metrics") == before
+
+
+def test_time_stage_observes_even_when_the_stage_fails():
+    before = sample("lsd_stage_duration_seconds_count", stage="test_stage")
+    with time_stage("test_stage"):
+        pass
+    with pytest.raises(RuntimeError):
+        with time_stage("test_stage"):
+            raise RuntimeError("stage failed")
+    assert sample("lsd_stage_duration_seconds_count", stage="test_stage") == before + 2
+
+
+def test_record_cache_counts_hits_and_misses():
+    hits = sample("lsd_cache_requests_total", cache="test_cache", result="hit")
+    misses = sample("lsd_cache_requests_total", cache="test_cache", result="miss")
+    record_cache("test_cache", True)
+    record_cache("test_cache", False)
+    record_cache("test_cache", False)
+    assert sample("lsd_cache_requests_total", cache="test_cache", result="hit") == hits + 1
+    assert sample("lsd_cache_requests_total", cache="test_cache", result="miss") == misses + 2
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from app import prediction
+from app.features import FEATURE_NAMES
+from app.models import Prediction
+
+FEATURES = dict(zip(FEATURE_NAMES, (73.8, 18.5, 40, 120, 2, 20, 26, 32, 25, 10)))
+
+
+class Stage:
+    """Records its calls and returns a fixed probability."""
+
+    def __init__(self, score: float, version: str):
+        self.score = score
+        self.version = version
+        self.calls = 0
+
+    def predict_proba(self, data):
+        self.calls += 1
+        return np.array([self.score])
+
+    def predict_with_embedding(self, image):
+        self.calls += 1
+        return self.score, np.ones(4, dtype=np.float32)
+
+
+class Reports:
+    def __init__(self):
+        self.calls = 0
+
+    def inference(self, **kwargs):
+        self.calls += 1
+        return "## LLM report"
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Pipeline with fixed model scores; returns a callable taking the mode and scores."""
+    llm = Reports()
+    monkeypatch.setattr(prediction, "get_llm", lambda: llm)
+    monkeypatch.setattr(prediction, "find_near_duplicate", lambda *args: None)
+    monkeypatch.setattr(prediction, "index_prediction", lambda *args: None)
+
+    def run(db, mode, clinical_score=0.9, image_score=0.8, clinical_data=FEATURES, image=object()):
+        forest, cnn = Stage(clinical_score, "rf-1"), Stage(image_score, "cnn-1")
+        bundle = SimpleNamespace(preprocessor=SimpleNamespace(preprocess=lambda data: data),
+                                 ml_predictor=forest, cnn_predictor=cnn)
+        monkeypatch.setattr(prediction.model_registry, "current", lambda: bundle)
+        stored = prediction.make_prediction(db, 1, image, dict(clinical_data), mode=mode)
+        return stored, forest, cnn, llm
+
+    return run
+
+
+def test_full_mode_runs_both_models_and_the_llm(db, pipeline):
+    stored, forest, cnn, llm = pipeline(db, "full")
+    assert (forest.calls, cnn.calls, llm.calls) == (1, 1, 1)
+    assert stored.report == "## LLM report"
+    assert stored.clinical_model_result is True and stored.image_model_result is True
+    assert (stored.clinical_model_version, stored.image_model_version) == ("rf-1", "cnn-1")
+    assert db.query(Prediction).one().pipeline_mode == "full"
+
+
+def test_clinical_mode_skips_the_cnn_and_the_llm(db, pipeline):
+    stored, forest, cnn, llm = pipeline(db, "clinical")
+    assert (forest.calls, cnn.calls, llm.calls) == (1, 0, 0)
+    assert stored.image_model_result is None and stored.image_model_version is None
+    assert stored.combined_score == pytest.approx(0.9)
+    assert "screening summary" in stored.report
+
+
+def test_image_mode_needs_no_clinical_features(db, pipeline):
+    stored, forest, cnn, llm = pipeline(db, "image", clinical_data={})
+    assert (forest.calls, cnn.calls, llm.calls) == (0, 1, 0)
+    assert stored.clinical_model_result is None and stored.clinical_model_version is None
+    assert stored.image_model_result is True
+
+
+def test_screening_skips_the_cnn_when_the_clinical_model_is_confident(db, pipeline):
+    stored, forest, cnn, llm = pipeline(db, "screening", clinical_score=0.02)
+    assert (forest.calls, cnn.calls, llm.calls) == (1, 0, 0)
+    assert stored.clinical_model_result is False and stored.image_model_result is None
+    assert "Not evaluated" in stored.report
+
+
+def test_screening_runs_the_cnn_when_the_clinical_model_is_unsure(db, pipeline):
+    stored, forest, cnn, llm = pipeline(db, "screening", clinical_score=0.6)
+    assert (forest.calls, cnn.calls, llm.calls) == (1, 1, 0)
+    assert stored.image_model_result is True
+
+
+def test_low_risk_full_predictions_get_the_templated_summary(db, pipeline, monkeypatch):
+    monkeypatch.setattr(prediction, "LLM_SKIP_BELOW_RISK", 0.3)
+    stored, forest, cnn, llm = pipeline(db, "full", clinical_score=0.1, image_score=0.1)
+    assert (forest.calls, cnn.calls, llm.calls) == (1, 1, 0)
+    assert "screening summary" in stored.report
+
+
+def test_missing_features_and_unknown_modes_are_rejected(db, pipeline):
+    incomplete = {name: value for name, value in FEATURES.items() if name != "mean_temp"}
+    with pytest.raises(prediction.MissingFeaturesError):
+        pipeline(db, "clinical", clinical_data=incomplete)
+    with pytest.raises(ValueError):
+        pipeline(db, "everything")
+    assert db.query(Prediction).count() == 0
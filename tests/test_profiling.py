@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+import pytest
+from app import profiling
+from app.profiling import ProfileStore, ProfilingMiddleware
+
+
+def busy_work(seconds: float = 0.05):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def slow_app(scope, receive, send):
+    # Work done in a worker thread shows up in the profile as well
+    await asyncio.to_thread(busy_work)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def call(middleware, path="/api/predict"):
+    scope = {"type": "http", "method": "POST", "path": path}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ProfileStore(str(tmp_path / "profiles"), max_files=3)
+    monkeypatch.setattr(profiling, "profile_store", store)
+    return store
+
+
+def test_store_keeps_the_newest_files(store):
+    for i in range(5):
+        store.save(f"p{i}.collapsed", "stack 1\n")
+        time.sleep(0.01)
+    assert [entry["name"] for entry in store.list()] == ["p4.collapsed", "p3.collapsed", "p2.collapsed"]
+    assert store.path_for("p4.collapsed") is not None
+    assert store.path_for("../p4.collapsed") is None and store.path_for("p0.collapsed") is None
+
+
+def test_sampled_request_is_profiled_off_the_event_loop(store, monkeypatch):
+    writers = []
+    original = store.save
+
+    def save(name, content):
+        writers.append(threading.current_thread())
+        return original(name, content)
+
+    monkeypatch.setattr(store, "save", save)
+    sent = call(ProfilingMiddleware(slow_app, sample_rate=1.0))
+    assert sent[0]["status"] == 200
+
+    (entry,) = store.list()
+    assert "-sampled-" in entry["name"] and entry["name"].endswith("-POST-api_predict.collapsed")
+    with open(store.path_for(entry["name"])) as f:
+        content = f.read()
+    assert content.startswith("# request: POST /api/predict\n# status: 200")
+    assert "test_profiling.py:busy_work" in content
+    assert writers and writers[0] is not threading.main_thread()
+
+
+def test_slow_capture_samples_a_fraction_of_requests(store, monkeypatch):
+    sessions = []
+    middleware = ProfilingMiddleware(slow_app, slow_ms=1, slow_sample_rate=0.25)
+    original = middleware.sampler.start_session
+    monkeypatch.setattr(middleware.sampler, "start_session", lambda: sessions.append(1) or original())
+
+    draws = iter([0.9, 0.5, 0.1, 0.3])
+    monkeypatch.setattr(profiling.random, "random", lambda: next(draws))
+    for _ in range(4):
+        call(middleware)
+    assert len(sessions) == 1
+    assert ["-slow-" in entry["name"] for entry in store.list()] == [True]
+
+
+def test_fast_requests_are_not_kept(store):
+    call(ProfilingMiddleware(slow_app, slow_ms=60_000, slow_sample_rate=1.0))
+    assert store.list() == []
+
+
+def test_disabled_without_settings():
+    middleware = ProfilingMiddleware(slow_app, sample_rate=0, slow_ms=0)
+    assert not middleware.enabled
+    # A slow-sample rate alone does nothing without a threshold
+    assert not ProfilingMiddleware(slow_app, slow_ms=0, slow_sample_rate=1.0).enabled
@@ -0,0 +1,212 @@
+import asyncio
+import types
+import pytest
+from fastapi import HTTPException
+from app import rate_limit
+from app.models import Prediction, PredictionRequest, User
+from app.rate_limit import AdmissionController, InMemoryBackend, Policy, RateLimiter, parse_policy
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", types.SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+def test_parse_policy():
+    assert parse_policy("login", "10/minute") == Policy("login", 10.0, 10 / 60)
+    assert parse_policy("signup", "5/hour").rate == pytest.approx(5 / 3600)
+    assert parse_policy("burst", "4/2").rate == 2.0
+
+
+def test_bucket_refuses_when_empty_then_refills(clock):
+    backend = InMemoryBackend()
+    policy = Policy("test", capacity=3, rate=1.0)
+    assert [backend.acquire("user", policy)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = backend.acquire("user", policy)
+    assert not allowed and retry_after == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert backend.acquire("user", policy) == (False, pytest.approx(0.5))
+    clock.now += 0.5
+    assert backend.acquire("user", policy)[0]
+    # Refills never exceed the burst size
+    clock.now += 3600
+    assert [backend.acquire("user", policy)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_buckets_are_per_key(clock):
+    backend = InMemoryBackend()
+    policy = Policy("test", capacity=1, rate=0.1)
+    assert backend.acquire("a", policy)[0]
+    assert not backend.acquire("a", policy)[0]
+    assert backend.acquire("b", policy)[0]
+
+
+def test_full_buckets_are_pruned(clock, monkeypatch):
+    backend = InMemoryBackend()
+    monkeypatch.setattr(InMemoryBackend, "MAX_BUCKETS", 2)
+    policy = Policy("test", capacity=1, rate=1.0)
+    backend.acquire("old", policy)
+    clock.now += 10
+    backend.acquire("a", policy)
+    backend.acquire("b", policy)
+    assert set(backend._buckets) == {"a", "b"}
+
+
+def test_limiter_raises_429_with_retry_after(clock):
+    limiter = RateLimiter(InMemoryBackend())
+    policy = Policy("predict_user", capacity=1, rate=0.25)
+    limiter.check(policy, "7")
+    with pytest.raises(HTTPException) as error:
+        limiter.check(policy, "7")
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "4"
+
+
+def test_a_refusal_by_one_policy_charges_none_of_them(clock):
+    limiter = RateLimiter(InMemoryBackend())
+    user, ip = Policy("predict_user", capacity=2, rate=0.001), Policy("predict_ip", capacity=1, rate=0.5)
+    limiter.check_all([(user, "7"), (ip, "1.2.3.4")])
+    for _ in range(3):
+        with pytest.raises(HTTPException) as error:
+            limiter.check_all([(user, "7"), (ip, "1.2.3.4")])
+        assert error.value.headers["Retry-After"] == "2"
+    # The user's second token is still there for a request from another address
+    limiter.check_all([(user, "7"), (ip, "5.6.7.8")])
+    with pytest.raises(HTTPException):
+        limiter.check(user, "7")
+
+
+def test_limiter_allows_requests_when_the_backend_fails():
+    class BrokenBackend:
+        def acquire_all(self, limits, cost=1.0):
+            raise ConnectionError("redis is down")
+
+    RateLimiter(BrokenBackend()).check(Policy("login", 1, 1), "1.2.3.4")
+
+
+def test_redis_backend_shares_the_bucket_semantics(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    import redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", staticmethod(lambda url: fakeredis.FakeRedis(server=server)))
+    first, second = rate_limit.RedisBackend("redis://test"), rate_limit.RedisBackend("redis://test")
+    policy = Policy("test", capacity=2, rate=0.001)
+    # Two workers draw from one bucket
+    assert first.acquire("user", policy)[0]
+    assert second.acquire("user", policy)[0]
+    allowed, retry_after = first.acquire("user", policy)
+    assert not allowed and retry_after > 0
+
+    # One script checks every bucket before charging any of them
+    roomy = Policy("roomy", capacity=5, rate=0.001)
+    assert first.acquire_all([("other", roomy), ("user", policy)]) == (1, pytest.approx(retry_after, rel=0.1))
+    assert first.acquire_all([("other", roomy)]) == (None, 0.0)
+    assert [second.acquire("other", roomy)[0] for _ in range(5)] == [True, True, True, True, False]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_admission_bounds_concurrency_and_queue():
+    async def scenario():
+        controller = AdmissionController("/test", max_concurrency=2, max_queue=1, queue_timeout=1.0)
+        release = asyncio.Event()
+        running = []
+
+        async def work(i):
+            async with controller.slot():
+                running.append(i)
+                await release.wait()
+            return i
+
+        tasks = [asyncio.create_task(work(i)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        assert running == [0, 1]
+        assert controller._waiting == 1
+        # Two running and one queued: the next request is turned away at once
+        with pytest.raises(HTTPException) as error:
+            async with controller.slot():
+                pass
+        assert error.value.status_code == 503
+        release.set()
+        assert sorted(await asyncio.gather(*tasks)) == [0, 1, 2]
+        assert controller._waiting == 0
+
+    run(scenario())
+
+
+def test_admission_queue_timeout():
+    async def scenario():
+        controller = AdmissionController("/test", max_concurrency=1, max_queue=5, queue_timeout=0.05)
+        async with controller.slot():
+            with pytest.raises(HTTPException) as error:
+                async with controller.slot():
+                    pass
+            assert error.value.status_code == 503
+            assert controller._waiting == 0
+        # The slot is free again afterwards
+        async with controller.slot():
+            pass
+
+    run(scenario())
+
+
+@pytest.fixture
+def api(db, monkeypatch):
+    """The app with a 2-per-user prediction budget and a pipeline that only stores a row."""
+    pytest.importorskip("tensorflow")
+    from starlette.testclient import TestClient
+    from app import main
+    from app.auth import get_current_user
+
+    user = User(username="farmer", email="farmer@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    runs = []
+
+    def fake_prediction(db, user_id, inference, content_hash, idempotency_key, **kwargs):
+        runs.append(idempotency_key)
+        prediction = Prediction(user_id=user_id, report="report")
+        db.add(prediction)
+        db.add(PredictionRequest(user_id=user_id, idempotency_key=idempotency_key, content_hash=content_hash,
+                                 prediction=prediction))
+        db.commit()
+        return prediction
+
+    monkeypatch.setattr(main, "run_inference", lambda **kwargs: None)
+    monkeypatch.setattr(main, "complete_prediction", fake_prediction)
+    monkeypatch.setattr(rate_limit, "rate_limiter", RateLimiter(InMemoryBackend()))
+    monkeypatch.setattr(rate_limit, "PREDICT_USER_POLICY", Policy("predict_user", capacity=2, rate=0.001))
+    main.app.dependency_overrides[get_current_user] = lambda: user
+    yield TestClient(main.app), runs
+    main.app.dependency_overrides.clear()
+
+
+def test_replayed_submissions_are_not_charged(api):
+    client, runs = api
+
+    def predict(key):
+        return client.post("/api/predict", data={"mode": "clinical"}, headers={"Idempotency-Key": key})
+
+    assert predict("first").status_code == 200
+    for _ in range(3):
+        replay = predict("first")
+        assert replay.status_code == 200 and replay.headers["Idempotent-Replayed"] == "true"
+    assert predict("second").status_code == 200
+    refused = predict("third")
+    assert refused.status_code == 429 and "Retry-After" in refused.headers
+    assert runs == ["first", "second"]
@@ -0,0 +1,63 @@
+import threading
+import pytest
+from app.registry import ModelRegistry
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ModelRegistry(str(tmp_path))
+    release = threading.Event()
+    loads = []
+
+    def slow_load(version, promote):
+        loads.append(version)
+        release.wait(5)
+
+    monkeypatch.setattr(registry, "_load_locked", slow_load)
+    registry.release = release
+    registry.loads = loads
+    return registry
+
+
+def test_only_one_background_load_at_a_time(registry):
+    results = []
+    barrier = threading.Barrier(8)
+
+    def activate(version):
+        barrier.wait()
+        results.append(registry.load_in_background(version))
+
+    threads = [threading.Thread(target=activate, args=(f"v{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+
+    registry.release.set()
+    # The slot is free again once the load finishes
+    for _ in range(100):
+        if registry.load_in_background("v-next"):
+            break
+        threading.Event().wait(0.01)
+    else:
+        pytest.fail("The load slot was never released")
+    assert len(registry.loads) == 2
+
+
+def test_background_load_refused_during_a_foreground_load(registry):
+    thread = threading.Thread(target=registry.load, args=("v1",))
+    thread.start()
+    while not registry.loads:
+        threading.Event().wait(0.01)
+    assert registry.load_in_background("v2") is False
+    registry.release.set()
+    thread.join(5)
+
+
+def test_current_never_loads_on_the_request_path(tmp_path):
+    pytest.importorskip("tensorflow")
+    from app.prediction import ModelLoadingError
+
+    with pytest.raises(ModelLoadingError):
+        ModelRegistry(str(tmp_path)).current()
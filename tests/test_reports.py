@@ -0,0 +1,38 @@
+from app.reports import build_templated_report, convert_to_markdown, render_report_html
+
+
+def test_scripts_and_event_handlers_are_stripped():
+    html = render_report_html(
+        "## Summary\n\n<script>alert('x')</script>\n\n"
+        "<img src=x onerror=\"alert('x')\">\n\n"
+        "<p onclick=\"steal()\">Clean <a href=\"javascript:alert(1)\">link</a></p>"
+    )
+    assert "<h2>Summary</h2>" in html
+    for unsafe in ("<script", "alert(", "<img", "onerror", "onclick", "<a ", "javascript:"):
+        assert unsafe not in html
+    assert "Clean" in html and "link" in html
+
+
+def test_markdown_structure_survives_sanitising():
+    html = render_report_html(
+        "**Prediction Summary**\nThe animal is **likely affected**.\n- Isolate it\n- Call a vet\n\n"
+        "| Feature | Value |\n| :-- | --: |\n| Cloud cover | 40 |"
+    )
+    assert "<h2>Prediction Summary</h2>" in html
+    assert "<strong>likely affected</strong>" in html
+    assert "<ul>" in html and "<li>Isolate it</li>" in html
+    assert "<table>" in html and "<td>40</td>" in html
+
+
+def test_bold_lines_become_headings_and_lists_get_a_blank_line():
+    text = convert_to_markdown("**Findings**\nSome text\n- first\n- second")
+    assert text.split("\n") == ["## Findings", "Some text", "", "- first", "- second"]
+    assert convert_to_markdown(None) == ""
+
+
+def test_templated_report_renders_safely():
+    report = build_templated_report(True, None, {"cloud_cover": "<b>40</b>"}, city="<script>Pune</script>")
+    html = render_report_html(report)
+    assert "<script" not in html
+    assert "Isolate the animal" in html
+    assert "Not evaluated" in html
@@ -0,0 +1,141 @@
+import json
+import joblib
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from app import rescore
+from app.features import CLIMATE_FEATURES, FEATURE_NAMES, CellClimate
+from app.models import DiseaseStats, Prediction
+
+MEAN_TEMP = FEATURE_NAMES.index("mean_temp")
+
+
+def features(mean_temp: float, **overrides) -> dict:
+    values = dict(zip(FEATURE_NAMES, (73.8, 18.5, 40, 120, 2, 20, mean_temp, 32, 25, 10)))
+    values.update(overrides)
+    return values
+
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    """A clinical model that calls everything above 25°C mean temperature affected."""
+    rng = np.random.default_rng(0)
+    X = np.tile(list(features(0).values()), (400, 1)) + rng.normal(scale=0.1, size=(400, 10))
+    X[:, MEAN_TEMP] = rng.uniform(10, 40, size=400)
+    y = (X[:, MEAN_TEMP] > 25).astype(int)
+    scaler = StandardScaler().fit(X)
+    forest = RandomForestClassifier(n_estimators=20, random_state=0).fit(scaler.transform(X), y)
+    joblib.dump(scaler, tmp_path / "scaler_object.joblib")
+    joblib.dump(forest, tmp_path / "randomforest_best_model.pkl")
+    monkeypatch.setattr(rescore.model_registry, "resolve", lambda version=None: ("v1", str(tmp_path)))
+    return tmp_path
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return str(tmp_path / "checkpoint.json")
+
+
+def add_rows(db, temperatures, affected=False):
+    rows = [
+        Prediction(user_id=1, city="Pune", clinical_features=features(t), clinical_model_result=affected,
+                   image_model_result=False, image_score=0.2)
+        for t in temperatures
+    ]
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+
+def test_rescore_updates_verdicts_scores_and_stats(db, models, checkpoint):
+    rows = add_rows(db, [15, 35, 38, 12, 30])
+    summary = rescore.rescore(chunk_size=2, checkpoint_path=checkpoint)
+    assert summary["scanned"] == summary["rescored"] == 5
+    assert summary["changed"] == 3 and summary["skipped"] == 0
+
+    db.expire_all()
+    stored = {row.id: row for row in db.query(Prediction)}
+    assert [stored[row.id].clinical_model_result for row in rows] == [False, True, True, False, True]
+    assert all(row.clinical_model_version == summary["model_version"] for row in stored.values())
+    # Combined with the stored image score, never a fresh CNN run
+    assert stored[rows[1].id].combined_score == pytest.approx((stored[rows[1].id].clinical_score + 0.2) / 2)
+    assert db.query(DiseaseStats).one().disease_count == 3
+    with open(checkpoint) as f:
+        assert json.load(f)["last_id"] == rows[-1].id
+
+
+def test_dry_run_writes_nothing(db, models, checkpoint):
+    add_rows(db, [35, 38])
+    assert rescore.rescore(checkpoint_path=checkpoint, dry_run=True)["changed"] == 2
+    db.expire_all()
+    assert all(row.clinical_model_version is None for row in db.query(Prediction))
+    assert db.query(DiseaseStats).count() == 0
+
+
+def test_interrupted_run_resumes_from_the_checkpoint(db, models, checkpoint, monkeypatch):
+    rows = add_rows(db, [15, 35, 38, 12, 30])
+    original = rescore.fetch_chunk
+    calls = []
+
+    def failing_fetch(db, after_id, *args):
+        calls.append(after_id)
+        # The first run dies fetching its second chunk
+        if calls == [0, rows[1].id]:
+            raise RuntimeError("connection lost")
+        return original(db, after_id, *args)
+
+    monkeypatch.setattr(rescore, "fetch_chunk", failing_fetch)
+    with pytest.raises(RuntimeError):
+        rescore.rescore(chunk_size=2, checkpoint_path=checkpoint)
+    with open(checkpoint) as f:
+        assert json.load(f)["last_id"] == rows[1].id
+
+    summary = rescore.rescore(chunk_size=2, checkpoint_path=checkpoint)
+    assert calls[2] == rows[1].id
+    assert summary["scanned"] == 3
+    db.expire_all()
+    assert all(row.clinical_model_version is not None for row in db.query(Prediction))
+    assert db.query(DiseaseStats).one().disease_count == 3
+
+
+def test_rows_at_the_current_version_are_skipped_unless_forced(db, models, checkpoint):
+    add_rows(db, [15, 35])
+    rescore.rescore(checkpoint_path=checkpoint)
+    assert rescore.rescore(checkpoint_path=str(models / "other.json"))["scanned"] == 0
+    assert rescore.rescore(checkpoint_path=checkpoint, force=True)["scanned"] == 2
+
+
+def test_checkpoint_of_another_model_version_is_ignored(checkpoint):
+    rescore.save_checkpoint(checkpoint, "old", 42, {})
+    assert rescore.load_checkpoint(checkpoint, "old") == 42
+    assert rescore.load_checkpoint(checkpoint, "new") == 0
+
+
+def test_missing_features_are_filled_from_the_weather(db, models, checkpoint, monkeypatch):
+    climate = CellClimate({name: value for name, value in features(36).items() if name in CLIMATE_FEATURES}, 36)
+    looked_up = []
+
+    def get_cell_climates(coords):
+        looked_up.append(coords)
+        return [climate] * len(coords)
+
+    monkeypatch.setattr(rescore, "get_cell_climates", get_cell_climates)
+    incomplete = Prediction(user_id=1, city="Pune", latitude=18.5, longitude=73.8,
+                            clinical_features=features(None, cloud_cover=None, latitude=None, longitude=None))
+    unlocated = Prediction(user_id=1, city="Pune", clinical_features={"mean_temp": None})
+    db.add_all([incomplete, unlocated])
+    db.commit()
+
+    summary = rescore.rescore(checkpoint_path=checkpoint)
+    assert summary["rescored"] == summary["filled"] == 1
+    assert summary["skipped"] == 1
+    assert looked_up == [[(18.5, 73.8)]]
+    db.expire_all()
+    stored = db.get(Prediction, incomplete.id)
+    assert stored.clinical_model_result is True
+    assert stored.clinical_features["mean_temp"] == 36 and stored.clinical_features["cloud_cover"] == 40
+    assert db.get(Prediction, unlocated.id).clinical_model_version is None
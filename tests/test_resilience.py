@@ -0,0 +1,159 @@
+import time
+import pytest
+from app import resilience
+from app.resilience import CircuitBreaker, CircuitOpenError, NonRetryableError, call_with_resilience
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+
+
+class Flaky:
+    """Fails the first ``failures`` calls with ``error``, then returns "ok"."""
+
+    def __init__(self, failures: int, error: Exception = ConnectionError("down")):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+def test_retries_until_success():
+    fn = Flaky(2)
+    breaker = CircuitBreaker("test", failure_threshold=5)
+    assert call_with_resilience("test", "op", fn, retries=2, breaker=breaker) == "ok"
+    assert fn.calls == 3
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_last_error_is_raised_once_retries_run_out():
+    fn = Flaky(5)
+    with pytest.raises(ConnectionError):
+        call_with_resilience("test", "op", fn, retries=1, breaker=CircuitBreaker("test"))
+    assert fn.calls == 2
+
+
+def test_breaker_opens_after_the_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    fn = Flaky(10)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            call_with_resilience("test", "op", fn, breaker=breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        call_with_resilience("test", "op", fn, breaker=breaker)
+    assert fn.calls == 3
+
+
+def test_half_open_trial_closes_or_reopens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow()
+    # Only one trial call is let through while half-open
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_non_retryable_errors_are_not_retried_and_keep_the_circuit_closed():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    fn = Flaky(10, NonRetryableError("bad key"))
+    for _ in range(3):
+        with pytest.raises(NonRetryableError):
+            call_with_resilience("test", "op", fn, retries=3, breaker=breaker)
+    assert fn.calls == 3
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_no_retry_is_started_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 1.0)
+    fn = Flaky(5)
+    with pytest.raises(ConnectionError):
+        call_with_resilience("test", "op", fn, retries=3, breaker=CircuitBreaker("test"),
+                             deadline=time.monotonic() + 0.5)
+    assert fn.calls == 1
+
+
+def test_gemini_client_errors_are_not_retried(monkeypatch):
+    pytest.importorskip("google.generativeai")
+    google_exceptions = pytest.importorskip("google.api_core.exceptions")
+    from app import llm
+
+    class Model:
+        def __init__(self, error):
+            self.error = error
+            self.calls = 0
+
+        def generate_content(self, prompt, request_options):
+            self.calls += 1
+            raise self.error
+
+    monkeypatch.setattr(resilience, "get_breaker", lambda name: CircuitBreaker(name))
+    monkeypatch.setattr(llm, "GEMINI_MAX_RETRIES", 2)
+    client = llm.LLM.__new__(llm.LLM)
+    client.model = Model(google_exceptions.PermissionDenied("API key not valid"))
+    with pytest.raises(Exception, match="API key not valid"):
+        client.inference(image=None, result="result")
+    assert client.model.calls == 1
+
+    # Rate limits are still retried
+    client.model = Model(google_exceptions.TooManyRequests("slow down"))
+    with pytest.raises(Exception, match="slow down"):
+        client.inference(image=None, result="result")
+    assert client.model.calls == 3
+
+
+def test_report_falls_back_to_the_template(monkeypatch):
+    pytest.importorskip("tensorflow")
+    from app import prediction
+    from prometheus_client import REGISTRY
+
+    class FailingLLM:
+        def __init__(self):
+            self.deadlines = []
+
+        def inference(self, deadline, **kwargs):
+            self.deadlines.append(deadline)
+            raise CircuitOpenError("gemini circuit is open")
+
+    failing = FailingLLM()
+    monkeypatch.setattr(prediction, "get_llm", lambda: failing)
+    before = REGISTRY.get_sample_value("lsd_report_fallbacks_total")
+    report = prediction._llm_report(
+        None, {"cloud_cover": 40.0}, True, None, 18.5, 73.8, "English", 31.0, "Pune"
+    )
+    assert "Pune" in report
+    assert REGISTRY.get_sample_value("lsd_report_fallbacks_total") == before + 1
+    assert failing.deadlines[0] <= time.monotonic() + prediction.LLM_REPORT_DEADLINE_SECONDS
+
+
+def test_reports_over_the_concurrency_cap_fall_back_without_calling_gemini(monkeypatch):
+    pytest.importorskip("tensorflow")
+    import threading
+    from app import prediction
+
+    def unexpected():
+        raise AssertionError("Gemini should not be called")
+
+    monkeypatch.setattr(prediction, "_report_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(prediction, "get_llm", unexpected)
+    prediction._report_slots.acquire()
+    report = prediction._llm_report(None, {}, False, False, None, None, "English", None, None)
+    assert report
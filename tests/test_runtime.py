@@ -0,0 +1,64 @@
+import sys
+from types import SimpleNamespace
+import pytest
+from app import runtime
+from app.runtime import parse_cpu_list
+
+
+@pytest.fixture
+def pinned(monkeypatch, tmp_path):
+    """Record affinity changes instead of applying them, with eight CPUs available."""
+    calls = []
+    monkeypatch.setattr(runtime.os, "sched_setaffinity", lambda pid, cpus: calls.append(list(cpus)), raising=False)
+    monkeypatch.setattr(runtime, "available_cpus", lambda: list(range(8)))
+    monkeypatch.setattr(runtime, "_SLOT_LOCK_PATTERN", str(tmp_path / "slot-{}.lock"))
+    monkeypatch.setattr(runtime, "_slot_lock_file", None)
+    return calls
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list("0-3,8") == [0, 1, 2, 3, 8]
+    assert parse_cpu_list(" 5, 2-3 ,,2") == [2, 3, 5]
+    assert parse_cpu_list("") == []
+
+
+def test_explicit_affinity_is_applied(pinned):
+    assert runtime._pin_cpus("1,4-5", workers=2) == [1, 4, 5]
+    assert pinned == [[1, 4, 5]]
+    assert runtime._pin_cpus("", workers=2) is None
+
+
+def test_auto_affinity_gives_each_worker_its_own_block(pinned):
+    assert runtime._pin_cpus("auto", workers=4) == [0, 1]
+    # Slot 0 stays locked by the file this process holds, so the next claim gets slot 1
+    held = runtime._slot_lock_file
+    assert runtime._claim_worker_slot(4) == 1
+    held.close()
+    runtime._slot_lock_file.close()
+
+
+def test_configure_runtime_sizes_every_pool_from_the_share(pinned, monkeypatch):
+    threads = {}
+    fake_tf = SimpleNamespace(config=SimpleNamespace(threading=SimpleNamespace(
+        set_intra_op_parallelism_threads=lambda n: threads.update(intra=n),
+        set_inter_op_parallelism_threads=lambda n: threads.update(inter=n),
+    )))
+    monkeypatch.setitem(sys.modules, "tensorflow", fake_tf)
+    monkeypatch.setitem(sys.modules, "threadpoolctl", SimpleNamespace(
+        threadpool_limits=lambda limits: threads.update(blas=limits)
+    ))
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        monkeypatch.setenv(name, "")
+    monkeypatch.setattr(runtime, "_settings", {})
+    monkeypatch.setattr(runtime, "WEB_CONCURRENCY", 4)
+    monkeypatch.setattr(runtime, "CPU_AFFINITY", "")
+    monkeypatch.setattr(runtime, "INFERENCE_THREADS", 0)
+    monkeypatch.setattr(runtime, "BLAS_THREADS", 0)
+    monkeypatch.setattr(runtime, "TF_INTER_OP_THREADS", 1)
+
+    settings = runtime.configure_runtime()
+    assert settings["intra_op_threads"] == settings["blas_threads"] == 2
+    assert threads == {"intra": 2, "inter": 1, "blas": 2}
+    assert runtime.os.environ["OMP_NUM_THREADS"] == "2"
+    assert pinned == []
+    assert runtime.runtime_report()["requested"]["workers"] == 4
@@ -0,0 +1,67 @@
+import math
+import numpy as np
+import pytest
+from app.scoring import EnsembleScorer, PlattScaler, clinical_verdict, image_verdict, logit, parse_pair, sigmoid
+
+IDENTITY = PlattScaler(1.0, 0.0)
+
+
+def scorer(method: str = "weighted", weights=(0.5, 0.5), bias: float = 0.0,
+           clinical_platt: PlattScaler = IDENTITY, image_platt: PlattScaler = IDENTITY) -> EnsembleScorer:
+    return EnsembleScorer(method, weights, bias, clinical_platt, image_platt)
+
+
+def test_default_weighted_combine_is_the_mean():
+    assert scorer().combine(0.2, 0.8) == pytest.approx(0.5)
+    assert scorer(weights=(3, 1)).combine(0.2, 0.8) == pytest.approx(0.35)
+
+
+def test_identity_platt_leaves_probabilities_unchanged():
+    probabilities = np.array([0.01, 0.3, 0.5, 0.9])
+    np.testing.assert_allclose(IDENTITY(probabilities), probabilities)
+
+
+def test_platt_scaling():
+    assert PlattScaler(1.0, math.log(3))(0.5) == pytest.approx(0.75)
+    # Doubling the slope sharpens the probability around 0.5
+    assert PlattScaler(2.0, 0.0)(0.75) == pytest.approx(0.9)
+    # Probabilities of exactly 0 and 1 stay finite
+    assert np.all(np.isfinite(PlattScaler(1.0, 0.0)(np.array([0.0, 1.0]))))
+
+
+def test_calibration_is_applied_before_fusing():
+    calibrated = scorer(clinical_platt=PlattScaler(1.0, math.log(3)))
+    assert calibrated.combine(0.5, 0.25) == pytest.approx(0.5)
+
+
+def test_logistic_combine():
+    stacked = scorer("logistic", weights=(1.0, 1.0), bias=0.0)
+    assert stacked.combine(0.75, 0.75) == pytest.approx(0.9)
+    assert stacked.combine(0.2, 0.8) == pytest.approx(0.5)
+    assert scorer("logistic", weights=(1.0, 1.0), bias=math.log(3)).combine(0.5, 0.5) == pytest.approx(0.75)
+
+
+@pytest.mark.parametrize("method", ["weighted", "logistic"])
+def test_missing_score_drops_that_model(method):
+    fused = scorer(method, weights=(1.0, 1.0))
+    assert fused.combine(np.nan, 0.8) == pytest.approx(0.8)
+    assert fused.combine(0.3, np.nan) == pytest.approx(0.3)
+    assert np.isnan(fused.combine(np.nan, np.nan))
+
+
+def test_combine_scores_a_batch():
+    fused = scorer().combine(np.array([0.2, np.nan, 0.6]), np.array([0.8, 0.4, np.nan]))
+    np.testing.assert_allclose(fused, [0.5, 0.4, 0.6])
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        scorer("median")
+
+
+def test_helpers():
+    assert parse_pair("0.7, 0.3") == (0.7, 0.3)
+    assert sigmoid(logit(0.25)) == pytest.approx(0.25)
+    # Ties match the underlying models' predict()
+    assert not clinical_verdict(0.5) and clinical_verdict(0.51)
+    assert image_verdict(0.5) and not image_verdict(0.49)
@@ -0,0 +1,292 @@
+import datetime
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+import pytest
+from sqlalchemy.exc import IntegrityError
+from app import write_behind
+from app.models import DiseaseStats, IdBlock, Prediction, PredictionRequest
+from app.write_behind import (
+    ConflictingIdError, REJECTED_FILE, WriteBehindWriter, WriterSession, _write_entries, export_limit, replay_orphans
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_prediction(user_id: int, city: str = "Pune") -> Prediction:
+    return Prediction(user_id=user_id, city=city, report="report", report_html="<p>report</p>", pipeline_mode="full")
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the writer")
+        time.sleep(0.01)
+
+
+def stored(db):
+    db.expire_all()
+    return {row.id: row for row in db.query(Prediction)}
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Holds the writer thread before it writes a batch until set."""
+    event = threading.Event()
+    original = write_behind._store
+
+    def gated_store(directory, entries):
+        event.wait(10)
+        return original(directory, entries)
+
+    monkeypatch.setattr(write_behind, "_store", gated_store)
+    return event
+
+
+@pytest.fixture
+def writer(db, tmp_path):
+    writer = WriteBehindWriter(directory=str(tmp_path / "write_behind"), batch_size=50, flush_seconds=0.01)
+    writer.start()
+    yield writer
+    writer.stop(timeout=10)
+
+
+def test_submitted_predictions_are_written_with_their_records(db, writer):
+    first, second = make_prediction(1), make_prediction(2, city="Nashik")
+    assert writer.submit(first, "hash-1", "key-1", affected_city="Pune")
+    assert writer.submit(second, "hash-2")
+    writer.stop(timeout=10)
+
+    rows = stored(db)
+    assert set(rows) == {first.id, second.id}
+    assert rows[first.id].user_id == 1 and rows[second.id].user_id == 2
+    requests = {request.prediction_id: request for request in db.query(PredictionRequest)}
+    assert requests[first.id].idempotency_key == "key-1"
+    assert requests[second.id].content_hash == "hash-2"
+    assert [(stats.city, stats.disease_count) for stats in db.query(DiseaseStats)] == [("Pune", 1)]
+    # Every block is closed and nothing is left to replay
+    assert all(block.closed_at is not None for block in db.query(IdBlock))
+    assert export_limit(db) is None
+    assert os.listdir(writer.directory) == []
+
+
+def test_pending_predictions_are_visible_until_written(db, writer, gate):
+    prediction = make_prediction(1)
+    writer.submit(prediction, "hash-1", "key-1")
+
+    assert writer.pending_prediction(prediction.id) is prediction
+    assert writer.pending_for_user(1) == [prediction]
+    assert writer.find_pending(1, "key-1", "other-hash") == ("hash-1", prediction)
+    assert writer.find_pending(1, None, "hash-1") == ("hash-1", prediction)
+    # The analytics export must not read past a block that still has queued ids
+    assert export_limit(db) is not None and export_limit(db) <= prediction.id
+
+    gate.set()
+    wait_for(lambda: writer.pending_prediction(prediction.id) is None)
+    assert prediction.id in stored(db)
+
+
+def test_submit_during_stop_keeps_both_predictions(db, writer, gate):
+    queued = make_prediction(1)
+    writer.submit(queued, "hash-1")
+    stopper = threading.Thread(target=writer.stop, kwargs={"timeout": 10})
+    stopper.start()
+    wait_for(lambda: not writer.running)
+
+    # Written inline, but still under a reserved id rather than autoincrement
+    late = make_prediction(2)
+    assert writer.submit(late, "hash-2")
+    assert late.id != queued.id
+    assert stored(db)[late.id].user_id == 2
+
+    gate.set()
+    stopper.join(10)
+    rows = stored(db)
+    assert rows[queued.id].user_id == 1
+    assert rows[late.id].user_id == 2
+    assert db.query(PredictionRequest).count() == 2
+    assert all(block.closed_at is not None for block in db.query(IdBlock))
+
+
+def test_submit_after_stop_writes_inline_and_closes_its_block(db, writer):
+    writer.stop(timeout=10)
+    prediction = make_prediction(3)
+    assert writer.submit(prediction, "hash-3")
+    assert stored(db)[prediction.id].user_id == 3
+    assert all(block.closed_at is not None for block in db.query(IdBlock))
+
+
+def test_queue_full_writes_inline(db, tmp_path, gate):
+    writer = WriteBehindWriter(directory=str(tmp_path / "write_behind"), batch_size=50, flush_seconds=0.01, max_pending=1)
+    writer.start()
+    try:
+        queued, overflow = make_prediction(1), make_prediction(2)
+        writer.submit(queued, "hash-1")
+        wait_for(lambda: writer._queue)
+        assert writer.submit(overflow, "hash-2", affected_city="Pune")
+
+        rows = stored(db)
+        assert overflow.id in rows and queued.id not in rows
+        assert writer.pending_prediction(overflow.id) is None
+
+        # An inline write reports a reused Idempotency-Key to the caller
+        db.add(PredictionRequest(user_id=4, idempotency_key="taken", content_hash="x", prediction_id=overflow.id))
+        db.commit()
+        with pytest.raises(IntegrityError):
+            writer.submit(make_prediction(4), "hash-4", "taken")
+    finally:
+        gate.set()
+        writer.stop(timeout=10)
+    assert queued.id in stored(db)
+
+
+def test_idempotency_key_stored_by_another_worker_keeps_the_prediction(db, writer, gate):
+    # Another worker stored this user's key first
+    other = Prediction(id=10_000, user_id=1, report="other")
+    db.add(other)
+    db.add(PredictionRequest(user_id=1, idempotency_key="key-1", content_hash="hash-other", prediction_id=other.id))
+    db.commit()
+
+    prediction = make_prediction(1)
+    writer.submit(prediction, "hash-1", "key-1")
+    gate.set()
+    wait_for(lambda: writer.pending_prediction(prediction.id) is None)
+
+    # The acknowledged prediction is kept; the key stays with the earlier record
+    assert prediction.id in stored(db)
+    records = {request.prediction_id: request for request in db.query(PredictionRequest)}
+    assert records[other.id].idempotency_key == "key-1"
+    assert records[prediction.id].idempotency_key is None
+    assert records[prediction.id].content_hash == "hash-1"
+
+
+def test_rows_the_database_rejects_are_set_aside(db, writer, gate, monkeypatch):
+    original = write_behind._write_entries
+
+    def reject_user_13(session, entries):
+        if any(entry["prediction"]["user_id"] == 13 for entry in entries):
+            raise ConflictingIdError("rejected")
+        return original(session, entries)
+
+    monkeypatch.setattr(write_behind, "_write_entries", reject_user_13)
+    accepted, rejected = make_prediction(1), make_prediction(13)
+    writer.submit(accepted, "hash-1")
+    writer.submit(rejected, "hash-13")
+    gate.set()
+    wait_for(lambda: not writer._queue)
+
+    assert set(stored(db)) == {accepted.id}
+    with open(os.path.join(writer.directory, REJECTED_FILE)) as f:
+        assert str(rejected.id) in f.read()
+
+
+def test_existing_id_with_different_content_is_a_conflict(db):
+    db.add(Prediction(id=5, user_id=2, created_at=datetime.datetime(2026, 1, 1)))
+    db.commit()
+    entry = {
+        "prediction": {"id": 5, "user_id": 1, "created_at": datetime.datetime(2026, 1, 2)},
+        "request": None,
+        "stats_city": None,
+    }
+    session = WriterSession()
+    try:
+        with pytest.raises(ConflictingIdError):
+            _write_entries(session, [entry])
+        session.rollback()
+        # The same prediction written again is skipped
+        entry["prediction"].update(user_id=2, created_at=datetime.datetime(2026, 1, 1))
+        assert _write_entries(session, [entry]) == 0
+    finally:
+        session.close()
+
+
+def test_writer_survives_unexpected_errors(db, writer, monkeypatch):
+    original = write_behind._store
+    calls = []
+
+    def flaky_store(directory, entries):
+        calls.append(len(entries))
+        if len(calls) == 1:
+            raise OSError("disk hiccup")
+        return original(directory, entries)
+
+    monkeypatch.setattr(write_behind, "_store", flaky_store)
+    monkeypatch.setattr(write_behind, "RETRY_MIN_SECONDS", 0.01)
+    prediction = make_prediction(1)
+    writer.submit(prediction, "hash-1")
+    wait_for(lambda: writer.pending_prediction(prediction.id) is None)
+    assert writer.running
+    assert prediction.id in stored(db)
+
+
+CRASHING_WORKER = textwrap.dedent("""
+    import os
+    from app.models import Prediction
+    from app.write_behind import WriteBehindWriter
+
+    writer = WriteBehindWriter(directory=os.environ["WRITE_BEHIND_DIR"], batch_size=1000, flush_seconds=60)
+    writer.start()
+    for user_id in (1, 2, 3):
+        prediction = Prediction(user_id=user_id, city="Pune", report="report")
+        writer.submit(prediction, f"hash-{user_id}", f"key-{user_id}", affected_city="Pune")
+    journal = writer._journal
+    # Killed halfway through writing a fourth entry
+    with open(journal._path(journal._segment), "a") as f:
+        f.write('{"prediction": {"id": ')
+    os._exit(1)
+""")
+
+
+def test_replay_after_crash(db, tmp_path):
+    directory = str(tmp_path / "write_behind")
+    env = dict(os.environ, WRITE_BEHIND_DIR=directory, WRITE_BEHIND_SEGMENT_ENTRIES="2", PYTHONPATH=REPO_ROOT)
+    result = subprocess.run([sys.executable, "-c", CRASHING_WORKER], env=env, cwd=REPO_ROOT, timeout=120)
+    assert result.returncode == 1
+    assert stored(db) == {}
+    assert any(name.endswith(".journal") for name in os.listdir(directory))
+
+    # The next worker finds the dead worker's lock free and writes its journal
+    assert replay_orphans(directory) == 3
+    rows = stored(db)
+    assert sorted(row.user_id for row in rows.values()) == [1, 2, 3]
+    assert sorted(request.idempotency_key for request in db.query(PredictionRequest)) == ["key-1", "key-2", "key-3"]
+    assert db.query(DiseaseStats).one().disease_count == 3
+    assert all(block.closed_at is not None for block in db.query(IdBlock))
+    assert os.listdir(directory) == []
+
+    # Replaying again (e.g. after a crash mid-replay) writes nothing twice
+    assert replay_orphans(directory) == 0
+    assert db.query(DiseaseStats).one().disease_count == 3
+
+
+def test_journal_of_a_running_worker_is_not_replayed(db, writer, gate):
+    writer.submit(make_prediction(1), "hash-1")
+    assert replay_orphans(writer.directory) == 0
+    assert stored(db) == {}
+    gate.set()
+
+
+def test_dashboard_pages_include_pending_predictions(db, writer, gate, monkeypatch):
+    prediction = pytest.importorskip("app.prediction")
+    monkeypatch.setattr(prediction, "prediction_writer", writer)
+    older = [Prediction(user_id=1, created_at=datetime.datetime(2026, 1, day)) for day in (1, 2, 3)]
+    db.add_all(older)
+    db.commit()
+    pending = [make_prediction(1), make_prediction(1)]
+    for entry in pending:
+        writer.submit(entry, f"hash-{entry.id}")
+
+    first = prediction.get_user_prediction_summaries(db, 1, limit=2, include_pending=True)
+    second = prediction.get_user_prediction_summaries(db, 1, limit=2, offset=2, include_pending=True)
+    assert {p.id for p in first} == {p.id for p in pending}
+    assert [p.id for p in second] == [older[2].id, older[1].id]
+    assert prediction.count_user_predictions(db, 1, include_pending=True) == 5
+    assert prediction.count_user_predictions(db, 1) == 3
+
+    gate.set()
+    wait_for(lambda: not writer.pending_for_user(1))
+    assert prediction.count_user_predictions(db, 1, include_pending=True) == 5